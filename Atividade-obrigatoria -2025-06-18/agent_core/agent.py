@@ -1,20 +1,35 @@
 import os
+import time
+import asyncio
 import logging
-from typing import List, Callable
+from typing import List, Callable, NamedTuple, Optional
 from langchain.agents import AgentExecutor, initialize_agent, AgentType
 from langchain.tools import Tool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
-import pandas as pd
+
+from agent_core.aggregates import build_header_aggregates
+from agent_core.answer_cache import answer_cache, answer_key
+from agent_core.dataset import NFeDataset, load_dataset
+from agent_core.indexes import build_indexes
+from agent_core.llm_factory import get_llm
+from agent_core.money import build_money
+from agent_core.router import router
+from agent_core.sketches import approx_sketches
+from agent_core.storage import dataset_aggregates, open_store
+from agent_core.tool_output import shape_tools
+from agent_core.tracing import TracingCallbackHandler, tracer
 
 # Importar as novas ferramentas
-from agent_core.tools.consistency_validation import validate_nfe_consistency
+from agent_core.tools.consistency_validation import validate_dataset_consistency
+from agent_core.tools.anomaly_audit import audit_anomalies
+from agent_core.tools import approx_analysis, sql_analysis
+from agent_core.tools.query_analysis import QUERY_TOOL_DESCRIPTION, run_query
 from agent_core.tools.item_analysis import (
     list_top_expensive_items,
     list_product_ncm_pairs,
     top_products_by_total_quantity,
     total_value_by_ncm_code,
+    list_items_by_access_key,
     avg_item_quantity,
     find_zero_unit_value_items,
     avg_item_total_value,
@@ -48,6 +63,13 @@ logger = logging.getLogger(__name__)
 # Carrega variáveis de ambiente
 load_dotenv()
 
+# Perguntas reconhecidas pelo roteador são respondidas sem o LLM
+FAST_PATH_ENABLED = os.getenv("NFE_FAST_PATH", "1") != "0"
+# Etapas do agente (pensamento, ação e observação) impressas no stdout
+AGENT_VERBOSE = os.getenv("NFE_AGENT_VERBOSE", "1") != "0"
+# Linhas por relatório enviado ao agente; o restante é resumido em "registros omitidos"
+TOOL_MAX_ROWS = int(os.getenv("NFE_TOOL_MAX_ROWS", "200"))
+
 NFE_AGENT_PROMPT = """Responda *sempre* e *exclusivamente* em português brasileiro.\n\n
 Você é um agente especialista em Notas Fiscais Eletrônicas (NF-e) com amplo conhecimento técnico, fiscal e normativo.
  Seu objetivo é analisar e validar dados fiscais contidos em dois datasets fornecidos: o dataset \"Cabecalhos\", 
@@ -68,247 +90,438 @@ informe a limitação de forma transparente e prossiga com a análise possível.
  das [{tool_names}]\nAction Input: o input para a ação\nObservation: o resultado da ação\n... (este Thought/Action/Action Input/Observation pode se repetir N vezes)\n
  Thought: agora eu sei a resposta final\nFinal Answer: a resposta final para a pergunta original (em português brasileiro)"""
 
-def run_agent_with_middlewares(question: str, temp_dir: str, find_data_files: Callable[[str], List[str]]) -> str:
+def _items_summary(dataset: NFeDataset) -> dict:
+    sketches = dataset.derived('item_sketches', approx_sketches)
+    if sketches is not None:
+        return {'quantidade': dataset.rows('itens'), 'servicos': approx_analysis.distinct_products(sketches)}
+    store = dataset.derived('sql_store', open_store)
+    if store is not None:
+        return sql_analysis.items_summary(store)
+    itens_df = dataset.itens_df
+    return {'quantidade': len(itens_df), 'servicos': itens_df['DESCRIÇÃO DO PRODUTO/SERVIÇO'].nunique()}
+
+
+def build_tools(dataset: NFeDataset) -> List[Tool]:
     """
-    Executa o agente com middlewares aplicados.
+    Monta as ferramentas do agente sobre um dataset já carregado.
     """
-    logger.info(f"Iniciando processamento da pergunta: {question}")
-    
-    try:
-        # Configura o LLM
-        logger.info("Configurando LLM")
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY não encontrada no arquivo .env")
-        
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            google_api_key=api_key,
-            temperature=0.7,
-            convert_system_message_to_human=True,
-            model_kwargs={"generation_config": {"temperature": 0.7}}
+    # Com NFE_STORAGE, todas as ferramentas consultam o banco local do dataset: os DataFrames,
+    # agregados e índices em memória não são usados
+    sql_tools = sql_analysis.dataset_tool_functions(dataset, max_rows=TOOL_MAX_ROWS)
+    if sql_tools is None:
+        cabecalho_df, itens_df = dataset.frames()
+        aggregates = dataset.derived('header_aggregates', build_header_aggregates)
+        indexes = dataset.derived('indexes', build_indexes)
+        money = dataset.derived('money', build_money)
+        resumo = aggregates.summary()
+        resumo_itens = dataset.derived('items_summary', _items_summary)
+    else:
+        cabecalho_df = itens_df = aggregates = indexes = money = resumo = resumo_itens = None
+    # Com NFE_APPROX_MODE, as estatísticas de itens vêm dos sketches construídos no carregamento
+    sketches = dataset.derived('item_sketches', approx_sketches)
+
+    # Define as ferramentas para análise dos dados
+    tools = [
+        Tool(
+            name="analisar_cabecalhos",
+            func=lambda x: f"Análise do cabeçalho: Total de notas: {resumo['quantidade']}, Valor total: R$ {resumo['soma']:,.2f}",
+            description="Analisa os dados do cabeçalho das notas fiscais, fornecendo um resumo geral."
+        ),
+        Tool(
+            name="analisar_itens",
+            func=lambda x: f"Análise dos itens: Total de itens: {resumo_itens['quantidade']}, Serviços únicos: {resumo_itens['servicos']}",
+            description="Analisa os dados dos itens das notas fiscais, fornecendo um resumo geral."
+        ),
+        Tool(
+            name="validar_consistencia",
+            func=lambda x: validate_dataset_consistency(dataset, max_rows=TOOL_MAX_ROWS),
+            description="Valida a consistência entre os valores do cabeçalho e dos itens. Retorna um relatório detalhado de divergências (Chave de Acesso, Valor Total da Nota, Soma dos Itens, Diferença) ou confirma a consistência."
+        ),
+        Tool(
+            name="listar_top_produtos_caros",
+            func=lambda x: list_top_expensive_items(itens_df, 10),
+            description="Lista os 10 produtos/serviços mais caros encontrados nos dados dos itens, com base no valor unitário. Ideal para perguntas sobre os itens de maior valor."
+        ),
+        Tool(
+            name="listar_descricoes_ncm",
+            func=lambda x: list_product_ncm_pairs(itens_df, max_rows=TOOL_MAX_ROWS),
+            description="Lista todas as descrições únicas de produtos/serviços e seus respectivos códigos NCM/SH encontrados nos dados dos itens. Útil para entender a variedade de produtos e suas classificações fiscais."
+        ),
+        Tool(
+            name="analisar_top_emitentes_por_valor",
+            func=lambda x: analyze_top_emitters_by_value(cabecalho_df, aggregates=aggregates),
+            description="Analisa e lista as 5 Razões Sociais Emitentes com o maior valor total de notas fiscais emitidas."
+        ),
+        Tool(
+            name="contar_notas_por_uf_emitente",
+            func=lambda x: count_notes_by_uf_emitter(cabecalho_df, aggregates=aggregates),
+            description="Conta o número de notas fiscais registradas por cada UF Emitente."
+        ),
+        Tool(
+            name="valor_medio_por_municipio_emitente",
+            func=lambda x: avg_note_value_by_municipio_emitter(cabecalho_df, max_rows=TOOL_MAX_ROWS, aggregates=aggregates),
+            description="Calcula e lista o valor médio das notas fiscais por cada Município Emitente."
+        ),
+        Tool(
+            name="listar_notas_por_cnpj_emitente",
+            func=lambda cnpj: list_notes_by_cnpj_emitter(cabecalho_df, cnpj, max_rows=TOOL_MAX_ROWS, index=indexes.cnpj_emitente),
+            description="Lista as notas fiscais emitidas por um CPF/CNPJ Emitente específico. O input deve ser o CNPJ como string."
+        ),
+        Tool(
+            name="analisar_top_destinatarios_por_valor",
+            func=lambda x: analyze_top_recipients_by_value(cabecalho_df, aggregates=aggregates),
+            description="Analisa e lista os 5 Nomes de Destinatários que receberam o maior valor total de notas fiscais."
+        ),
+        Tool(
+            name="contar_notas_por_uf_destinatario",
+            func=lambda x: count_notes_by_uf_recipient(cabecalho_df, aggregates=aggregates),
+            description="Conta o número de notas fiscais recebidas por cada UF Destinatário."
+        ),
+        Tool(
+            name="contar_notas_por_municipio_destinatario",
+            func=lambda x: count_notes_by_municipio_recipient(cabecalho_df, max_rows=TOOL_MAX_ROWS, aggregates=aggregates),
+            description="Conta o número de notas fiscais recebidas por cada Município Destinatário."
+        ),
+        Tool(
+            name="valor_total_por_mes",
+            func=lambda x: total_value_by_month(cabecalho_df, aggregates=aggregates),
+            description="Calcula o valor total das notas fiscais por mês de emissão."
+        ),
+        Tool(
+            name="contar_notas_por_data_especifica",
+            func=lambda date_str: count_notes_by_specific_date(cabecalho_df, date_str, aggregates=aggregates),
+            description="Conta o número de notas fiscais emitidas em uma data específica. O input deve ser a data no formato 'YYYY-MM-DD'."
+        ),
+        Tool(
+            name="dia_semana_maior_emissao",
+            func=lambda x: day_of_week_highest_emission(cabecalho_df, aggregates=aggregates),
+            description="Identifica o dia da semana com o maior número de emissões de notas fiscais."
+        ),
+        Tool(
+            name="contar_notas_por_natureza_operacao",
+            func=lambda x: count_notes_by_natureza_operacao(cabecalho_df, aggregates=aggregates),
+            description="Conta o número de notas fiscais para cada tipo de Natureza da Operação."
+        ),
+        Tool(
+            name="valor_total_por_natureza_operacao",
+            func=lambda natureza: total_value_by_natureza_operacao(cabecalho_df, natureza, aggregates=aggregates),
+            description="Calcula o valor total das notas fiscais para uma Natureza da Operação específica. O input deve ser parte do nome da natureza da operação como string."
+        ),
+        Tool(
+            name="encontrar_notas_valor_negativo",
+            func=lambda x: find_negative_value_notes(cabecalho_df, max_rows=TOOL_MAX_ROWS),
+            description="Identifica e lista notas fiscais no cabeçalho com VALOR NOTA FISCAL negativo."
+        ),
+        Tool(
+            name="encontrar_numeros_nota_duplicados",
+            func=lambda x: find_duplicate_note_numbers(cabecalho_df, max_rows=TOOL_MAX_ROWS, index=indexes.numero),
+            description="Identifica e lista notas fiscais com NÚMERO duplicado."
+        ),
+        Tool(
+            name="top_produtos_por_quantidade_total",
+            func=lambda x: top_products_by_total_quantity(itens_df),
+            description="Identifica e lista os 10 produtos/serviços com a maior QUANTIDADE total acumulada."
+        ),
+        Tool(
+            name="valor_total_por_codigo_ncm",
+            func=lambda ncm: total_value_by_ncm_code(itens_df, ncm, index=indexes.ncm),
+            description="Calcula o valor total de todos os itens para um CÓDIGO NCM/SH específico. O input deve ser o código NCM como string."
+        ),
+        Tool(
+            name="listar_itens_por_chave_acesso",
+            func=lambda chave: list_items_by_access_key(itens_df, chave, max_rows=TOOL_MAX_ROWS, index=indexes.chave_itens),
+            description="Lista os itens de uma nota fiscal a partir da sua Chave de Acesso, com a soma dos valores. O input deve ser a Chave de Acesso (44 dígitos) como string."
+        ),
+        Tool(
+            name="quantidade_media_por_item",
+            func=lambda x: avg_item_quantity(itens_df),
+            description="Calcula a QUANTIDADE média por item em todas as notas."
+        ),
+        Tool(
+            name="encontrar_itens_valor_unitario_zerado",
+            func=lambda x: find_zero_unit_value_items(itens_df, max_rows=TOOL_MAX_ROWS),
+            description="Identifica e lista itens com VALOR UNITÁRIO zerado."
+        ),
+        Tool(
+            name="valor_total_medio_de_item",
+            func=lambda x: avg_item_total_value(itens_df),
+            description="Calcula o VALOR TOTAL médio de um item."
+        ),
+        Tool(
+            name="encontrar_itens_quantidade_negativa",
+            func=lambda x: find_negative_quantity_items(itens_df, max_rows=TOOL_MAX_ROWS),
+            description="Identifica e lista itens com QUANTIDADE negativa."
+        ),
+        Tool(
+            name="encontrar_inconsistencias_valor_item",
+            func=lambda x: find_inconsistent_item_values(itens_df, max_rows=TOOL_MAX_ROWS, money=money),
+            description="Identifica e lista itens onde o VALOR TOTAL não é igual a (QUANTIDADE * VALOR UNITÁRIO)."
+        ),
+        Tool(
+            name="identificar_anomalias",
+            func=lambda x: audit_anomalies(cabecalho_df, itens_df, max_rows=20, indexes=indexes, money=money),
+            description="Executa de uma vez todas as verificações de anomalias fiscais (divergência entre nota e itens, notas sem itens, notas zeradas ou negativas, números duplicados, itens com valor unitário zerado, quantidade negativa ou valor total inconsistente) e retorna um relatório combinado com a contagem de cada anomalia."
+        ),
+        Tool(
+            name="consultar_dados",
+            func=lambda spec: run_query(dataset, spec),
+            description=QUERY_TOOL_DESCRIPTION
+        ),
+        Tool(
+            name="listar_colunas_cabecalho",
+            func=lambda x: f"Colunas disponíveis no dataset Cabecalhos: {', '.join(cabecalho_df.columns)}",
+            description="Lista todas as colunas disponíveis no dataset Cabecalhos. Útil para entender quais informações podem ser consultadas."
+        ),
+        Tool(
+            name="listar_colunas_itens",
+            func=lambda x: f"Colunas disponíveis no dataset Itens: {', '.join(itens_df.columns)}",
+            description="Lista todas as colunas disponíveis no dataset Itens. Útil para entender quais informações podem ser consultadas."
+        ),
+        Tool(
+            name="resumir_cabecalho",
+            func=lambda x: cabecalho_df.describe(include='all').to_string(),
+            description="Fornece um resumo estatístico dos dados do dataset Cabecalhos."
+        ),
+        Tool(
+            name="resumir_itens",
+            func=lambda x: itens_df.describe(include='all').to_string(),
+            description="Fornece um resumo estatístico dos dados do dataset Itens."
         )
-        
-        # Carrega os arquivos
-        logger.info("Carregando arquivos")
-        files = find_data_files(temp_dir)
-        if not files:
-            return "Nenhum arquivo encontrado para análise."
-        
-        cabecalho_df = None
-        itens_df = None
-        
-        for file in files:
-            try:
-                file_path = os.path.join(temp_dir, file)
-                logger.info(f"Processando arquivo: {file_path}")
-                
-                if "Cabecalho" in file:
-                    cabecalho_df = pd.read_csv(file_path, encoding='utf-8', encoding_errors='replace')
-                    logger.info(f"Cabeçalho carregado. Colunas: {cabecalho_df.columns.tolist()}")
-                elif "Itens" in file:
-                    itens_df = pd.read_csv(file_path,  encoding='utf-8', encoding_errors='replace')
-                    logger.info(f"Itens carregados. Colunas: {itens_df.columns.tolist()}")
-                    
-            except Exception as e:
-                logger.error(f"Erro ao carregar {file}: {str(e)}")
-        
-        if cabecalho_df is None or itens_df is None:
-            return "Não foi possível carregar todos os arquivos necessários."
-        
-        # Define as ferramentas para análise dos dados
-        tools = [
-            Tool(
-                name="analisar_cabecalhos",
-                func=lambda x: f"Análise do cabeçalho: Total de notas: {len(cabecalho_df)}, Valor total: R$ {cabecalho_df['VALOR NOTA FISCAL'].sum():,.2f}",
-                description="Analisa os dados do cabeçalho das notas fiscais, fornecendo um resumo geral."
-            ),
-            Tool(
-                name="analisar_itens",
-                func=lambda x: f"Análise dos itens: Total de itens: {len(itens_df)}, Serviços únicos: {itens_df['DESCRIÇÃO DO PRODUTO/SERVIÇO'].nunique()}",
-                description="Analisa os dados dos itens das notas fiscais, fornecendo um resumo geral."
-            ),
-            Tool(
-                name="validar_consistencia",
-                func=lambda x: validate_nfe_consistency(cabecalho_df, itens_df),
-                description="Valida a consistência entre os valores do cabeçalho e dos itens. Retorna um relatório detalhado de divergências (Chave de Acesso, Valor Total da Nota, Soma dos Itens, Diferença) ou confirma a consistência."
-            ),
-            Tool(
-                name="listar_top_produtos_caros",
-                func=lambda x: list_top_expensive_items(itens_df, 10),
-                description="Lista os 10 produtos/serviços mais caros encontrados nos dados dos itens, com base no valor unitário. Ideal para perguntas sobre os itens de maior valor."
-            ),
-            Tool(
-                name="listar_descricoes_ncm",
-                func=lambda x: list_product_ncm_pairs(itens_df),
-                description="Lista todas as descrições únicas de produtos/serviços e seus respectivos códigos NCM/SH encontrados nos dados dos itens. Útil para entender a variedade de produtos e suas classificações fiscais."
-            ),
-            Tool(
-                name="analisar_top_emitentes_por_valor",
-                func=lambda x: analyze_top_emitters_by_value(cabecalho_df),
-                description="Analisa e lista as 5 Razões Sociais Emitentes com o maior valor total de notas fiscais emitidas."
-            ),
-            Tool(
-                name="contar_notas_por_uf_emitente",
-                func=lambda x: count_notes_by_uf_emitter(cabecalho_df),
-                description="Conta o número de notas fiscais registradas por cada UF Emitente."
-            ),
-            Tool(
-                name="valor_medio_por_municipio_emitente",
-                func=lambda x: avg_note_value_by_municipio_emitter(cabecalho_df),
-                description="Calcula e lista o valor médio das notas fiscais por cada Município Emitente."
-            ),
-            Tool(
-                name="listar_notas_por_cnpj_emitente",
-                func=lambda cnpj: list_notes_by_cnpj_emitter(cabecalho_df, cnpj),
-                description="Lista as notas fiscais emitidas por um CPF/CNPJ Emitente específico. O input deve ser o CNPJ como string."
-            ),
-            Tool(
-                name="analisar_top_destinatarios_por_valor",
-                func=lambda x: analyze_top_recipients_by_value(cabecalho_df),
-                description="Analisa e lista os 5 Nomes de Destinatários que receberam o maior valor total de notas fiscais."
-            ),
-            Tool(
-                name="contar_notas_por_uf_destinatario",
-                func=lambda x: count_notes_by_uf_recipient(cabecalho_df),
-                description="Conta o número de notas fiscais recebidas por cada UF Destinatário."
-            ),
-            Tool(
-                name="contar_notas_por_municipio_destinatario",
-                func=lambda x: count_notes_by_municipio_recipient(cabecalho_df),
-                description="Conta o número de notas fiscais recebidas por cada Município Destinatário."
-            ),
-            Tool(
-                name="valor_total_por_mes",
-                func=lambda x: total_value_by_month(cabecalho_df),
-                description="Calcula o valor total das notas fiscais por mês de emissão."
-            ),
-            Tool(
-                name="contar_notas_por_data_especifica",
-                func=lambda date_str: count_notes_by_specific_date(cabecalho_df, date_str),
-                description="Conta o número de notas fiscais emitidas em uma data específica. O input deve ser a data no formato 'YYYY-MM-DD'."
-            ),
-            Tool(
-                name="dia_semana_maior_emissao",
-                func=lambda x: day_of_week_highest_emission(cabecalho_df),
-                description="Identifica o dia da semana com o maior número de emissões de notas fiscais."
-            ),
-            Tool(
-                name="contar_notas_por_natureza_operacao",
-                func=lambda x: count_notes_by_natureza_operacao(cabecalho_df),
-                description="Conta o número de notas fiscais para cada tipo de Natureza da Operação."
-            ),
-            Tool(
-                name="valor_total_por_natureza_operacao",
-                func=lambda natureza: total_value_by_natureza_operacao(cabecalho_df, natureza),
-                description="Calcula o valor total das notas fiscais para uma Natureza da Operação específica. O input deve ser parte do nome da natureza da operação como string."
-            ),
-            Tool(
-                name="encontrar_notas_valor_negativo",
-                func=lambda x: find_negative_value_notes(cabecalho_df),
-                description="Identifica e lista notas fiscais no cabeçalho com VALOR NOTA FISCAL negativo."
-            ),
-            Tool(
-                name="encontrar_numeros_nota_duplicados",
-                func=lambda x: find_duplicate_note_numbers(cabecalho_df),
-                description="Identifica e lista notas fiscais com NÚMERO duplicado."
-            ),
-            Tool(
-                name="top_produtos_por_quantidade_total",
-                func=lambda x: top_products_by_total_quantity(itens_df),
-                description="Identifica e lista os 10 produtos/serviços com a maior QUANTIDADE total acumulada."
-            ),
-            Tool(
-                name="valor_total_por_codigo_ncm",
-                func=lambda ncm: total_value_by_ncm_code(itens_df, ncm),
-                description="Calcula o valor total de todos os itens para um CÓDIGO NCM/SH específico. O input deve ser o código NCM como string."
-            ),
-            Tool(
-                name="quantidade_media_por_item",
-                func=lambda x: avg_item_quantity(itens_df),
-                description="Calcula a QUANTIDADE média por item em todas as notas."
-            ),
-            Tool(
-                name="encontrar_itens_valor_unitario_zerado",
-                func=lambda x: find_zero_unit_value_items(itens_df),
-                description="Identifica e lista itens com VALOR UNITÁRIO zerado."
-            ),
-            Tool(
-                name="valor_total_medio_de_item",
-                func=lambda x: avg_item_total_value(itens_df),
-                description="Calcula o VALOR TOTAL médio de um item."
-            ),
-            Tool(
-                name="encontrar_itens_quantidade_negativa",
-                func=lambda x: find_negative_quantity_items(itens_df),
-                description="Identifica e lista itens com QUANTIDADE negativa."
-            ),
-            Tool(
-                name="encontrar_inconsistencias_valor_item",
-                func=lambda x: find_inconsistent_item_values(itens_df),
-                description="Identifica e lista itens onde o VALOR TOTAL não é igual a (QUANTIDADE * VALOR UNITÁRIO)."
-            ),
-            Tool(
-                name="identificar_anomalias",
-                func=lambda x: "Identificação de anomalias fiscais", 
-                description="Identifica anomalias fiscais nos dados (placeholder, pode ser expandida para usar as novas ferramentas de anomalia)."
-            ),
-            Tool(
-                name="listar_colunas_cabecalho",
-                func=lambda x: f"Colunas disponíveis no dataset Cabecalhos: {', '.join(cabecalho_df.columns)}",
-                description="Lista todas as colunas disponíveis no dataset Cabecalhos. Útil para entender quais informações podem ser consultadas."
-            ),
-            Tool(
-                name="listar_colunas_itens",
-                func=lambda x: f"Colunas disponíveis no dataset Itens: {', '.join(itens_df.columns)}",
-                description="Lista todas as colunas disponíveis no dataset Itens. Útil para entender quais informações podem ser consultadas."
-            ),
-            Tool(
-                name="resumir_cabecalho",
-                func=lambda x: cabecalho_df.describe(include='all').to_string(),
-                description="Fornece um resumo estatístico dos dados do dataset Cabecalhos."
-            ),
-            Tool(
-                name="resumir_itens",
-                func=lambda x: itens_df.describe(include='all').to_string(),
-                description="Fornece um resumo estatístico dos dados do dataset Itens."
-            )
-        ]
-        
-        # Cria e executa o agente
+    ]
+    overrides = dict(sql_tools or {})
+    if sketches is not None:
+        overrides.update(approx_analysis.tool_functions(sketches))
+    if overrides:
+        tools = [Tool(name=tool.name, func=overrides.get(tool.name, tool.func), description=tool.description)
+                 for tool in tools]
+    return tools
+
+
+def get_agent(dataset: NFeDataset) -> AgentExecutor:
+    """
+    Retorna o agente do dataset, criado uma única vez por dataset e LLM.
+
+    O agente fica memorizado no próprio dataset, então é descartado junto com ele
+    quando o dataset sai do cache; o LLM é o cliente compartilhado de `get_llm`.
+    """
+    llm = get_llm()
+
+    def build(ds: NFeDataset) -> AgentExecutor:
         logger.info("Criando agente NFe")
-        agent = initialize_agent(
-            tools,
+        # Saídas longas das ferramentas são paginadas para caber no orçamento de tokens
+        return initialize_agent(
+            shape_tools(build_tools(ds)),
             llm,
             agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            verbose=True,
+            verbose=AGENT_VERBOSE,
             handle_parsing_errors=True
         )
-        
-        # Prepara o contexto
-        context = f"""
+
+    return dataset.derived(f"agent|{id(llm)}", build)
+
+
+class AgentAnswer(NamedTuple):
+    """
+    Resposta de uma pergunta e sua origem: 'answer_cache', 'router', 'agent' ou 'error'.
+    Em falhas, `response` é a mensagem mostrada ao usuário e `error` a causa.
+    """
+    response: str
+    source: str
+    error: Optional[str] = None
+
+
+def run_agent_with_middlewares(question: str, temp_dir: Optional[str] = None,
+                               find_data_files: Optional[Callable[[str], List[str]]] = None,
+                               dataset_key: Optional[str] = None, dataset: Optional[NFeDataset] = None) -> str:
+    """
+    Executa o agente com middlewares aplicados.
+    `dataset_key` identifica o conteúdo do upload; sem ele o cache usa caminho, tamanho e mtime dos arquivos.
+    Com `dataset` já carregado (ex.: por `load_dataset_from_zip`), `temp_dir` não é usado.
+    Cada execução gera um span 'agent.run' com as etapas (carga, cache, roteador, LLM e ferramentas).
+    """
+    return run_agent_detailed(question, temp_dir, find_data_files, dataset_key, dataset).response
+
+
+def run_agent_detailed(question: str, temp_dir: Optional[str] = None,
+                       find_data_files: Optional[Callable[[str], List[str]]] = None,
+                       dataset_key: Optional[str] = None, dataset: Optional[NFeDataset] = None) -> AgentAnswer:
+    """
+    Mesmo que `run_agent_with_middlewares`, mas retorna também a origem da resposta e o erro,
+    para quem automatiza as perguntas (CLI, benchmark) distinguir uma falha de uma resposta.
+    """
+    with tracer.span('agent.run', question=question) as span:
+        answer = _run_agent(question, temp_dir, find_data_files, dataset_key, dataset)
+        span.set(source=answer.source, response_chars=len(answer.response))
+        return answer
+
+
+def _fast_answer(question: str, dataset: NFeDataset) -> Optional[AgentAnswer]:
+    """
+    Resposta sem o LLM: cache de respostas ou roteador. None quando a pergunta precisa do agente.
+    """
+    # Perguntas repetidas sobre o mesmo dataset são respondidas pelo cache, sem chamar o LLM
+    cache_key = answer_key(dataset.fingerprint, question)
+    with tracer.span('answer_cache.get') as span:
+        cached = answer_cache.get(cache_key)
+        span.set(hit=cached is not None)
+    if cached is not None:
+        logger.info("Resposta encontrada no cache de respostas")
+        return AgentAnswer(cached, 'answer_cache')
+
+    if FAST_PATH_ENABLED:
+        with tracer.span('router.route') as span:
+            routed = router.route(question, dataset)
+            span.set(hit=routed is not None)
+        if routed is not None:
+            answer_cache.put(cache_key, routed)
+            return AgentAnswer(routed, 'router')
+    return None
+
+
+def _agent_context(question: str, dataset: NFeDataset) -> str:
+    resumo = dataset_aggregates(dataset).summary()
+    resumo_itens = dataset.derived('items_summary', _items_summary)
+
+    return f"""
         Dados disponíveis:
         
         Cabeçalho das notas fiscais:
-        - Total de notas: {len(cabecalho_df)}
-        - Valor total: R$ {cabecalho_df['VALOR NOTA FISCAL'].sum():,.2f}
-        - Média por nota: R$ {cabecalho_df['VALOR NOTA FISCAL'].mean():,.2f}
+        - Períodos carregados: {', '.join(p.name for p in dataset.partitions)}
+        - Total de notas: {resumo['quantidade']}
+        - Valor total: R$ {resumo['soma']:,.2f}
+        - Média por nota: R$ {resumo['media']:,.2f}
         
         Itens das notas fiscais:
-        - Total de itens: {len(itens_df)}
-        - Serviços únicos: {itens_df['DESCRIÇÃO DO PRODUTO/SERVIÇO'].nunique()}
+        - Total de itens: {resumo_itens['quantidade']}
+        - Serviços únicos: {resumo_itens['servicos']}
         
         Pergunta: {question}
         """
+
+
+def _record_answer(question: str, dataset: NFeDataset, response: str, seconds: float) -> None:
+    router.record_agent(seconds)
+    logger.info("Agente finalizado com sucesso")
+    logger.info(f"Resposta do agente: {response}")
+    answer_cache.put(answer_key(dataset.fingerprint, question), response)
+
+
+def _error_answer(error: Exception) -> AgentAnswer:
+    logger.error(f"Erro na execução do agente: {str(error)}")
+    # A falha vira um pedido de desculpas para o usuário; o span 'agent.run' registra o erro
+    run_span = tracer.current()
+    if run_span is not None:
+        run_span.fail(error)
+    return AgentAnswer(f"Desculpe, ocorreu um erro ao processar sua pergunta: {str(error)}. Se não for possível responder completamente à pergunta devido a limitações dos dados, explique claramente o motivo e forneça qualquer informação parcial ou relacionada que possa ajudar.", 'error', str(error))
+
+
+def _run_agent(question: str, temp_dir: Optional[str], find_data_files: Optional[Callable[[str], List[str]]],
+               dataset_key: Optional[str] = None, dataset: Optional[NFeDataset] = None) -> AgentAnswer:
+    logger.info(f"Iniciando processamento da pergunta: {question}")
+    
+    try:
+        if dataset is None:
+            # Carrega os arquivos (reaproveitando o cache de datasets entre perguntas)
+            logger.info("Carregando arquivos")
+            files = find_data_files(temp_dir)
+            if not files:
+                message = "Nenhum arquivo encontrado para análise."
+                return AgentAnswer(message, 'error', message)
+            
+            with tracer.span('dataset.load') as span:
+                dataset = load_dataset(temp_dir, find_data_files, dataset_key)
+                if dataset is None:
+                    message = "Não foi possível carregar todos os arquivos necessários."
+                    return AgentAnswer(message, 'error', message)
+                span.set(**dataset.size_attributes())
+        
+        answer = _fast_answer(question, dataset)
+        if answer is not None:
+            return answer
+        
+        # Agente e LLM são reaproveitados entre perguntas sobre o mesmo dataset
+        with tracer.span('agent.init'):
+            agent = get_agent(dataset)
+        
+        # Prepara o contexto
+        context = _agent_context(question, dataset)
         
         # Executa o agente
         logger.info("Executando agente NFe")
-        response = agent.run(context)
-        logger.info("Agente finalizado com sucesso")
-        logger.info(f"Resposta do agente: {response}")
+        start = time.perf_counter()
+        with tracer.span('agent.execute'):
+            response = agent.run(context, callbacks=[TracingCallbackHandler(tracer)])
+        _record_answer(question, dataset, response, time.perf_counter() - start)
         
-        return response
+        return AgentAnswer(response, 'agent')
         
     except Exception as e:
-        logger.error(f"Erro na execução do agente: {str(e)}")
-        return f"Desculpe, ocorreu um erro ao processar sua pergunta: {str(e)}. Se não for possível responder completamente à pergunta devido a limitações dos dados, explique claramente o motivo e forneça qualquer informação parcial ou relacionada que possa ajudar." 
\ No newline at end of file
+        return _error_answer(e)
+
+
+async def run_agent_async(question: str, dataset: NFeDataset,
+                          on_event: Optional[Callable[[str, str], None]] = None) -> str:
+    """
+    Versão assíncrona de `run_agent_with_middlewares` para um dataset já carregado.
+
+    O agente roda pelas APIs assíncronas do LangChain (`astream_events`), então o LLM responde em
+    fluxo: `on_event(tipo, texto)` recebe cada token ('token'), cada ferramenta chamada ('action'),
+    o resultado dela ('observation') e, ao final, a resposta completa ('answer'). As etapas síncronas
+    (cache, roteador, ferramentas) rodam no executor do loop, sem bloqueá-lo.
+    """
+    emit = on_event or (lambda kind, text: None)
+    with tracer.span('agent.run', question=question, mode='async') as span:
+        response = await _run_agent_async(question, dataset, emit)
+        span.set(response_chars=len(response))
+    emit('answer', response)
+    return response
+
+
+def _chunk_text(chunk) -> str:
+    content = getattr(chunk, 'content', None)
+    if content is None:
+        content = getattr(chunk, 'text', chunk)
+    return content if isinstance(content, str) else str(content)
+
+
+async def _run_agent_async(question: str, dataset: NFeDataset, emit: Callable[[str, str], None]) -> str:
+    logger.info(f"Iniciando processamento assíncrono da pergunta: {question}")
+
+    try:
+        # asyncio.to_thread leva o span corrente para a thread do executor
+        answer = await asyncio.to_thread(_fast_answer, question, dataset)
+        if answer is not None:
+            tracer.current().set(source=answer.source)
+            return answer.response
+
+        with tracer.span('agent.init'):
+            agent = await asyncio.to_thread(get_agent, dataset)
+        context = await asyncio.to_thread(_agent_context, question, dataset)
+
+        logger.info("Executando agente NFe (assíncrono)")
+        start = time.perf_counter()
+        response = None
+        with tracer.span('agent.execute', mode='stream'):
+            events = agent.astream_events({'input': context}, version='v1',
+                                          config={'callbacks': [TracingCallbackHandler(tracer)]})
+            root_id = None
+            async for event in events:
+                kind = event['event']
+                root_id = root_id or event['run_id']
+                if kind in ('on_chat_model_stream', 'on_llm_stream'):
+                    emit('token', _chunk_text(event['data'].get('chunk')))
+                elif kind == 'on_tool_start':
+                    emit('action', f"{event['name']}: {event['data'].get('input')}")
+                elif kind == 'on_tool_end':
+                    emit('observation', str(event['data'].get('output')))
+                elif kind == 'on_chain_end' and event['run_id'] == root_id:
+                    response = (event['data'].get('output') or {}).get('output')
+        if response is None:
+            raise RuntimeError("O agente terminou sem resposta final")
+        _record_answer(question, dataset, response, time.perf_counter() - start)
+        tracer.current().set(source='agent')
+        return response
+
+    except Exception as e:
+        tracer.current().set(source='error')
+        return _error_answer(e).response
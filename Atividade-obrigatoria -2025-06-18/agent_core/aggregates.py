@@ -0,0 +1,78 @@
+import threading
+from typing import Callable, Any
+
+import pandas as pd
+
+# Dimensões derivadas da DATA EMISSÃO (consideram apenas notas com data válida)
+DATE_DIMENSIONS = {
+    'ANO_MES': lambda datas: datas.dt.to_period('M'),
+    'DIA_SEMANA': lambda datas: datas.dt.dayofweek,
+    'DATA': lambda datas: datas.dt.normalize(),
+}
+
+
+def count_by(series: pd.Series) -> pd.Series:
+    """
+    Contagem decrescente com desempate estável; ignora categorias sem ocorrência.
+    """
+    counts = series.value_counts(sort=False)
+    return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+
+class HeaderAggregates:
+    """
+    Agregados de VALOR NOTA FISCAL sobre o dataset Cabecalho.
+
+    Cada agregado (contagem, soma e média por UF, município, natureza, emitente,
+    destinatário, mês, dia da semana...) é calculado uma única vez e reaproveitado
+    nas consultas seguintes. A instância pertence a um único dataset: um novo
+    upload gera um novo dataset e, portanto, novos agregados.
+    """
+
+    def __init__(self, cabecalho_df: pd.DataFrame):
+        self._df = cabecalho_df
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _memo(self, key: tuple, builder: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = builder()
+            return self._cache[key]
+
+    def _dimension(self, dim: str) -> pd.Series:
+        if dim in DATE_DIMENSIONS:
+            datas_validas = self._df['DATA EMISSÃO'].dropna()
+            return DATE_DIMENSIONS[dim](datas_validas).rename(dim)
+        return self._df[dim]
+
+    def summary(self) -> dict:
+        """
+        Quantidade de notas, soma e média de VALOR NOTA FISCAL.
+        """
+        def build():
+            valores = self._df['VALOR NOTA FISCAL']
+            return {'quantidade': len(valores), 'soma': valores.sum(), 'media': valores.mean()}
+        return self._memo(('summary',), build)
+
+    def counts(self, dim: str) -> pd.Series:
+        """
+        Quantidade de notas por valor da dimensão, em ordem decrescente.
+        """
+        return self._memo(('counts', dim), lambda: count_by(self._dimension(dim)))
+
+    def stats(self, dim: str) -> pd.DataFrame:
+        """
+        Quantidade, soma e média de VALOR NOTA FISCAL por valor da dimensão, ordenado pela dimensão.
+        Notas sem valor contam como zero.
+        """
+        def build():
+            chave = self._dimension(dim)
+            valores = self._df['VALOR NOTA FISCAL'].fillna(0).loc[chave.index]
+            return valores.groupby(chave, observed=True).agg(['size', 'sum', 'mean']) \
+                          .rename(columns={'size': 'quantidade', 'sum': 'soma', 'mean': 'media'})
+        return self._memo(('stats', dim), build)
+
+
+def build_header_aggregates(dataset) -> HeaderAggregates:
+    return HeaderAggregates(dataset.cabecalho_df)
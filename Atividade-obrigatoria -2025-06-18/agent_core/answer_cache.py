@@ -0,0 +1,129 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+
+from agent_core.utils import normalize_text
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+
+def answer_key(fingerprint: str, question: str) -> str:
+    """
+    Chave da resposta: dataset + pergunta normalizada, de modo que variações de
+    caixa, acentuação e espaços da mesma pergunta compartilhem a resposta.
+    """
+    return f"{fingerprint}|{normalize_text(question).strip('?!. ')}"
+
+
+class AnswerCache:
+    """
+    Cache LRU com expiração (TTL) das respostas do agente.
+
+    Com `db_path`, as respostas também são gravadas em um arquivo SQLite local e
+    sobrevivem a reinícios do processo; a memória continua sendo consultada primeiro.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answer TEXT, created REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers (created)")
+            self._db.commit()
+
+    def _expired(self, created: float) -> bool:
+        return time.time() - created > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT answer, created FROM answers WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = row
+                    self._store(key, entry)
+            if entry is None or self._expired(entry[1]):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, answer: str) -> None:
+        with self._lock:
+            entry = (answer, time.time())
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?)", (key, *entry))
+                self._trim_db(entry[1])
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """
+        Contadores de acertos e perdas do cache.
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def _store(self, key: str, entry: tuple) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _trim_db(self, now: float) -> None:
+        # O arquivo segue os mesmos limites da memória: sem expiradas e no máximo `max_entries`
+        # respostas, descartando as mais antigas
+        self._db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def _remove(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self._db.commit()
+
+
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("NFE_ANSWER_CACHE_MAX_ENTRIES", "256")),
+    ttl_seconds=float(os.getenv("NFE_ANSWER_CACHE_TTL", "3600")),
+    db_path=os.getenv("NFE_ANSWER_CACHE_DB") or None
+)
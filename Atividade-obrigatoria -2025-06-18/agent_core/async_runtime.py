@@ -0,0 +1,103 @@
+import os
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Coroutine, Iterator, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+from agent_core.agent import run_agent_async
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+_DONE = object()
+
+
+class AgentEvent(NamedTuple):
+    """
+    Evento do agente em execução: 'token', 'action', 'observation' ou 'answer'.
+    """
+    kind: str
+    text: str
+
+
+class AgentRuntime:
+    """
+    Loop asyncio único do processo, numa thread de fundo, compartilhado por todas as sessões.
+
+    As perguntas de todas as sessões viram tarefas nesse loop; o trabalho síncrono (ferramentas,
+    roteador, cache) roda no pool de threads padrão do loop, limitado a `max_workers`.
+    Assim nenhuma sessão cria o próprio loop e uma pergunta longa não bloqueia as demais.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(ThreadPoolExecutor(self.max_workers, thread_name_prefix='nfe-agent'))
+                self._thread = threading.Thread(target=loop.run_forever, name='nfe-agent-loop', daemon=True)
+                self._thread.start()
+                self._loop = loop
+                logger.info(f"Loop assíncrono do agente iniciado ({self.max_workers} workers)")
+            return self._loop
+
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        Agenda a corrotina no loop compartilhado; pode ser chamado de qualquer thread.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop())
+
+    def stream(self, question: str, dataset) -> Iterator[AgentEvent]:
+        """
+        Executa a pergunta no loop compartilhado e entrega os eventos à thread que chamou
+        (ex.: a thread do script do Streamlit) à medida que são produzidos.
+        """
+        events = queue.Queue()
+
+        def on_event(kind: str, text: str) -> None:
+            events.put(AgentEvent(kind, text))
+
+        future = self.submit(run_agent_async(question, dataset, on_event))
+        future.add_done_callback(lambda _: events.put(_DONE))
+        while True:
+            event = events.get()
+            if event is _DONE:
+                break
+            yield event
+        # Propaga exceções que escaparam da corrotina
+        future.result()
+
+    def ask(self, question: str, dataset, timeout: Optional[float] = None) -> str:
+        """
+        Executa a pergunta no loop compartilhado e aguarda a resposta final.
+        """
+        return self.submit(run_agent_async(question, dataset)).result(timeout)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+
+runtime = AgentRuntime(max_workers=int(os.getenv("NFE_AGENT_WORKERS", "8")))
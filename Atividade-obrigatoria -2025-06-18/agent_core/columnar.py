@@ -0,0 +1,182 @@
+import os
+import hashlib
+import logging
+import tempfile
+from typing import IO, Iterator, List, Optional, Union
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from agent_core.schema import STRING_COLUMNS, FLOAT_COLUMNS, CATEGORY_COLUMNS, csv_dtypes, normalize_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - pyarrow é opcional
+    pa = None
+    feather = None
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+COLUMNAR_DIR = os.getenv("NFE_COLUMNAR_DIR", os.path.join(tempfile.gettempdir(), "nfe_colunar"))
+# Tamanho em disco a partir do qual uma tabela é percorrida em blocos em vez de processada em memória
+STREAMING_MIN_BYTES = int(os.getenv("NFE_STREAMING_MIN_MB", "1024")) * 1024 * 1024
+
+
+def is_available() -> bool:
+    return feather is not None
+
+
+def columnar_path(file_path: str, cache_key: Optional[str] = None) -> str:
+    """
+    Caminho do arquivo colunar correspondente a um CSV.
+
+    `cache_key` identifica o conteúdo (ex.: hash do upload); sem ele usa caminho, tamanho e mtime.
+    """
+    if cache_key is None:
+        stat = os.stat(file_path)
+        cache_key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    digest = hashlib.sha256(cache_key.encode('utf-8')).hexdigest()[:24]
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(COLUMNAR_DIR, f"{digest}_{name}.feather")
+
+
+def read_csv_typed(source: Union[str, IO]) -> pd.DataFrame:
+    """
+    Lê um CSV de NF-e aplicando os tipos explícitos das colunas conhecidas.
+
+    `source` pode ser um caminho ou um arquivo aberto (ex.: membro de um ZIP), que precisa
+    aceitar `seek(0)` para a releitura com coerção.
+    """
+    # Colunas ausentes no arquivo são ignoradas pelo pandas, então o cabeçalho não precisa ser lido antes
+    dtypes = csv_dtypes(STRING_COLUMNS + CATEGORY_COLUMNS + FLOAT_COLUMNS)
+    try:
+        df = pd.read_csv(source, encoding='utf-8', encoding_errors='replace', dtype=dtypes)
+    except ValueError:
+        # Valores numéricos malformados: lê essas colunas como texto e deixa a conversão para o schema
+        logger.warning(f"Valores numéricos inválidos em {getattr(source, 'name', source)}; convertendo com coerção")
+        dtypes = {col: dtype for col, dtype in dtypes.items() if col not in FLOAT_COLUMNS}
+        if not isinstance(source, str):
+            source.seek(0)
+        df = pd.read_csv(source, encoding='utf-8', encoding_errors='replace', dtype=dtypes)
+    return normalize_schema(df)
+
+
+def read_excel_typed(source: Union[str, IO]) -> pd.DataFrame:
+    """
+    Lê uma planilha de NF-e (.xlsx/.xls) aplicando os tipos explícitos das colunas conhecidas.
+    """
+    dtypes = csv_dtypes(STRING_COLUMNS + CATEGORY_COLUMNS + FLOAT_COLUMNS)
+    try:
+        df = pd.read_excel(source, dtype=dtypes)
+    except ValueError:
+        logger.warning(f"Valores numéricos inválidos em {getattr(source, 'name', source)}; convertendo com coerção")
+        if not isinstance(source, str):
+            source.seek(0)
+        df = pd.read_excel(source, dtype={col: dtype for col, dtype in dtypes.items() if col not in FLOAT_COLUMNS})
+    return normalize_schema(df)
+
+
+def read_data_file(file_path: str) -> pd.DataFrame:
+    """
+    Lê um arquivo de dados tipado pela extensão: CSV ou planilha.
+    """
+    if file_path.lower().endswith('.csv'):
+        return read_csv_typed(file_path)
+    return read_excel_typed(file_path)
+
+
+def write_columnar(df: pd.DataFrame, target: str) -> bool:
+    """
+    Grava o DataFrame tipado em Feather (Arrow IPC sem compressão, que pode ser mapeado em memória).
+    """
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_target = f"{target}.{os.getpid()}.tmp"
+        df.to_feather(tmp_target, compression='uncompressed')
+        os.replace(tmp_target, target)
+        logger.info(f"Arquivo colunar criado: {target}")
+        return True
+    except Exception as e:
+        logger.error(f"Erro ao gravar arquivo colunar {target}: {str(e)}")
+        return False
+
+
+def read_columnar(path: str) -> pd.DataFrame:
+    """
+    Lê um arquivo colunar para um DataFrame.
+
+    O arquivo é mapeado em memória, então a tabela Arrow intermediária fica nas páginas do
+    arquivo em vez de num buffer próprio; a conversão para o pandas copia os dados uma única vez.
+    """
+    table = feather.read_table(path, memory_map=True)
+    return normalize_schema(table.to_pandas())
+
+
+def load_table(file_path: str, cache_key: Optional[str] = None) -> pd.DataFrame:
+    """
+    Carrega um arquivo de NF-e (CSV ou planilha) pelo arquivo colunar, criando-o na primeira leitura.
+
+    Sem pyarrow, lê o arquivo tipado diretamente.
+    """
+    if not is_available():
+        return read_data_file(file_path)
+
+    target = columnar_path(file_path, cache_key)
+    if os.path.exists(target):
+        logger.info(f"Lendo arquivo colunar: {target}")
+        return read_columnar(target)
+
+    df = read_data_file(file_path)
+    write_columnar(df, target)
+    return df
+
+
+def _batch_column(array: 'pa.Array', name: str, dtypes: dict) -> Union[pd.Series, pd.Categorical]:
+    # Os lotes de um arquivo colunar apontam para o mesmo dicionário: ele é convertido uma única
+    # vez e cada lote converte apenas os códigos, então todos os blocos compartilham as categorias
+    if not pa.types.is_dictionary(array.type):
+        return array.to_pandas()
+    offsets = array.dictionary.buffers()[1]
+    key = (name, offsets.address if offsets is not None else 0, len(array.dictionary))
+    if key not in dtypes:
+        dtypes[key] = pd.CategoricalDtype(pd.Index(array.dictionary.to_numpy(zero_copy_only=False)))
+    return pd.Categorical.from_codes(array.indices.fill_null(-1).to_numpy(), dtype=dtypes[key])
+
+
+def iter_table_chunks(file_path: str, columns: List[str], chunksize: int = 500_000,
+                      cache_key: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Percorre uma tabela em blocos de linhas, lendo apenas as colunas pedidas.
+
+    Usa os lotes do arquivo colunar quando ele já existe; caso contrário lê o CSV em blocos,
+    sem carregar o arquivo inteiro.
+    """
+    if is_available():
+        target = columnar_path(file_path, cache_key)
+        if os.path.exists(target):
+            with pa.memory_map(target) as source:
+                reader = pa.ipc.open_file(source)
+                dtypes = {}
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i).select(columns)
+                    yield pd.DataFrame({col: _batch_column(batch.column(col), col, dtypes) for col in columns})
+            return
+
+    dtypes = {col: str for col in STRING_COLUMNS if col in columns}
+    reader = pd.read_csv(file_path, encoding='utf-8', encoding_errors='replace',
+                         usecols=columns, dtype=dtypes, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            for col in FLOAT_COLUMNS:
+                if col in chunk.columns:
+                    chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+            yield chunk
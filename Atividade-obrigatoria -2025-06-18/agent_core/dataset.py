@@ -0,0 +1,569 @@
+import io
+import os
+import re
+import hashlib
+import zipfile
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Any
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from agent_core.columnar import columnar_path, is_available, load_table, read_data_file
+from agent_core.dataset_cache import dataset_cache
+from agent_core.indexes import build_indexes
+from agent_core.ingest import ZipBombError, data_members, load_member
+from agent_core.schema import CATEGORY_COLUMNS, INTERNED_COLUMNS, normalize_schema, share_dictionary
+from agent_core.sketches import APPROX_MODE, approx_sketches
+from agent_core.storage import SQLStore, build_store, quote, storage_enabled
+from agent_core.tracing import df_attributes, tracer
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# Coluna de partição: período de cada par Cabecalho/Itens (ex.: '2024-01')
+PERIOD_COLUMN = 'PERIODO'
+_PERIOD_PATTERN = re.compile(r'(?<!\d)(\d{4})[-_]?(0[1-9]|1[0-2])(?!\d)')
+# Conversão paralela dos arquivos: acima deste volume o custo de iniciar os processos compensa
+LOAD_WORKERS = int(os.getenv("NFE_LOAD_WORKERS", "0")) or os.cpu_count() or 1
+PARALLEL_MIN_BYTES = int(os.getenv("NFE_PARALLEL_MIN_MB", "64")) * 1024 * 1024
+
+
+class Partition(NamedTuple):
+    """
+    Faixa de linhas de um período em cada tabela e o intervalo de DATA EMISSÃO das suas notas.
+    """
+    name: str
+    cabecalho: slice
+    itens: slice
+    inicio: Optional[pd.Timestamp]
+    fim: Optional[pd.Timestamp]
+
+
+def partition_name(file: str) -> str:
+    """
+    Período de um arquivo pelo nome (ex.: '202401_NFs_Cabecalho.csv' -> '2024-01').
+
+    Sem ano/mês no nome, usa o nome sem 'Cabecalho'/'Itens', que é o mesmo para os dois arquivos do par.
+    """
+    stem = os.path.splitext(os.path.basename(file))[0]
+    match = _PERIOD_PATTERN.search(stem)
+    if match:
+        return f"{match.group(1)}-{match.group(2)}"
+    return re.sub(r'(?i)cabecalho|itens', '', stem).strip(' _-') or 'unico'
+
+
+def _date_range(df: pd.DataFrame) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+    if 'DATA EMISSÃO' not in df.columns:
+        return None, None
+    datas = df['DATA EMISSÃO']
+    inicio, fim = datas.min(), datas.max()
+    return (None, None) if pd.isna(inicio) else (inicio, fim)
+
+
+def _deep_nbytes(*frames: pd.DataFrame) -> int:
+    # Dicionários compartilhados entre tabelas (ver `share_dictionary`) são contados uma única vez
+    total, dictionaries = 0, set()
+    for df in frames:
+        for col in df.columns:
+            series = df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                total += series.cat.codes.nbytes
+                categories = series.cat.categories
+                if id(categories) not in dictionaries:
+                    dictionaries.add(id(categories))
+                    total += categories.memory_usage(deep=True)
+            else:
+                total += series.memory_usage(deep=True, index=False)
+    return int(total)
+
+
+class NFeDataset:
+    """
+    Par de DataFrames (Cabecalho e Itens) já carregados e tipados.
+
+    As estruturas derivadas (agregados, índices, etc.) são memorizadas por
+    instância, então ficam válidas enquanto o dataset existir no cache.
+    """
+
+    def __init__(self, cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame, fingerprint: str,
+                 sources: Optional[Dict[str, Tuple[str, Optional[str]]]] = None,
+                 partitions: Optional[List[Partition]] = None, artifacts: Optional[List[str]] = None):
+        self.cabecalho_df = cabecalho_df
+        self.itens_df = itens_df
+        self.fingerprint = fingerprint
+        # Arquivo de origem e chave do arquivo colunar de cada tabela ('cabecalho' e 'itens'),
+        # presentes apenas quando a tabela veio de um único arquivo
+        self.sources = sources or {}
+        # Arquivos em disco gerados no carregamento (cópias colunares), removíveis quando o dataset é descartado
+        self.artifacts = artifacts or []
+        self.partitions = partitions or [
+            Partition('unico', slice(0, len(cabecalho_df)), slice(0, len(itens_df)), *_date_range(cabecalho_df))
+        ]
+        self.nbytes = _deep_nbytes(cabecalho_df, itens_df)
+        self._derived = {}
+        # Reentrante: a construção de uma estrutura derivada pode depender de outras
+        self._lock = threading.RLock()
+
+    def frames(self, inicio: Optional[pd.Timestamp] = None,
+               fim: Optional[pd.Timestamp] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Retorna visões somente leitura (cópias rasas) dos DataFrames já tipados.
+
+        As ferramentas não alteram os DataFrames recebidos; a cópia rasa garante que uma
+        coluna criada ou linha removida por quem chamar não contamine o dataset em cache,
+        sem duplicar os dados.
+
+        Com `inicio`/`fim`, descarta os períodos cujas notas estão todas fora do intervalo
+        (poda de partições); as linhas dos períodos mantidos ainda precisam ser filtradas por quem chamar.
+        """
+        if inicio is None and fim is None:
+            return self.cabecalho_df.copy(deep=False), self.itens_df.copy(deep=False)
+        selected = [p for p in self.partitions if p.inicio is None or (
+            (fim is None or p.inicio <= fim) and (inicio is None or p.fim >= inicio))]
+        return (self._select(self.cabecalho_df, [p.cabecalho for p in selected]),
+                self._select(self.itens_df, [p.itens for p in selected]))
+
+    @staticmethod
+    def _select(df: pd.DataFrame, slices: List[slice]) -> pd.DataFrame:
+        if len(slices) == 1:
+            return df.iloc[slices[0]].copy(deep=False)
+        if not slices:
+            return df.iloc[0:0].copy(deep=False)
+        return df.iloc[np.concatenate([np.arange(s.start, s.stop) for s in slices])]
+
+    def stream_source(self, table: str, min_bytes: int = 0) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        (arquivo de origem, chave colunar) para percorrer a tabela em blocos com `iter_table_chunks`.
+
+        Só existe quando a tabela veio de um único arquivo ainda legível no disco (a cópia colunar
+        ou o próprio CSV) com pelo menos `min_bytes`; senão retorna None.
+        """
+        if table not in self.sources:
+            return None
+        file_path, cache_key = self.sources[table]
+        try:
+            target = columnar_path(file_path, cache_key) if is_available() else None
+            if target is None or not os.path.exists(target):
+                # Sem cópia colunar, o caminho precisa ser o CSV (membros de ZIP não estão no disco
+                # e planilhas não são lidas em blocos)
+                target = file_path if os.path.isfile(file_path) and file_path.lower().endswith('.csv') else None
+            if target is None or os.path.getsize(target) < min_bytes:
+                return None
+        except OSError:
+            # O diretório temporário de origem já pode ter sido removido
+            return None
+        return file_path, cache_key
+
+    def derived(self, name: str, builder: Callable[['NFeDataset'], Any]) -> Any:
+        """
+        Retorna a estrutura derivada `name`, construindo-a uma única vez.
+        """
+        with self._lock:
+            if name not in self._derived:
+                logger.info(f"Construindo estrutura derivada '{name}' para o dataset {self.fingerprint[:12]}")
+                self._derived[name] = builder(self)
+            return self._derived[name]
+
+    def rows(self, table: str) -> int:
+        """
+        Quantidade de linhas da tabela ('cabecalho' ou 'itens').
+        """
+        return len(self.cabecalho_df if table == 'cabecalho' else self.itens_df)
+
+    def size_attributes(self) -> Dict[str, Any]:
+        """
+        Atributos de tamanho das duas tabelas para os spans de rastreamento.
+        """
+        return {**df_attributes('cabecalho', self.cabecalho_df), **df_attributes('itens', self.itens_df)}
+
+    def close(self) -> None:
+        """
+        Libera os recursos abertos pelo dataset (conexões com o banco local), quando ele é descartado.
+        """
+        store = self._derived.get('sql_store')
+        if store is not None:
+            store.close()
+
+
+class StoredDataset(NFeDataset):
+    """
+    Dataset servido pelo banco local (NFE_STORAGE): Cabecalho e Itens ficam apenas no arquivo do
+    banco, compartilhado pelas sessões e processos e reaproveitado após reiniciar a aplicação.
+
+    Ferramentas, roteador e contexto do agente consultam `store`. Os DataFrames completos só são
+    lidos do banco, uma única vez, se algum código pedir `cabecalho_df`/`itens_df`.
+    """
+
+    def __init__(self, store: SQLStore, fingerprint: str, partitions: List[Partition]):
+        self.store = store
+        self.fingerprint = fingerprint
+        self.sources = {}
+        self.artifacts = []
+        self.partitions = partitions
+        self.nbytes = 0
+        self._frames = None
+        self._derived = {'sql_store': store}
+        self._lock = threading.RLock()
+
+    def _materialize(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        with self._lock:
+            if self._frames is None:
+                logger.warning(f"Lendo as tabelas do banco local para a memória (dataset {self.fingerprint[:12]})")
+                with tracer.span('dataset.materialize'):
+                    cabecalho_df = self.store.read_table('cabecalho').reset_index(drop=True)
+                    itens_df = self.store.read_table('itens').reset_index(drop=True)
+                share_dictionary(cabecalho_df, itens_df, 'CHAVE DE ACESSO')
+                self._frames = (cabecalho_df, itens_df)
+                self.nbytes = _deep_nbytes(cabecalho_df, itens_df)
+            return self._frames
+
+    @property
+    def cabecalho_df(self) -> pd.DataFrame:
+        return self._materialize()[0]
+
+    @property
+    def itens_df(self) -> pd.DataFrame:
+        return self._materialize()[1]
+
+    def rows(self, table: str) -> int:
+        return self.store.count(table)
+
+    def size_attributes(self) -> Dict[str, Any]:
+        if self._frames is not None:
+            return super().size_attributes()
+        return {f'{table}.{name}': value for table in ('cabecalho', 'itens') for name, value in
+                (('rows', self.rows(table)), ('columns', len(self.store.columns(table))), ('bytes', 0))}
+
+    def close(self) -> None:
+        self.store.close()
+
+
+def fingerprint_files(paths: List[str]) -> str:
+    """
+    Gera a impressão digital de um conjunto de arquivos a partir de caminho, tamanho e mtime.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def fingerprint_bytes(data: bytes) -> str:
+    """
+    Gera a impressão digital do conteúdo de um upload.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def _convert_file(file_path: str, cache_key: Optional[str]) -> None:
+    load_table(file_path, cache_key)
+
+
+_worker_zip = None
+
+
+def _init_zip_worker(zip_bytes: bytes) -> None:
+    global _worker_zip
+    _worker_zip = zipfile.ZipFile(io.BytesIO(zip_bytes))
+
+
+def _convert_member(name: str, cache_key: str) -> None:
+    load_member(_worker_zip, _worker_zip.getinfo(name), cache_key)
+
+
+def _convert_parallel(jobs: List[Tuple[Callable, tuple]], total_bytes: int,
+                      initializer: Optional[Callable] = None, initargs: tuple = ()) -> None:
+    """
+    Converte em paralelo, num pool de processos, os arquivos que ainda não têm arquivo colunar.
+
+    Depois disso o carregamento de cada arquivo é apenas a leitura mapeada em memória. Com poucos
+    arquivos ou pouco volume, não faz nada e os arquivos são lidos em sequência.
+    """
+    workers = min(LOAD_WORKERS, len(jobs))
+    if workers < 2 or total_bytes < PARALLEL_MIN_BYTES or not is_available():
+        return
+    with tracer.span('dataset.convert_parallel', files=len(jobs), workers=workers, bytes=total_bytes):
+        try:
+            # 'spawn' evita copiar por fork o estado das threads do Streamlit
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=initializer, initargs=initargs) as pool:
+                for future in [pool.submit(func, *args) for func, args in jobs]:
+                    future.result()
+        except ZipBombError:
+            raise
+        except Exception as e:
+            logger.warning(f"Conversão paralela indisponível ({str(e)}); os arquivos serão lidos em sequência")
+
+
+def _concat(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatena os arquivos de uma tabela mantendo as colunas categóricas (com a união das categorias).
+    """
+    if len(frames) == 1:
+        return frames[0]
+    for col in CATEGORY_COLUMNS + INTERNED_COLUMNS + [PERIOD_COLUMN]:
+        columns = [df[col] for df in frames if col in df.columns]
+        if columns and all(isinstance(series.dtype, pd.CategoricalDtype) for series in columns):
+            categories = pd.Index(np.concatenate([series.cat.categories.to_numpy(dtype=object)
+                                                  for series in columns])).unique()
+            try:
+                # Categorias ordenadas, como na leitura de um único CSV: a ordem dos relatórios não depende dos arquivos
+                categories = categories.sort_values()
+            except TypeError:
+                pass
+            for df in frames:
+                if col in df.columns:
+                    df[col] = df[col].cat.set_categories(categories)
+    return normalize_schema(pd.concat(frames, ignore_index=True))
+
+
+def _assemble(key: str, entries: List[Tuple[str, str, Optional[str], Callable[[], pd.DataFrame]]]) -> Optional[NFeDataset]:
+    """
+    Monta o dataset a partir de (nome, origem, chave colunar, função de leitura) de cada arquivo
+    e o registra no cache. Retorna None se faltar o Cabecalho ou os Itens.
+
+    Todos os arquivos Cabecalho/Itens são usados: os de cada tabela são concatenados em ordem de
+    período, com a coluna PERIODO identificando a partição de cada linha.
+    """
+    loaded = {'cabecalho': [], 'itens': []}
+    artifacts = []
+    for file, source, file_key, read in entries:
+        if "Cabecalho" in file:
+            table = 'cabecalho'
+        elif "Itens" in file:
+            table = 'itens'
+        else:
+            continue
+        try:
+            logger.info(f"Processando arquivo: {source}")
+            with tracer.span('dataset.load_table', file=file) as span:
+                df = read()
+                span.set(**df_attributes('df', df))
+            period = partition_name(file)
+            df[PERIOD_COLUMN] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), [period])
+            loaded[table].append((period, df, source, file_key))
+            if is_available():
+                artifacts.append(columnar_path(source, file_key))
+            logger.info(f"{file} carregado. Colunas: {df.columns.tolist()}")
+        except ZipBombError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao carregar {file}: {str(e)}")
+
+    if not loaded['cabecalho'] or not loaded['itens']:
+        return None
+
+    periods = sorted({period for files in loaded.values() for period, *_ in files})
+    for table, files in loaded.items():
+        missing = set(periods) - {period for period, *_ in files}
+        if missing:
+            logger.warning(f"Períodos sem arquivo de {table}: {sorted(missing)}")
+
+    tables, sources, offsets = {}, {}, {}
+    with tracer.span('dataset.concat', periods=len(periods)):
+        for table, files in loaded.items():
+            files.sort(key=lambda entry: entry[0])
+            tables[table] = _concat([df for _, df, _, _ in files])
+            if len(files) == 1:
+                sources[table] = files[0][2:]
+            # Linhas de cada período: os arquivos ficam contíguos após a ordenação
+            bounds, start = {}, 0
+            for period, df, _, _ in files:
+                first = bounds.get(period, (start, start))[0]
+                bounds[period] = (first, start + len(df))
+                start += len(df)
+            offsets[table] = bounds
+
+    # Chave de acesso das duas tabelas no mesmo dicionário: a junção nota/itens compara códigos
+    share_dictionary(tables['cabecalho'], tables['itens'], 'CHAVE DE ACESSO')
+
+    partitions = []
+    for period in periods:
+        cab = slice(*offsets['cabecalho'].get(period, (0, 0)))
+        itens = slice(*offsets['itens'].get(period, (0, 0)))
+        # O intervalo de datas vem das notas; sem o Cabecalho do período, dos itens
+        inicio, fim = _date_range(tables['cabecalho'].iloc[cab])
+        if inicio is None:
+            inicio, fim = _date_range(tables['itens'].iloc[itens])
+        partitions.append(Partition(period, cab, itens, inicio, fim))
+
+    dataset = NFeDataset(tables['cabecalho'], tables['itens'], key, sources, partitions, artifacts)
+    # Índices de consulta pontual são construídos junto com o carregamento
+    with tracer.span('dataset.build_indexes'):
+        dataset.derived('indexes', build_indexes)
+    if APPROX_MODE:
+        # No modo aproximado os sketches são construídos no carregamento, a partir dos Itens já em memória
+        with tracer.span('dataset.build_sketches'):
+            dataset.derived('item_sketches', approx_sketches)
+    dataset_cache.put(dataset)
+    return dataset
+
+
+def _table_of(file: str) -> Optional[str]:
+    if "Cabecalho" in file:
+        return 'cabecalho'
+    if "Itens" in file:
+        return 'itens'
+    return None
+
+
+def _stored_tables(entries: List[Tuple[str, str, Callable[[], pd.DataFrame]]]):
+    """
+    Lê os arquivos um a um, na ordem das linhas do banco (Cabecalho e depois Itens, cada tabela
+    em ordem de período), e produz (tabela, DataFrame) com a coluna PERIODO.
+    """
+    files = sorted(((_table_of(file), partition_name(file), file, source, read)
+                    for file, source, read in entries if _table_of(file) is not None),
+                   key=lambda entry: (entry[0] != 'cabecalho', entry[1]))
+    for table, period, file, source, read in files:
+        try:
+            logger.info(f"Processando arquivo: {source}")
+            with tracer.span('dataset.load_table', file=file) as span:
+                df = read()
+                span.set(**df_attributes('df', df))
+            df[PERIOD_COLUMN] = period
+        except ZipBombError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao carregar {file}: {str(e)}")
+            continue
+        logger.info(f"{file} gravado no banco local. Colunas: {df.columns.tolist()}")
+        yield table, df
+
+
+def _stored_partitions(store: SQLStore) -> List[Partition]:
+    """
+    Partições do dataset a partir do banco: linhas de cada período (contíguas, em ordem de
+    período) e o intervalo de DATA EMISSÃO das suas notas.
+    """
+    period = quote(PERIOD_COLUMN)
+    offsets, ranges = {}, {}
+    for table in ('cabecalho', 'itens'):
+        counts = store.query(f"SELECT {period} AS periodo, COUNT(*) AS n FROM {table} GROUP BY {period}")
+        bounds, start = {}, 0
+        for name, n in sorted(zip(counts['periodo'], counts['n'])):
+            bounds[name] = (start, start + int(n))
+            start += int(n)
+        offsets[table] = bounds
+        if 'DATA EMISSÃO' in store.columns(table):
+            datas = store.query(f"SELECT {period} AS periodo, MIN({quote('DATA EMISSÃO')}) AS inicio, "
+                                f"MAX({quote('DATA EMISSÃO')}) AS fim FROM {table} GROUP BY {period}")
+            ranges[table] = {name: (pd.to_datetime(inicio), pd.to_datetime(fim))
+                             for name, inicio, fim in datas.itertuples(index=False) if not pd.isna(inicio)}
+        else:
+            ranges[table] = {}
+
+    periods = sorted(set(offsets['cabecalho']) | set(offsets['itens']))
+    for table, bounds in offsets.items():
+        missing = set(periods) - set(bounds)
+        if missing:
+            logger.warning(f"Períodos sem arquivo de {table}: {sorted(missing)}")
+    partitions = []
+    for name in periods:
+        # O intervalo de datas vem das notas; sem o Cabecalho do período, dos itens
+        inicio, fim = ranges['cabecalho'].get(name) or ranges['itens'].get(name) or (None, None)
+        partitions.append(Partition(name, slice(*offsets['cabecalho'].get(name, (0, 0))),
+                                    slice(*offsets['itens'].get(name, (0, 0))), inicio, fim))
+    return partitions
+
+
+def _load_stored(key: str, entries: List[Tuple[str, str, Callable[[], pd.DataFrame]]]) -> Optional[NFeDataset]:
+    """
+    Abre o banco local do dataset `key`, gravando nele os arquivos (nome, origem, função de leitura)
+    se ainda não existir, e registra o dataset no cache. Retorna None se faltar o Cabecalho ou os Itens.
+
+    Os arquivos são lidos e gravados um de cada vez: o processo nunca mantém as tabelas completas
+    em memória, e com o banco já criado nenhum arquivo é lido.
+    """
+    with tracer.span('dataset.open_store', files=len(entries)):
+        store = build_store(key, lambda: _stored_tables(entries))
+    if store is None:
+        return None
+    dataset = StoredDataset(store, key, _stored_partitions(store))
+    if APPROX_MODE:
+        # Sketches lidos do banco em blocos: os Itens nunca ficam inteiros em memória
+        with tracer.span('dataset.build_sketches'):
+            dataset.derived('item_sketches', approx_sketches)
+    dataset_cache.put(dataset)
+    return dataset
+
+
+def load_dataset(temp_dir: str, find_data_files: Callable[[str], List[str]],
+                 dataset_key: Optional[str] = None) -> Optional[NFeDataset]:
+    """
+    Carrega os arquivos Cabecalho e Itens de `temp_dir`, reaproveitando o cache.
+
+    Sem `dataset_key`, a chave do cache é derivada de caminho, tamanho e mtime dos arquivos.
+    Retorna None se algum dos dois arquivos não puder ser carregado.
+    """
+    files = find_data_files(temp_dir)
+    if not files:
+        return None
+
+    paths = [os.path.join(temp_dir, file) for file in files]
+    key = dataset_key or fingerprint_files(paths)
+    cached = dataset_cache.get(key)
+    if cached is not None:
+        logger.info(f"Dataset {key[:12]} encontrado no cache")
+        return cached
+
+    if storage_enabled():
+        # Os arquivos vão direto para o banco local, sem cópias colunares
+        return _load_stored(key, [(os.path.basename(path), path, lambda path=path: read_data_file(path))
+                                  for path in paths])
+
+    entries, jobs, pending_bytes = [], [], 0
+    for file_path in paths:
+        file = os.path.basename(file_path)
+        # Com o hash do upload, o arquivo colunar é reaproveitado mesmo que o diretório mude
+        file_key = f"{dataset_key}|{file}" if dataset_key else None
+        entries.append((file, file_path, file_key,
+                        lambda file_path=file_path, file_key=file_key: load_table(file_path, file_key)))
+        if is_available() and not os.path.exists(columnar_path(file_path, file_key)):
+            jobs.append((_convert_file, (file_path, file_key)))
+            pending_bytes += os.path.getsize(file_path)
+    _convert_parallel(jobs, pending_bytes)
+    return _assemble(key, entries)
+
+
+def load_dataset_from_zip(zip_bytes: bytes, dataset_key: Optional[str] = None) -> Optional[NFeDataset]:
+    """
+    Carrega os arquivos Cabecalho e Itens direto do ZIP em memória, sem extraí-lo para o disco.
+
+    Cada membro é lido em fluxo pelo parser (planilhas são lidas para a memória), com limite de
+    tamanho descompactado. Retorna None se algum dos dois arquivos não puder ser carregado.
+    """
+    key = dataset_key or fingerprint_bytes(zip_bytes)
+    cached = dataset_cache.get(key)
+    if cached is not None:
+        logger.info(f"Dataset {key[:12]} encontrado no cache")
+        return cached
+
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        if storage_enabled():
+            # Os membros vão direto para o banco local, sem cópias colunares
+            return _load_stored(key, [(os.path.basename(info.filename), info.filename,
+                                       lambda info=info: load_member(zf, info)) for info in data_members(zf)])
+        entries, jobs, pending_bytes = [], [], 0
+        for info in data_members(zf):
+            file_key = f"{key}|{info.filename}"
+            entries.append((os.path.basename(info.filename), info.filename, file_key,
+                            lambda info=info, file_key=file_key: load_member(zf, info, file_key)))
+            if is_available() and not os.path.exists(columnar_path(info.filename, file_key)):
+                jobs.append((_convert_member, (info.filename, file_key)))
+                pending_bytes += info.file_size
+        _convert_parallel(jobs, pending_bytes, _init_zip_worker, (zip_bytes,))
+        return _assemble(key, entries)
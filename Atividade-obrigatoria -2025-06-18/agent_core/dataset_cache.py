@@ -0,0 +1,72 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+
+class DatasetCache:
+    """
+    Cache LRU de datasets de NF-e já carregados, limitado por quantidade e por memória.
+    """
+
+    def __init__(self, max_entries: int = 4, max_bytes: int = 2048 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(dataset.nbytes for dataset in self._entries.values())
+
+    def get(self, key: str) -> Optional['NFeDataset']:
+        with self._lock:
+            dataset = self._entries.get(key)
+            if dataset is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dataset
+
+    def put(self, dataset: 'NFeDataset') -> None:
+        with self._lock:
+            self._entries[dataset.fingerprint] = dataset
+            self._entries.move_to_end(dataset.fingerprint)
+            self._evict()
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self) -> None:
+        # O dataset mais recente nunca é removido, mesmo que sozinho ultrapasse o limite
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            key, dataset = self._entries.popitem(last=False)
+            logger.info(f"Removendo dataset {key[:12]} do cache ({dataset.nbytes / 1024 ** 2:.1f} MB)")
+
+
+dataset_cache = DatasetCache(
+    max_entries=int(os.getenv("NFE_CACHE_MAX_ENTRIES", "4")),
+    max_bytes=int(os.getenv("NFE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+)
@@ -0,0 +1,240 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, MutableMapping, Optional
+from dotenv import load_dotenv
+
+from agent_core.dataset import load_dataset_from_zip
+from agent_core.dataset_cache import dataset_cache
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+
+class PoolMemoryError(MemoryError):
+    """
+    O dataset não cabe no limite de memória do pool sem descartar datasets em uso por outras sessões.
+    """
+
+
+class PoolEntry:
+    """
+    Dataset do pool com as sessões que o usam (sessão -> último acesso).
+    """
+
+    def __init__(self, dataset: 'NFeDataset'):
+        self.dataset = dataset
+        self.sessions: Dict[str, float] = {}
+        self.last_used = time.monotonic()
+
+    @property
+    def refs(self) -> int:
+        return len(self.sessions)
+
+
+class DatasetPool:
+    """
+    Datasets compartilhados entre as sessões do processo, identificados pelo hash do upload.
+
+    Cada sessão que usa um dataset conta uma referência; o dataset é somente leitura, então
+    todas as sessões recebem a mesma instância. Um dataset sem referências fica disponível por
+    `idle_seconds` e depois é descartado, junto com as cópias colunares em disco. Como o
+    navegador não avisa quando uma sessão termina, a referência expira após `session_ttl`
+    segundos sem acesso. Acima de `max_bytes`, os datasets ociosos mais antigos são descartados
+    primeiro; datasets em uso nunca são removidos.
+    """
+
+    def __init__(self, max_bytes: int = 4096 * 1024 * 1024, idle_seconds: float = 900,
+                 session_ttl: float = 3600, sweep_interval: float = 60):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.session_ttl = session_ttl
+        self.sweep_interval = sweep_interval
+        self._entries: 'OrderedDict[str, PoolEntry]' = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._janitor = None
+        self.loads = 0
+        self.shared = 0
+        self.evictions = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.dataset.nbytes for entry in self._entries.values())
+
+    def acquire(self, session_id: str, key: str,
+                loader: Callable[[], Optional['NFeDataset']]) -> Optional['NFeDataset']:
+        """
+        Retorna o dataset `key` para a sessão, carregando-o com `loader` se ainda não estiver no pool.
+
+        Sessões que pedem o mesmo dataset ao mesmo tempo esperam um único carregamento.
+        Levanta PoolMemoryError se o dataset novo não couber no limite de memória.
+        """
+        self._ensure_janitor()
+        with self._lock:
+            dataset = self._attach(session_id, key)
+            if dataset is not None:
+                self.shared += 1
+                return dataset
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                # Outra sessão pode ter concluído o carregamento enquanto esta esperava
+                dataset = self._attach(session_id, key)
+                if dataset is not None:
+                    self.shared += 1
+                    return dataset
+            try:
+                dataset = loader()
+            except Exception:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            with self._lock:
+                self._loading.pop(key, None)
+                if dataset is None:
+                    return None
+                self.loads += 1
+                self._entries[key] = PoolEntry(dataset)
+                self._attach(session_id, key)
+                removed = self._evict()
+                rejected = self.total_bytes > self.max_bytes and len(self._entries) > 1
+                if rejected:
+                    removed.append((key, self._entries.pop(key)))
+        self._cleanup(removed)
+        if rejected:
+            raise PoolMemoryError(
+                f"Limite de memória de {self.max_bytes / 1024 ** 2:.0f} MB atingido pelos datasets em uso "
+                f"({dataset.nbytes / 1024 ** 2:.1f} MB necessários); tente novamente mais tarde."
+            )
+        return dataset
+
+    def release(self, session_id: str, key: Optional[str] = None) -> None:
+        """
+        Libera a referência da sessão ao dataset `key` (sem `key`, a todos os datasets da sessão).
+        """
+        now = time.monotonic()
+        with self._lock:
+            for entry_key, entry in self._entries.items():
+                if (key is None or entry_key == key) and entry.sessions.pop(session_id, None) is not None:
+                    entry.last_used = now
+        self.sweep()
+
+    def sweep(self) -> int:
+        """
+        Expira referências de sessões inativas e descarta os datasets ociosos há mais de
+        `idle_seconds` ou acima do limite de memória. Retorna quantos datasets foram descartados.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for entry in self._entries.values():
+                # O tempo ocioso conta a partir do último acesso, registrado em `last_used`
+                for session_id in [s for s, seen in entry.sessions.items() if now - seen > self.session_ttl]:
+                    del entry.sessions[session_id]
+            idle = [key for key, entry in self._entries.items()
+                    if entry.refs == 0 and now - entry.last_used > self.idle_seconds]
+            removed = [(key, self._entries.pop(key)) for key in idle]
+            removed += self._evict()
+        self._cleanup(removed)
+        return len(removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'datasets': len(self._entries),
+                'sessions': len({s for entry in self._entries.values() for s in entry.sessions}),
+                'mb': self.total_bytes / 1024 ** 2,
+                'loads': self.loads,
+                'shared': self.shared,
+                'evictions': self.evictions,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            removed = list(self._entries.items())
+            self._entries.clear()
+        self._cleanup(removed)
+
+    def _attach(self, session_id: str, key: str) -> Optional['NFeDataset']:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        entry.sessions[session_id] = now
+        entry.last_used = now
+        self._entries.move_to_end(key)
+        return entry.dataset
+
+    def _evict(self) -> list:
+        # Remove os datasets sem referências, do menos recente ao mais recente, até caber no limite
+        removed = []
+        for key in [k for k, entry in self._entries.items() if entry.refs == 0]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            removed.append((key, self._entries.pop(key)))
+        return removed
+
+    def _cleanup(self, removed: list) -> None:
+        if removed:
+            with self._lock:
+                self.evictions += len(removed)
+        # Fora do lock: remover arquivos não bloqueia as demais sessões
+        for key, entry in removed:
+            dataset_cache.invalidate(key)
+            # Conexões com o banco local abertas pelas threads das sessões
+            entry.dataset.close()
+            for path in entry.dataset.artifacts:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Não foi possível remover {path}: {str(e)}")
+            logger.info(f"Dataset {key[:12]} descartado do pool ({entry.dataset.nbytes / 1024 ** 2:.1f} MB, "
+                        f"{len(entry.dataset.artifacts)} arquivos temporários removidos)")
+
+    def _ensure_janitor(self) -> None:
+        # Thread de fundo que descarta datasets ociosos mesmo sem novas requisições
+        with self._lock:
+            if self._janitor is None and self.sweep_interval > 0:
+                self._janitor = threading.Thread(target=self._run_janitor, name='nfe-dataset-pool', daemon=True)
+                self._janitor.start()
+
+    def _run_janitor(self) -> None:
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Erro na limpeza do pool de datasets: {str(e)}")
+
+
+dataset_pool = DatasetPool(
+    max_bytes=int(os.getenv("NFE_POOL_MAX_MB", "4096")) * 1024 * 1024,
+    idle_seconds=float(os.getenv("NFE_POOL_IDLE_SECONDS", "900")),
+    session_ttl=float(os.getenv("NFE_POOL_SESSION_TTL", "3600"))
+)
+
+
+def acquire_upload(session_state: MutableMapping, zip_bytes: bytes, dataset_key: str) -> Optional['NFeDataset']:
+    """
+    Obtém o dataset do upload no pool para a sessão de `session_state` (ex.: `st.session_state`),
+    liberando o upload anterior da mesma sessão.
+    """
+    session_id = session_state.setdefault('session_id', uuid.uuid4().hex)
+    previous_key = session_state.get('dataset_key')
+    if previous_key is not None and previous_key != dataset_key:
+        dataset_pool.release(session_id, previous_key)
+    session_state['dataset_key'] = dataset_key
+    return dataset_pool.acquire(session_id, dataset_key, lambda: load_dataset_from_zip(zip_bytes, dataset_key))
@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import logging
+import sqlite3
+import argparse
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from agent_core.aggregates import DATE_DIMENSIONS
+from agent_core.money import exceeds, from_cents, to_cents
+from agent_core.tools.consistency_validation import _divergence_report
+from agent_core.tools.header_analysis import find_duplicate_note_numbers
+from agent_core.tools.report import render_report
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+UF_COLUMNS = ['UF EMITENTE', 'UF DESTINATÁRIO']
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notas (
+    chave TEXT PRIMARY KEY,
+    ordem INTEGER,                  -- ordem de chegada da nota (nulo: só itens recebidos)
+    valor REAL,                     -- VALOR NOTA FISCAL
+    soma INTEGER NOT NULL DEFAULT 0,  -- soma dos itens, em centavos
+    numero INTEGER,
+    divergente INTEGER NOT NULL DEFAULT 0,
+    duplicado INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS notas_numero ON notas (numero);
+CREATE INDEX IF NOT EXISTS notas_divergentes ON notas (ordem) WHERE divergente = 1;
+CREATE INDEX IF NOT EXISTS notas_duplicadas ON notas (ordem) WHERE duplicado = 1;
+CREATE TABLE IF NOT EXISTS por_mes (ano_mes TEXT PRIMARY KEY, quantidade INTEGER, soma REAL);
+CREATE TABLE IF NOT EXISTS por_uf (coluna TEXT, uf TEXT, quantidade INTEGER, PRIMARY KEY (coluna, uf));
+CREATE TABLE IF NOT EXISTS contadores (nome TEXT PRIMARY KEY, valor INTEGER);
+"""
+
+
+class IncrementalValidator:
+    """
+    Estado persistente da validação, atualizado apenas com as notas e itens novos (deltas).
+
+    O estado fica num banco SQLite (`path`; em memória por padrão) com uma linha por
+    'CHAVE DE ACESSO': VALOR NOTA FISCAL, soma acumulada dos itens em centavos, NÚMERO e as
+    marcas de nota divergente e de número duplicado, além dos agregados por mês e por UF.
+    Cada `apply` grava somente as chaves tocadas pelo delta numa transação, então o custo
+    depende do tamanho do delta e não do histórico. Os relatórios são os mesmos das
+    ferramentas sobre o dataset completo.
+
+    O modo é de acréscimo: uma nota cuja chave já foi recebida é ignorada (com aviso); itens
+    novos de uma nota existente somam-se aos anteriores.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _counter(self, nome: str) -> int:
+        row = self._db.execute("SELECT valor FROM contadores WHERE nome = ?", (nome,)).fetchone()
+        return row[0] if row else 0
+
+    def _add_counter(self, nome: str, delta: int) -> None:
+        self._db.execute("INSERT INTO contadores VALUES (?, ?) "
+                         "ON CONFLICT (nome) DO UPDATE SET valor = valor + excluded.valor", (nome, delta))
+
+    def _temp_keys(self, table: str, chaves: List[str]) -> None:
+        self._db.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table} (chave TEXT PRIMARY KEY)")
+        self._db.execute(f"DELETE FROM {table}")
+        self._db.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?)", ((c,) for c in chaves))
+
+    def apply(self, cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame) -> Dict[str, float]:
+        """
+        Incorpora um delta de notas e itens e atualiza divergências, duplicados e agregados.
+        """
+        start = time.perf_counter()
+        tocadas = []
+        novas = cabecalho_df.iloc[0:0]
+
+        with self._db:
+            if not cabecalho_df.empty:
+                chaves = cabecalho_df['CHAVE DE ACESSO'].astype(str)
+                self._temp_keys('delta', chaves.unique().tolist())
+                recebidas = {row[0] for row in self._db.execute(
+                    "SELECT chave FROM delta JOIN notas USING (chave) WHERE ordem IS NOT NULL")}
+                repetidas = chaves.duplicated() | chaves.isin(recebidas)
+                if repetidas.any():
+                    logger.warning(f"{int(repetidas.sum())} notas já recebidas foram ignoradas no delta")
+                novas = cabecalho_df[~repetidas.to_numpy()]
+                self._add_notes(novas, chaves[~repetidas].tolist())
+                tocadas.extend(chaves[~repetidas].tolist())
+
+            if not itens_df.empty:
+                # Somas em centavos inteiros: acumular deltas não acumula erro de float
+                somas = pd.Series(to_cents(itens_df['VALOR TOTAL']), index=itens_df.index) \
+                          .groupby(itens_df['CHAVE DE ACESSO'].astype(str), sort=False).sum()
+                self._db.executemany(
+                    "INSERT INTO notas (chave, soma) VALUES (?, ?) "
+                    "ON CONFLICT (chave) DO UPDATE SET soma = soma + excluded.soma",
+                    zip(somas.index.tolist(), somas.astype('int64').tolist())
+                )
+                self._add_counter('itens', len(itens_df))
+                tocadas.extend(somas.index.tolist())
+
+            if tocadas:
+                self._update_divergences(tocadas)
+
+        stats = {
+            'notas_novas': len(novas),
+            'itens_novos': len(itens_df),
+            'chaves_tocadas': len(tocadas),
+            'segundos': round(time.perf_counter() - start, 6),
+        }
+        logger.info(f"Delta incorporado: {stats}")
+        return stats
+
+    def _add_notes(self, novas: pd.DataFrame, chaves: List[str]) -> None:
+        primeira = self._counter('notas')
+        valores = novas['VALOR NOTA FISCAL'].astype('float64').tolist()
+        numeros = novas['NÚMERO'].astype(object).where(novas['NÚMERO'].notna(), None).tolist() \
+            if 'NÚMERO' in novas.columns else [None] * len(novas)
+        self._db.executemany(
+            "INSERT INTO notas (chave, ordem, valor, numero) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (chave) DO UPDATE SET ordem = excluded.ordem, valor = excluded.valor, "
+            "numero = excluded.numero",
+            ((chave, primeira + i, None if np.isnan(valor) else valor, numero)
+             for i, (chave, valor, numero) in enumerate(zip(chaves, valores, numeros)))
+        )
+        self._add_counter('notas', len(chaves))
+        # Só os números do delta podem ter passado a se repetir
+        repetidos = [numero for numero in set(numeros) if numero is not None]
+        self._db.executemany(
+            "UPDATE notas SET duplicado = 1 WHERE numero = ? AND ordem IS NOT NULL "
+            "AND (SELECT COUNT(*) FROM notas WHERE numero = ? AND ordem IS NOT NULL) > 1",
+            ((numero, numero) for numero in repetidos)
+        )
+        self._add_aggregates(novas)
+
+    def _update_divergences(self, chaves: List[str]) -> None:
+        self._temp_keys('tocadas', chaves)
+        linhas = self._db.execute(
+            "SELECT chave, valor, soma FROM tocadas JOIN notas USING (chave) WHERE ordem IS NOT NULL"
+        ).fetchall()
+        if not linhas:
+            return
+        chaves, valores, somas = zip(*linhas)
+        valores = np.array(valores, dtype='float64')
+        divergente = ~np.isnan(valores) & exceeds(to_cents(valores) - np.array(somas, dtype='int64'), 'nota_itens')
+        self._db.executemany("UPDATE notas SET divergente = ? WHERE chave = ?",
+                             zip(divergente.astype(int).tolist(), chaves))
+
+    def _add_aggregates(self, novas: pd.DataFrame) -> None:
+        if 'DATA EMISSÃO' in novas.columns:
+            datas = novas['DATA EMISSÃO'].dropna()
+            meses = DATE_DIMENSIONS['ANO_MES'](datas).astype(str).rename('ANO_MES')
+            valores = novas['VALOR NOTA FISCAL'].fillna(0).loc[datas.index]
+            por_mes = valores.groupby(meses).agg(['size', 'sum'])
+            self._db.executemany(
+                "INSERT INTO por_mes VALUES (?, ?, ?) ON CONFLICT (ano_mes) DO UPDATE SET "
+                "quantidade = quantidade + excluded.quantidade, soma = soma + excluded.soma",
+                zip(por_mes.index.tolist(), por_mes['size'].tolist(), por_mes['sum'].tolist())
+            )
+        for col in UF_COLUMNS:
+            if col in novas.columns:
+                contagem = novas[col].astype(object).value_counts()
+                self._db.executemany(
+                    "INSERT INTO por_uf VALUES (?, ?, ?) ON CONFLICT (coluna, uf) DO UPDATE SET "
+                    "quantidade = quantidade + excluded.quantidade",
+                    ((col, uf, n) for uf, n in zip(contagem.index.tolist(), contagem.tolist()))
+                )
+
+    def consistency_report(self, max_rows: Optional[int] = None) -> str:
+        """
+        Mesmo relatório de `validate_nfe_consistency` sobre todas as notas recebidas.
+        """
+        if self._counter('notas') == 0 or self._counter('itens') == 0:
+            return "Dados de cabeçalho ou itens não disponíveis para validação de consistência."
+        linhas = self._db.execute(
+            "SELECT chave, valor, soma FROM notas WHERE divergente = 1 ORDER BY ordem").fetchall()
+        chaves, valores, somas = zip(*linhas) if linhas else ([], [], [])
+        notas = pd.DataFrame({'CHAVE DE ACESSO': list(chaves),
+                              'VALOR NOTA FISCAL': np.array(valores, dtype='float64')})
+        return _divergence_report(notas, from_cents(np.array(somas, dtype='int64')), max_rows)
+
+    def duplicates_report(self, max_rows: Optional[int] = None) -> str:
+        """
+        Mesmo relatório de `find_duplicate_note_numbers`, a partir apenas das notas com número repetido.
+        """
+        if self._counter('notas') == 0:
+            return "Dados de cabeçalho não disponíveis."
+        linhas = self._db.execute(
+            "SELECT numero, chave FROM notas WHERE duplicado = 1 ORDER BY ordem").fetchall()
+        if not linhas:
+            return "Nenhum número de nota fiscal duplicado encontrado."
+        numeros, chaves = zip(*linhas)
+        notas = pd.DataFrame({
+            'NÚMERO': pd.array(list(numeros), dtype='Int64'),
+            'CHAVE DE ACESSO': list(chaves),
+        })
+        return find_duplicate_note_numbers(notas, max_rows)
+
+    def month_report(self) -> str:
+        """
+        Mesmo relatório de `total_value_by_month`.
+        """
+        por_mes = pd.read_sql_query("SELECT ano_mes AS ANO_MES, soma AS \"VALOR NOTA FISCAL\" "
+                                    "FROM por_mes ORDER BY ano_mes", self._db)
+        if por_mes.empty:
+            return "Não há dados de emissão válidos para análise temporal."
+        return render_report(
+            "Valor Total das Notas Fiscais por Mês:\n\n",
+            por_mes, "- {}: R$ {:.2f}\n", ['ANO_MES', 'VALOR NOTA FISCAL']
+        )
+
+    def uf_report(self, col: str = 'UF EMITENTE') -> str:
+        """
+        Mesmo relatório de `count_notes_by_uf_emitter` (ou `_recipient`, com 'UF DESTINATÁRIO').
+        """
+        titulo = 'Emitente' if col == 'UF EMITENTE' else 'Destinatário'
+        linhas = self._db.execute("SELECT uf, quantidade FROM por_uf WHERE coluna = ? AND quantidade > 0 "
+                                  "ORDER BY uf", (col,)).fetchall()
+        contagem = pd.Series(dict(linhas), dtype='int64').sort_values(ascending=False, kind='stable')
+        if contagem.empty:
+            return f"Nenhuma UF de {titulo.lower()} encontrada."
+        return render_report(
+            f"Contagem de Notas Fiscais por UF {titulo}:\n\n",
+            contagem.rename('Quantidade').rename_axis('UF').reset_index(),
+            "- {}: {} notas\n", ['UF', 'Quantidade']
+        )
+
+    def summary(self) -> dict:
+        """
+        Quantidade de notas e soma de VALOR NOTA FISCAL recebidas até agora.
+        """
+        soma, divergentes, duplicados = self._db.execute(
+            "SELECT TOTAL(valor) FILTER (WHERE ordem IS NOT NULL), TOTAL(divergente), "
+            "COUNT(DISTINCT numero) FILTER (WHERE duplicado = 1) FROM notas").fetchone()
+        return {'quantidade': self._counter('notas'), 'itens': self._counter('itens'), 'soma': float(soma),
+                'divergentes': int(divergentes), 'numeros_duplicados': duplicados}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Incorpora um delta de Cabecalho/Itens ao estado salvo e revalida apenas as notas tocadas."
+    )
+    parser.add_argument("state", help="Banco SQLite do estado incremental (criado se não existir)")
+    parser.add_argument("data", help="Arquivo ZIP ou pasta com os CSVs Cabecalho/Itens do delta")
+    parser.add_argument("--max-rows", type=int, default=20, help="Registros listados por relatório")
+    args = parser.parse_args(argv)
+
+    from agent_core.dataset import load_dataset, load_dataset_from_zip
+    from agent_core.utils import find_data_files
+
+    if os.path.isdir(args.data):
+        dataset = load_dataset(args.data, find_data_files)
+    else:
+        with open(args.data, "rb") as f:
+            dataset = load_dataset_from_zip(f.read())
+    if dataset is None:
+        print("Não foi possível carregar os arquivos de Cabeçalho e Itens.", file=sys.stderr)
+        return 1
+
+    validator = IncrementalValidator(args.state)
+    validator.apply(*dataset.frames())
+    for report in (validator.consistency_report(args.max_rows), validator.duplicates_report(args.max_rows),
+                   validator.month_report(), validator.uf_report('UF EMITENTE'), validator.uf_report('UF DESTINATÁRIO')):
+        print(report.rstrip() + "\n")
+    validator.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
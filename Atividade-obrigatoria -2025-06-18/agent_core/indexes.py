@@ -0,0 +1,92 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class KeyIndex:
+    """
+    Índice hash de uma coluna: chave → posições das linhas que a contêm.
+
+    As chaves distintas são codificadas uma vez (`codes` tem o código de cada linha,
+    -1 para nulos) e as posições ficam agrupadas por código, então uma consulta custa
+    O(tamanho do resultado). As chaves são comparadas como texto, como em
+    `df[col].astype(str) == str(valor)`.
+    """
+
+    def __init__(self, series: pd.Series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Coluna em dicionário: os códigos da categoria já são os códigos do índice
+            codes, uniques = series.cat.codes.to_numpy().astype(np.intp), series.cat.categories
+        else:
+            codes, uniques = pd.factorize(series, sort=False)
+        self.codes = codes
+        self.uniques = pd.Index(uniques)
+        if pd.api.types.infer_dtype(self.uniques, skipna=False) == 'string':
+            self._lookup = self.uniques
+        else:
+            self._lookup = pd.Index(self.uniques.astype(str))
+        valid = codes >= 0
+        # Ordenação estável: dentro de cada chave as posições seguem a ordem original das linhas
+        self._order = np.argsort(codes, kind='stable')[int((~valid).sum()):]
+        counts = np.bincount(codes[valid], minlength=len(self.uniques))
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def __len__(self) -> int:
+        return len(self.uniques)
+
+    def group_sizes(self) -> np.ndarray:
+        """
+        Quantidade de linhas de cada chave, na ordem de `uniques`.
+        """
+        return np.diff(self._offsets)
+
+    def positions_for_code(self, code: int) -> np.ndarray:
+        return self._order[self._offsets[code]:self._offsets[code + 1]]
+
+    def positions(self, key) -> np.ndarray:
+        """
+        Posições (iloc) das linhas cuja chave é `key`, em ordem crescente.
+        """
+        code = self._lookup.get_indexer([str(key)])[0]
+        if code < 0:
+            return np.array([], dtype=np.intp)
+        return self.positions_for_code(code)
+
+    def codes_for(self, keys: pd.Series) -> np.ndarray:
+        """
+        Código de cada chave de `keys` neste índice (-1 quando ausente); usado para junções.
+        """
+        return self._lookup.get_indexer(keys.astype(str))
+
+
+class NFeIndexes:
+    """
+    Índices das colunas de consulta pontual do dataset, construídos no carregamento.
+    """
+
+    def __init__(self, cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame):
+        self.chave_cabecalho = self._build(cabecalho_df, 'CHAVE DE ACESSO')
+        self.chave_itens = self._build(itens_df, 'CHAVE DE ACESSO')
+        self.cnpj_emitente = self._build(cabecalho_df, 'CPF/CNPJ Emitente')
+        self.numero = self._build(cabecalho_df, 'NÚMERO')
+        self.ncm = self._build(itens_df, 'CÓDIGO NCM/SH')
+
+    @staticmethod
+    def _build(df: pd.DataFrame, col: str):
+        if col not in df.columns:
+            return None
+        index = KeyIndex(df[col])
+        logger.info(f"Índice de '{col}' criado com {len(index)} chaves")
+        return index
+
+
+def build_indexes(dataset) -> NFeIndexes:
+    return NFeIndexes(dataset.cabecalho_df, dataset.itens_df)
@@ -0,0 +1,134 @@
+import io
+import os
+import logging
+import zipfile
+from typing import List, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from agent_core.columnar import columnar_path, is_available, read_columnar, read_csv_typed, read_excel_typed, write_columnar
+from agent_core.utils import DATA_EXTENSIONS
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# Limites contra ZIPs maliciosos (zip bombs)
+MAX_UNCOMPRESSED_BYTES = int(os.getenv("NFE_ZIP_MAX_MB", "4096")) * 1024 * 1024
+MAX_COMPRESSION_RATIO = int(os.getenv("NFE_ZIP_MAX_RATIO", "500"))
+MAX_MEMBERS = int(os.getenv("NFE_ZIP_MAX_MEMBERS", "1000"))
+
+
+class ZipBombError(ValueError):
+    """
+    ZIP cujo conteúdo descompactado ultrapassa os limites permitidos.
+    """
+
+
+class _MemberReader(io.RawIOBase):
+    """
+    Leitura em fluxo de um membro do ZIP, interrompida se descompactar mais bytes do que o permitido.
+
+    O tamanho declarado no diretório do ZIP pode ser falso, por isso os bytes são contados na leitura.
+    `seek(0)` reabre o membro (usado na releitura com coerção de tipos).
+    """
+
+    def __init__(self, zf: zipfile.ZipFile, info: zipfile.ZipInfo, limit: int):
+        self._zf = zf
+        self._info = info
+        self._limit = limit
+        self.name = info.filename
+        self._open()
+
+    def _open(self) -> None:
+        self._stream = self._zf.open(self._info)
+        self._read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Somente seek(0) é suportado")
+        self._stream.close()
+        self._open()
+        return 0
+
+    def tell(self) -> int:
+        return self._read
+
+    def readinto(self, buffer) -> int:
+        data = self._stream.read(len(buffer))
+        self._read += len(data)
+        if self._read > self._limit:
+            raise ZipBombError(f"O arquivo {self.name} excede o limite de {self._limit} bytes descompactados")
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        self._stream.close()
+        super().close()
+
+
+def data_members(zf: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """
+    Membros de dados do ZIP (.csv/.xlsx/.xls), validados contra os limites de descompactação.
+    """
+    infos = zf.infolist()
+    if len(infos) > MAX_MEMBERS:
+        raise ZipBombError(f"O ZIP tem {len(infos)} arquivos (limite: {MAX_MEMBERS})")
+
+    members = [
+        info for info in infos
+        if not info.is_dir()
+        and not os.path.basename(info.filename).startswith('.')
+        and '__MACOSX' not in info.filename
+        and info.filename.lower().endswith(DATA_EXTENSIONS)
+    ]
+    total = sum(info.file_size for info in members)
+    if total > MAX_UNCOMPRESSED_BYTES:
+        raise ZipBombError(f"Conteúdo descompactado de {total} bytes excede o limite de {MAX_UNCOMPRESSED_BYTES}")
+    for info in members:
+        if info.compress_size and info.file_size / info.compress_size > MAX_COMPRESSION_RATIO:
+            raise ZipBombError(f"Taxa de compressão suspeita em {info.filename}")
+    return members
+
+
+def _read_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> pd.DataFrame:
+    # O limite por membro é o tamanho declarado (nunca acima do limite global)
+    limit = min(info.file_size, MAX_UNCOMPRESSED_BYTES)
+    with _MemberReader(zf, info, limit) as stream:
+        if info.filename.lower().endswith('.csv'):
+            return read_csv_typed(stream)
+        # Planilhas precisam de acesso aleatório: o membro é lido para a memória, sem passar pelo disco
+        buffer = io.BytesIO(stream.read())
+    buffer.name = info.filename
+    return read_excel_typed(buffer)
+
+
+def load_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo, cache_key: Optional[str] = None) -> pd.DataFrame:
+    """
+    Carrega um membro do ZIP diretamente do buffer, sem extraí-lo.
+
+    Com `cache_key`, reaproveita (ou cria) o arquivo colunar do membro, como em `load_table`.
+    """
+    target = columnar_path(info.filename, cache_key) if cache_key and is_available() else None
+    if target and os.path.exists(target):
+        logger.info(f"Lendo arquivo colunar: {target}")
+        return read_columnar(target)
+
+    logger.info(f"Lendo {info.filename} diretamente do ZIP")
+    df = _read_member(zf, info)
+    if target:
+        write_columnar(df, target)
+    return df
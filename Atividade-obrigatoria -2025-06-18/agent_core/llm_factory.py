@@ -1,5 +1,6 @@
 import os
 import logging
+import threading
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 
@@ -13,26 +14,75 @@ logger = logging.getLogger(__name__)
 # Carrega variáveis de ambiente
 load_dotenv()
 
-def get_llm():
-    """
-    Retorna uma instância do LLM configurada.
-    """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY não encontrada no arquivo .env")
-    
-    logger.info("Inicializando ChatGoogleGenerativeAI...")
-    try:
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-pro",
+DEFAULT_MODEL = "gemini-2.0-flash"
+# Resposta do provedor "fake": encerra o agente ReAct na primeira chamada
+FAKE_RESPONSE = "Final Answer: Resposta de teste."
+
+# Um cliente por configuração (provedor, modelo, endpoint), compartilhado por todo o processo.
+# O cliente do Gemini é configurado globalmente (genai.configure); reconstruí-lo a cada
+# pergunta recriaria o transporte e descartaria as conexões abertas.
+_llms = {}
+_llms_lock = threading.Lock()
+
+
+def _config() -> tuple:
+    provider = os.getenv("LLM_PROVIDER", "google-genai").strip().lower()
+    model = os.getenv("LLM_MODEL", DEFAULT_MODEL)
+    endpoint = os.getenv("GOOGLE_API_ENDPOINT") or None
+    return provider, model, endpoint
+
+
+def _build_llm(provider: str, model: str, endpoint: str):
+    if provider in ("google-genai", "google", "gemini"):
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY não encontrada no arquivo .env")
+
+        kwargs = {}
+        if endpoint:
+            # Endpoint alternativo (ex.: servidor fake local em testes) usa o transporte REST
+            kwargs["client_options"] = {"api_endpoint": endpoint}
+            kwargs["transport"] = "rest"
+        logger.info(f"Inicializando ChatGoogleGenerativeAI ({model})...")
+        return ChatGoogleGenerativeAI(
+            model=model,
             google_api_key=api_key,
             temperature=0.7,
-            convert_system_message_to_human=True
+            convert_system_message_to_human=True,
+            model_kwargs={"generation_config": {"temperature": 0.7}},
+            **kwargs
         )
-        logger.info("ChatGoogleGenerativeAI inicializado com sucesso!")
-        return llm
-    except Exception as e:
-        logger.error(f"Erro ao inicializar ChatGoogleGenerativeAI: {str(e)}")
-        raise
+    if provider == "fake":
+        # Modelo de chat fake: responde em fluxo (caractere a caractere), como o Gemini
+        from langchain_community.chat_models.fake import FakeListChatModel
+        logger.info("Inicializando LLM fake (sem acesso à rede)")
+        return FakeListChatModel(responses=[os.getenv("FAKE_LLM_RESPONSE", FAKE_RESPONSE)])
     # Adicione outros provedores aqui (OpenAI, VertexAI, etc)
-    raise ValueError("LLM provider não suportado ou não configurado.") 
\ No newline at end of file
+    raise ValueError("LLM provider não suportado ou não configurado.")
+
+
+def get_llm():
+    """
+    Retorna a instância do LLM configurada, compartilhada entre perguntas e sessões.
+
+    Provedor, modelo e endpoint vêm de LLM_PROVIDER, LLM_MODEL e GOOGLE_API_ENDPOINT;
+    a instância é criada uma única vez por combinação.
+    """
+    config = _config()
+    with _llms_lock:
+        if config not in _llms:
+            try:
+                _llms[config] = _build_llm(*config)
+                logger.info("LLM inicializado com sucesso!")
+            except Exception as e:
+                logger.error(f"Erro ao inicializar o LLM: {str(e)}")
+                raise
+        return _llms[config]
+
+
+def reset_llm() -> None:
+    """
+    Descarta os clientes criados (ex.: após trocar a chave de API ou em testes).
+    """
+    with _llms_lock:
+        _llms.clear()
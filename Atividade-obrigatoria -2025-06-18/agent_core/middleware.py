@@ -1,10 +1,3 @@
-import asyncio
-
-try:
-    asyncio.get_running_loop()
-except RuntimeError:
-    asyncio.set_event_loop(asyncio.new_event_loop())
-
 def middleware_chain(*middlewares):
     def chain(func):
         for middleware in reversed(middlewares):
@@ -0,0 +1,101 @@
+import os
+import logging
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+CENTS = 100
+# Abaixo deste limite as somas de centavos feitas em float64 são exatas (inteiros até 2**53)
+_EXACT_FLOAT_LIMIT = 2 ** 53
+
+
+def _tolerance(env: str, default: str) -> int:
+    # Tolerância configurada em reais, convertida para centavos
+    return int(round(float(os.getenv(env, default)) * CENTS))
+
+
+# Diferença máxima aceita (em centavos) por regra de validação
+TOLERANCES = {
+    'nota_itens': _tolerance("NFE_TOLERANCIA_NOTA_ITENS", "0.01"),  # VALOR NOTA FISCAL x soma dos itens
+    'item_total': _tolerance("NFE_TOLERANCIA_ITEM", "0.01"),        # VALOR TOTAL x QUANTIDADE * VALOR UNITÁRIO
+}
+
+
+def to_cents(values, na_value: int = 0) -> np.ndarray:
+    """
+    Converte valores em reais para centavos (int64), com arredondamento para o centavo mais próximo.
+
+    Um valor lido com duas casas decimais vira o inteiro exato, sem o erro do float;
+    valores ausentes viram `na_value`. Meio centavo é arredondado para longe do zero, como o
+    ROUND do banco local (`storage`), então as validações em pandas e em SQL marcam as mesmas linhas.
+    """
+    valores = np.asarray(values, dtype='float64') * CENTS
+    # Mesma conta do ROUND do SQLite: soma meio centavo com o sinal do valor e trunca
+    centavos = np.trunc(valores + np.copysign(0.5, valores))
+    ausentes = np.isnan(centavos)
+    if ausentes.any():
+        centavos[ausentes] = na_value
+    return centavos.astype(np.int64)
+
+
+def from_cents(cents) -> np.ndarray:
+    """
+    Centavos para reais (float64), apenas para exibição nos relatórios.
+    """
+    return np.asarray(cents, dtype=np.int64) / CENTS
+
+
+def sum_by_code(codes: np.ndarray, cents: np.ndarray, n_codes: int) -> np.ndarray:
+    """
+    Soma exata (int64) dos centavos por código (0..n_codes-1); códigos negativos são ignorados.
+    """
+    validos = codes >= 0
+    codes, cents = codes[validos], cents[validos]
+    if np.abs(cents).sum(dtype=np.float64) < _EXACT_FLOAT_LIMIT:
+        # Com todas as somas parciais abaixo de 2**53, o bincount em float64 não arredonda nada
+        return np.bincount(codes, weights=cents, minlength=n_codes).astype(np.int64)
+    somas = np.zeros(n_codes, dtype=np.int64)
+    np.add.at(somas, codes, cents)
+    return somas
+
+
+def exceeds(diff_cents: np.ndarray, rule: str) -> np.ndarray:
+    """
+    Máscara das diferenças (em centavos) acima da tolerância da regra.
+    """
+    return np.abs(diff_cents) > TOLERANCES[rule]
+
+
+class MoneyColumns:
+    """
+    Colunas monetárias somadas nas validações, em centavos (int64), convertidas uma única vez por dataset.
+    """
+
+    def __init__(self, itens_df: pd.DataFrame):
+        # VALOR TOTAL é a coluna somada por nota; as demais são comparadas linha a linha
+        self.valor_total = to_cents(itens_df['VALOR TOTAL']) if 'VALOR TOTAL' in itens_df.columns else None
+
+
+def build_money(dataset) -> MoneyColumns:
+    return MoneyColumns(dataset.itens_df)
+
+
+def item_total_cents(itens_df: pd.DataFrame, money: Optional[MoneyColumns] = None) -> np.ndarray:
+    """
+    VALOR TOTAL dos itens em centavos (ausentes como zero), reaproveitando `money` quando corresponde às linhas.
+    """
+    if money is not None and money.valor_total is not None and len(money.valor_total) == len(itens_df):
+        return money.valor_total
+    return to_cents(itens_df['VALOR TOTAL'])
@@ -0,0 +1,432 @@
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+TABLES = ('cabecalho', 'itens')
+DATE_COLUMN = 'DATA EMISSÃO'
+
+# Operadores de filtro aceitos (na consulta em JSON e em `Query.where`)
+OPERATORS = ('==', '!=', '>', '>=', '<', '<=', 'em', 'contem', 'nulo', 'nao_nulo')
+_OPERATOR_ALIASES = {'=': '==', 'in': 'em', 'contains': 'contem', 'isnull': 'nulo', 'notnull': 'nao_nulo'}
+
+# Funções de agregação: nome na consulta -> função do pandas
+AGGREGATIONS = {
+    'soma': 'sum',
+    'media': 'mean',
+    'contagem': 'size',
+    'minimo': 'min',
+    'maximo': 'max',
+    'distintos': 'nunique',
+}
+_AGGREGATION_ALIASES = {'sum': 'soma', 'mean': 'media', 'count': 'contagem', 'size': 'contagem',
+                        'min': 'minimo', 'max': 'maximo', 'nunique': 'distintos'}
+
+_ONE_DAY = pd.Timedelta(days=1)
+
+
+class QueryError(ValueError):
+    """
+    Consulta inválida: tabela, coluna, operador ou agregação desconhecidos.
+    """
+
+
+class Predicate(NamedTuple):
+    column: str
+    op: str
+    value: Any
+
+
+class Aggregation(NamedTuple):
+    name: str
+    column: Optional[str]
+    func: str
+
+
+class QueryResult(NamedTuple):
+    """
+    Resultado de `Query.execute`: o DataFrame final e quantas linhas passaram pelos filtros.
+    """
+    frame: pd.DataFrame
+    total: int
+
+
+def _date_only(value: Any) -> bool:
+    # '2024-03-15' (sem hora) compara o dia inteiro
+    return isinstance(value, str) and len(value.strip()) <= 10
+
+
+def _coerce(series: pd.Series, value: Any) -> Any:
+    """
+    Converte o valor da consulta (vindo de JSON) para o tipo da coluna.
+    """
+    if value is None:
+        return value
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return pd.Timestamp(value)
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return pd.to_numeric(value)
+    return str(value)
+
+
+def _compare(series: pd.Series, op: str, value: Any) -> pd.Series:
+    if op == 'nulo':
+        return series.isna()
+    if op == 'nao_nulo':
+        return series.notna()
+    if op == 'contem':
+        return series.astype(str).str.contains(str(value), case=False, regex=False, na=False) & series.notna()
+    if op == 'em':
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return series.isin([_coerce(series, v) for v in values])
+        return series.astype(str).isin([str(v) for v in values]) & series.notna()
+    target = _coerce(series, value)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype) and _date_only(value):
+        # Datas sem hora valem pelo dia inteiro: '<= 2024-03-31' inclui as notas das 23h
+        if op == '==':
+            return (series >= target) & (series < target + _ONE_DAY)
+        if op == '!=':
+            return ~((series >= target) & (series < target + _ONE_DAY))
+        if op == '<=':
+            return series < target + _ONE_DAY
+        if op == '>':
+            return series >= target + _ONE_DAY
+    elif isinstance(target, str) and not pd.api.types.is_string_dtype(series.dtype) \
+            and not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(str)
+    if op == '==':
+        return series == target
+    if op == '!=':
+        return series != target
+    if op == '>':
+        return series > target
+    if op == '>=':
+        return series >= target
+    if op == '<':
+        return series < target
+    return series <= target
+
+
+def _predicate_mask(series: pd.Series, op: str, value: Any) -> np.ndarray:
+    """
+    Máscara booleana de um filtro sobre a coluna.
+
+    Em colunas categóricas o filtro é avaliado uma vez por categoria distinta e propagado
+    pelos códigos, sem converter as linhas para texto.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype) and op not in ('nulo', 'nao_nulo'):
+        categories = pd.Series(series.cat.categories)
+        hits = np.append(_compare(categories, op, value).to_numpy(dtype=bool), False)
+        # O código -1 (nulo) aponta para o False acrescentado no fim
+        return hits[series.cat.codes.to_numpy()]
+    return _compare(series, op, value).to_numpy(dtype=bool)
+
+
+def _take(df: pd.DataFrame, columns: List[str], rows: Optional[np.ndarray]) -> pd.DataFrame:
+    """
+    Apenas as colunas e linhas pedidas, numa única cópia.
+    """
+    if rows is None:
+        return df.loc[:, columns]
+    return df.iloc[rows, [df.columns.get_loc(col) for col in columns]]
+
+
+def _top(df: pd.DataFrame, by: str, n: int, ascending: bool) -> pd.DataFrame:
+    # Seleção parcial (nlargest/nsmallest) em vez de ordenar tudo; empates na ordem atual das linhas
+    # (com n >= linhas o nlargest ordena tudo sem estabilidade; aí a ordenação estável é equivalente)
+    if n < len(df) and pd.api.types.is_numeric_dtype(df[by].dtype) and not pd.api.types.is_bool_dtype(df[by].dtype):
+        return df.nsmallest(n, by) if ascending else df.nlargest(n, by)
+    return df.sort_values(by, ascending=ascending, kind='stable').head(n)
+
+
+class Query:
+    """
+    Plano lazy de consulta sobre uma tabela do dataset: filtro → agrupamento → agregação → top-k.
+
+    Os métodos apenas descrevem a consulta e retornam um novo plano; nada é lido até `execute`.
+    Na execução, os filtros sobre DATA EMISSÃO descartam os períodos fora do intervalo antes de
+    ler as linhas (poda de partições), todos os filtros viram uma única máscara e só as colunas
+    usadas pela consulta são copiadas, já restritas às linhas selecionadas.
+    """
+
+    def __init__(self, table: str = 'cabecalho'):
+        if table not in TABLES:
+            raise QueryError(f"Tabela desconhecida: '{table}' (use {' ou '.join(TABLES)})")
+        self.table = table
+        self.predicates: Tuple[Predicate, ...] = ()
+        self.group_columns: Tuple[str, ...] = ()
+        self.aggregations: Tuple[Aggregation, ...] = ()
+        self.selected: Tuple[str, ...] = ()
+        self.order: Optional[Tuple[str, bool]] = None
+        self.top_n: Optional[int] = None
+        self.row_limit: Optional[int] = None
+
+    def _with(self, **changes) -> 'Query':
+        query = Query.__new__(Query)
+        query.__dict__.update(self.__dict__, **changes)
+        return query
+
+    def where(self, column: str, op: str, value: Any = None) -> 'Query':
+        op = _OPERATOR_ALIASES.get(op, op)
+        if op not in OPERATORS:
+            raise QueryError(f"Operador desconhecido: '{op}' (use {', '.join(OPERATORS)})")
+        return self._with(predicates=self.predicates + (Predicate(column, op, value),))
+
+    def group_by(self, *columns: str) -> 'Query':
+        return self._with(group_columns=self.group_columns + tuple(columns))
+
+    def agg(self, **aggregations: Tuple[Optional[str], str]) -> 'Query':
+        """
+        Agregações nomeadas: `agg(total=('VALOR NOTA FISCAL', 'soma'), notas=(None, 'contagem'))`.
+        """
+        parsed = []
+        for name, (column, func) in aggregations.items():
+            func = _AGGREGATION_ALIASES.get(func, func)
+            if func not in AGGREGATIONS:
+                raise QueryError(f"Agregação desconhecida: '{func}' (use {', '.join(AGGREGATIONS)})")
+            if column is None and func != 'contagem':
+                raise QueryError(f"A agregação '{name}' precisa de uma coluna")
+            parsed.append(Aggregation(name, column, func))
+        return self._with(aggregations=self.aggregations + tuple(parsed))
+
+    def select(self, *columns: str) -> 'Query':
+        return self._with(selected=tuple(columns))
+
+    def order_by(self, column: str, ascending: bool = False) -> 'Query':
+        return self._with(order=(column, ascending))
+
+    def top(self, n: int, by: Optional[str] = None, ascending: bool = False) -> 'Query':
+        query = self._with(top_n=int(n))
+        return query.order_by(by, ascending) if by is not None else query
+
+    def limit(self, n: Optional[int]) -> 'Query':
+        return self._with(row_limit=n)
+
+    @property
+    def is_aggregate(self) -> bool:
+        return bool(self.group_columns or self.aggregations)
+
+    def columns(self) -> List[str]:
+        """
+        Colunas da tabela lidas pela consulta (poda de colunas).
+        """
+        used = [p.column for p in self.predicates] + list(self.group_columns)
+        used += [a.column for a in self.aggregations if a.column is not None]
+        if not self.is_aggregate:
+            used += list(self.selected)
+            if self.order is not None:
+                used.append(self.order[0])
+        return list(dict.fromkeys(used))
+
+    def date_range(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        """
+        Intervalo de DATA EMISSÃO implicado pelos filtros, usado para descartar partições.
+        """
+        inicio = fim = None
+        for column, op, value in self.predicates:
+            if column != DATE_COLUMN or op not in ('==', '>', '>=', '<', '<='):
+                continue
+            try:
+                bound = pd.Timestamp(value)
+            except (TypeError, ValueError):
+                continue
+            # Limites conservadores: a máscara aplica depois o filtro exato
+            upper = bound + _ONE_DAY if _date_only(value) else bound
+            if op in ('==', '>', '>='):
+                inicio = bound if inicio is None else max(inicio, bound)
+            if op in ('==', '<', '<='):
+                fim = upper if fim is None else min(fim, upper)
+        return inicio, fim
+
+    def explain(self) -> str:
+        """
+        Descrição do plano, na ordem de execução.
+        """
+        inicio, fim = self.date_range()
+        steps = [f"tabela {self.table}"]
+        if inicio is not None or fim is not None:
+            steps.append(f"partições com {DATE_COLUMN} entre {inicio or '-inf'} e {fim or '+inf'}")
+        steps.append(f"colunas {self.columns() or 'todas'}")
+        steps += [f"filtro {p.column} {p.op} {p.value!r}" for p in self.predicates]
+        if self.group_columns:
+            steps.append(f"agrupar por {list(self.group_columns)}")
+        steps += [f"{a.name} = {a.func}({a.column or '*'})" for a in self.aggregations]
+        order = self.order
+        if order is None and self.top_n and self.is_aggregate:
+            order = ((self.aggregations[0].name if self.aggregations else 'contagem'), False)
+        if order is not None:
+            direction = 'crescente' if order[1] else 'decrescente'
+            steps.append(f"{'top ' + str(self.top_n) if self.top_n else 'ordenar'} por {order[0]} ({direction})")
+        elif self.top_n:
+            steps.append(f"primeiras {self.top_n} linhas")
+        if self.row_limit is not None:
+            steps.append(f"limite {self.row_limit}")
+        return " → ".join(steps)
+
+    def _source(self, source) -> pd.DataFrame:
+        if isinstance(source, pd.DataFrame):
+            return source
+        inicio, fim = self.date_range()
+        if hasattr(source, 'read_table'):
+            # Banco local (`SQLStore`): só as colunas usadas e, com filtro de data, só as linhas do intervalo
+            return source.read_table(self.table, self.columns(), inicio, fim)
+        cabecalho_df, itens_df = source.frames(inicio, fim)
+        return cabecalho_df if self.table == 'cabecalho' else itens_df
+
+    def _mask(self, df: pd.DataFrame) -> Optional[np.ndarray]:
+        mask = None
+        for column, op, value in self.predicates:
+            try:
+                hit = _predicate_mask(df[column], op, value)
+            except (TypeError, ValueError) as e:
+                raise QueryError(f"Filtro inválido em '{column}' ({op} {value!r}): {e}") from e
+            mask = hit if mask is None else mask & hit
+        return mask
+
+    def execute(self, source) -> QueryResult:
+        """
+        Executa o plano sobre um `NFeDataset` (com poda de partições), o banco local do dataset
+        (`SQLStore`) ou diretamente sobre um DataFrame.
+        """
+        df = self._source(source)
+        missing = [col for col in self.columns() if col not in df.columns]
+        if missing:
+            raise QueryError(f"Colunas ausentes na tabela {self.table}: {', '.join(missing)}")
+        mask = self._mask(df)
+        rows = None if mask is None else np.flatnonzero(mask)
+        total = len(df) if rows is None else len(rows)
+        if self.is_aggregate:
+            frame = self._aggregate(df, rows)
+        else:
+            frame = self._select_rows(df, rows)
+            if not self.selected and hasattr(source, 'read_rows'):
+                # Sem colunas escolhidas, só as linhas do resultado são lidas inteiras do banco
+                frame = source.read_rows(self.table, frame.index)
+        logger.info(f"Consulta: {self.explain()} ({total} linhas filtradas, {len(frame)} no resultado)")
+        return QueryResult(frame.reset_index(drop=True), total)
+
+    def _aggregate(self, df: pd.DataFrame, rows: Optional[np.ndarray]) -> pd.DataFrame:
+        aggregations = self.aggregations or (Aggregation('contagem', None, 'contagem'),)
+        # Os filtros já foram aplicados: só as chaves e as colunas agregadas são copiadas
+        used = list(self.group_columns) + [a.column for a in aggregations if a.column is not None]
+        sub = _take(df, list(dict.fromkeys(used)), rows)
+        if self.group_columns:
+            keys = list(self.group_columns)
+            named = {a.name: pd.NamedAgg(a.column or keys[0], AGGREGATIONS[a.func]) for a in aggregations}
+            result = sub.groupby(keys, observed=True, sort=True).agg(**named).reset_index()
+        else:
+            result = pd.DataFrame({
+                a.name: [len(sub) if a.func == 'contagem' else sub[a.column].agg(AGGREGATIONS[a.func])]
+                for a in aggregations
+            })
+        return self._rank(result, default_by=aggregations[0].name)
+
+    def _rank(self, result: pd.DataFrame, default_by: Optional[str] = None) -> pd.DataFrame:
+        by, ascending = self.order if self.order is not None else (default_by, False)
+        if by is not None and by not in result.columns:
+            raise QueryError(f"Não é possível ordenar por '{by}': não está no resultado")
+        if self.top_n and by is not None:
+            result = _top(result, by, self.top_n, ascending)
+        elif self.top_n:
+            result = result.head(self.top_n)
+        elif self.order is not None:
+            result = result.sort_values(by, ascending=ascending, kind='stable')
+        if self.row_limit is not None:
+            result = result.head(self.row_limit)
+        return result
+
+    def _select_rows(self, df: pd.DataFrame, rows: Optional[np.ndarray]) -> pd.DataFrame:
+        columns = list(self.selected) or list(df.columns)
+        if self.order is None:
+            # Sem ordenação, só as primeiras linhas selecionadas são copiadas
+            n = min(filter(None, (self.top_n, self.row_limit)), default=None)
+            if n is not None:
+                rows = np.arange(min(n, len(df))) if rows is None else rows[:n]
+            return _take(df, columns, rows)
+        by, ascending = self.order
+        # O top-k é escolhido só sobre a coluna de ordenação; as demais colunas são lidas depois
+        chave = df[by] if rows is None else df[by].iloc[rows]
+        chave = chave.reset_index(drop=True).to_frame()
+        escolhidas = self._rank(chave).index.to_numpy()
+        return _take(df, columns, escolhidas if rows is None else rows[escolhidas])
+
+
+def _column(value: Any, field: str) -> str:
+    # Nomes de coluna vindos do JSON: um campo ausente ou de outro tipo é erro da consulta
+    if not isinstance(value, str) or not value.strip():
+        raise QueryError(f"'{field}' deve ser o nome de uma coluna (recebido {value!r})")
+    return value
+
+
+def _columns(value: Any, field: str) -> List[str]:
+    return [_column(col, field) for col in ([value] if isinstance(value, str) else value)]
+
+
+def parse_query(spec) -> Query:
+    """
+    Monta o plano a partir da consulta em JSON (texto ou dict) usada pela ferramenta do agente.
+
+    Campos: tabela, filtros ([coluna, operador, valor] ou {coluna, op, valor}), mes ('AAAA-MM'),
+    periodo ({inicio, fim}), agrupar_por, agregacoes ({nome: [coluna, funcao]}), ordenar_por,
+    crescente, top, colunas e limite.
+    """
+    if isinstance(spec, str):
+        try:
+            spec = json.loads(spec.strip().strip('`'))
+        except json.JSONDecodeError as e:
+            raise QueryError(f"JSON inválido: {e}") from e
+    if not isinstance(spec, dict):
+        raise QueryError("A consulta deve ser um objeto JSON")
+
+    query = Query(str(spec.get('tabela', 'cabecalho')).strip().lower())
+    for filtro in spec.get('filtros') or []:
+        if isinstance(filtro, dict):
+            query = query.where(_column(filtro.get('coluna'), 'coluna'), filtro.get('op', '=='), filtro.get('valor'))
+        elif isinstance(filtro, (list, tuple)) and len(filtro) in (2, 3):
+            query = query.where(_column(filtro[0], 'coluna'), *filtro[1:])
+        else:
+            raise QueryError(f"Filtro inválido: {filtro!r}")
+    if spec.get('mes'):
+        try:
+            mes = pd.Period(str(spec['mes']), freq='M')
+        except ValueError as e:
+            raise QueryError(f"Mês inválido: {spec['mes']!r} (use AAAA-MM)") from e
+        query = query.where(DATE_COLUMN, '>=', mes.start_time).where(DATE_COLUMN, '<', (mes + 1).start_time)
+    periodo = spec.get('periodo') or {}
+    if not isinstance(periodo, dict):
+        raise QueryError("'periodo' deve ser {inicio, fim}")
+    if periodo.get('inicio'):
+        query = query.where(DATE_COLUMN, '>=', str(periodo['inicio']))
+    if periodo.get('fim'):
+        query = query.where(DATE_COLUMN, '<=', str(periodo['fim']))
+
+    try:
+        query = query.group_by(*_columns(spec.get('agrupar_por') or [], 'agrupar_por'))
+        agregacoes: Dict[str, Any] = spec.get('agregacoes') or {}
+        query = query.agg(**{nome: (definicao[0] if definicao[0] is None else _column(definicao[0], nome), definicao[1])
+                             if isinstance(definicao, (list, tuple)) else (None, definicao)
+                             for nome, definicao in agregacoes.items()})
+        if spec.get('colunas'):
+            query = query.select(*_columns(spec['colunas'], 'colunas'))
+    except (AttributeError, IndexError, TypeError) as e:
+        raise QueryError("Use listas de colunas em 'agrupar_por'/'colunas' e agregações {nome: [coluna, funcao]}") from e
+    if spec.get('ordenar_por'):
+        query = query.order_by(_column(spec['ordenar_por'], 'ordenar_por'), bool(spec.get('crescente', False)))
+    try:
+        if spec.get('top'):
+            query = query.top(int(spec['top']))
+        if spec.get('limite'):
+            query = query.limit(int(spec['limite']))
+    except (TypeError, ValueError) as e:
+        raise QueryError("'top' e 'limite' devem ser números inteiros") from e
+    return query
@@ -0,0 +1,217 @@
+import re
+import time
+import logging
+import threading
+from typing import Callable, List, NamedTuple, Optional
+
+from agent_core.indexes import build_indexes
+from agent_core.money import build_money
+from agent_core.storage import dataset_aggregates
+from agent_core.utils import normalize_text
+from agent_core.tools.sql_analysis import dataset_tool_functions
+from agent_core.tools.consistency_validation import validate_dataset_consistency
+from agent_core.tools.anomaly_audit import audit_anomalies
+from agent_core.tools.item_analysis import (
+    total_value_by_ncm_code,
+    list_items_by_access_key,
+    find_zero_unit_value_items,
+    find_negative_quantity_items
+)
+from agent_core.tools.header_analysis import (
+    count_notes_by_uf_emitter,
+    list_notes_by_cnpj_emitter,
+    count_notes_by_uf_recipient,
+    total_value_by_month,
+    count_notes_by_specific_date,
+    day_of_week_highest_emission,
+    count_notes_by_natureza_operacao,
+    find_negative_value_notes,
+    find_duplicate_note_numbers
+)
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Parâmetros reconhecidos na pergunta (já normalizada: minúsculas e sem acentos)
+CNPJ_PATTERN = re.compile(r'\b\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}\b')
+NCM_PATTERN = re.compile(r'\b\d{4}\.?\d{2}\.?\d{2}\b')
+CHAVE_PATTERN = re.compile(r'\b\d{44}\b')
+ISO_DATE_PATTERN = re.compile(r'\b(\d{4})-(\d{2})-(\d{2})\b')
+BR_DATE_PATTERN = re.compile(r'\b(\d{2})/(\d{2})/(\d{4})\b')
+
+
+def _digits(pattern: re.Pattern) -> Callable[[str], Optional[str]]:
+    def extract(text: str) -> Optional[str]:
+        match = pattern.search(text)
+        return re.sub(r'\D', '', match.group()) if match else None
+    return extract
+
+
+def _extract_date(text: str) -> Optional[str]:
+    match = ISO_DATE_PATTERN.search(text)
+    if match:
+        return match.group()
+    match = BR_DATE_PATTERN.search(text)
+    if match:
+        dia, mes, ano = match.groups()
+        return f"{ano}-{mes}-{dia}"
+    return None
+
+
+def _summary(dataset) -> str:
+    resumo = dataset_aggregates(dataset).summary()
+    return f"Total de notas: {resumo['quantidade']}, Valor total: R$ {resumo['soma']:,.2f}"
+
+
+def _header(tool: Callable, **kwargs) -> Callable:
+    return lambda ds, param: tool(ds.frames()[0], *([param] if param else []),
+                                  aggregates=dataset_aggregates(ds), **kwargs)
+
+
+def _audit(dataset) -> str:
+    return audit_anomalies(*dataset.frames(), max_rows=20, indexes=dataset.derived('indexes', build_indexes),
+                           money=dataset.derived('money', build_money))
+
+
+class Route(NamedTuple):
+    name: str
+    # Todos os padrões precisam aparecer na pergunta e nenhum dos excluídos
+    patterns: List[str]
+    excludes: List[str]
+    # Parâmetro obrigatório extraído da pergunta (None quando a rota não tem parâmetro)
+    extract: Optional[Callable[[str], Optional[str]]]
+    handler: Callable
+
+
+ROUTES = [
+    Route('validar_consistencia', [r'consisten|divergen'], [], None,
+          lambda ds, _: validate_dataset_consistency(ds)),
+    Route('identificar_anomalias', [r'anomalia|auditori'], [], None,
+          lambda ds, _: _audit(ds)),
+    Route('valor_total_por_mes', [r'\bmes\b|\bmeses\b|mensal', r'valor|total|soma'], [r'emit|destinat|natureza'], None,
+          _header(total_value_by_month)),
+    Route('contar_notas_por_uf_destinatario', [r'\bufs?\b|\bestados?\b', r'destinat|recebid'], [r'valor|soma|media'], None,
+          _header(count_notes_by_uf_recipient)),
+    Route('contar_notas_por_uf_emitente', [r'\bufs?\b|\bestados?\b', r'notas'], [r'destinat|recebid|valor|soma|media'], None,
+          _header(count_notes_by_uf_emitter)),
+    Route('contar_notas_por_data_especifica', [r'quant|numero de notas|notas'], [r'valor|soma|media'], _extract_date,
+          _header(count_notes_by_specific_date)),
+    Route('dia_semana_maior_emissao', [r'dia da semana'], [], None,
+          _header(day_of_week_highest_emission)),
+    Route('contar_notas_por_natureza_operacao', [r'natureza', r'quant|contar|numero de notas'], [r'valor|soma|media'], None,
+          _header(count_notes_by_natureza_operacao)),
+    Route('encontrar_numeros_nota_duplicados', [r'duplicad|repetid', r'numero'], [], None,
+          lambda ds, _: find_duplicate_note_numbers(ds.frames()[0], index=ds.derived('indexes', build_indexes).numero)),
+    Route('encontrar_notas_valor_negativo', [r'negativ', r'notas?\b'], [r'\biten|quantidade'], None,
+          lambda ds, _: find_negative_value_notes(ds.frames()[0])),
+    Route('encontrar_itens_quantidade_negativa', [r'negativ', r'quantidade'], [], None,
+          lambda ds, _: find_negative_quantity_items(ds.frames()[1])),
+    Route('encontrar_itens_valor_unitario_zerado', [r'valor unitario', r'zerad|\bzero\b'], [], None,
+          lambda ds, _: find_zero_unit_value_items(ds.frames()[1])),
+    Route('listar_notas_por_cnpj_emitente', [r'notas|emit'], [], _digits(CNPJ_PATTERN),
+          lambda ds, cnpj: list_notes_by_cnpj_emitter(ds.frames()[0], cnpj,
+                                                      index=ds.derived('indexes', build_indexes).cnpj_emitente)),
+    Route('valor_total_por_codigo_ncm', [r'\bncm\b'], [], _digits(NCM_PATTERN),
+          lambda ds, ncm: total_value_by_ncm_code(ds.frames()[1], ncm,
+                                                  index=ds.derived('indexes', build_indexes).ncm)),
+    Route('listar_itens_por_chave_acesso', [r'\biten|produto'], [], _digits(CHAVE_PATTERN),
+          lambda ds, chave: list_items_by_access_key(ds.frames()[1], chave,
+                                                     index=ds.derived('indexes', build_indexes).chave_itens)),
+    Route('analisar_cabecalhos', [r'(valor total|soma|total)( de todas)? (das|de) notas|quantas notas'],
+          [r'\bpor\b|\bmes|\bufs?\b|estado|municipio|natureza|emit|destinat|\bdata\b|\bdia\b|\biten|\d'], None,
+          lambda ds, _: _summary(ds)),
+]
+
+
+class IntentRouter:
+    """
+    Roteador determinístico executado antes do agente.
+
+    Uma pergunta só é respondida diretamente quando exatamente uma rota a reconhece
+    (e o parâmetro exigido pela rota foi encontrado); nos demais casos segue para o agente.
+    A economia de tempo é estimada pela duração média das execuções do agente.
+    Com NFE_STORAGE, as rotas com ferramenta SQL de mesmo nome são respondidas pelo banco local.
+    """
+
+    def __init__(self, routes: List[Route]):
+        self.routes = [
+            route._replace(patterns=[re.compile(p) for p in route.patterns],
+                           excludes=[re.compile(p) for p in route.excludes])
+            for route in routes
+        ]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._agent_seconds = 0.0
+        self._agent_runs = 0
+
+    def match(self, question: str):
+        """
+        Retorna (rota, parâmetro) quando a pergunta corresponde a uma única rota, ou None.
+        """
+        text = normalize_text(question)
+        matches = []
+        for route in self.routes:
+            if not all(p.search(text) for p in route.patterns) or any(p.search(text) for p in route.excludes):
+                continue
+            param = route.extract(text) if route.extract else None
+            if route.extract and param is None:
+                continue
+            matches.append((route, param))
+        return matches[0] if len(matches) == 1 else None
+
+    def route(self, question: str, dataset) -> Optional[str]:
+        """
+        Responde a pergunta diretamente pela ferramenta da rota, ou retorna None.
+        """
+        start = time.perf_counter()
+        matched = self.match(question)
+        if matched is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        route, param = matched
+        logger.info(f"Pergunta roteada diretamente para '{route.name}'")
+        sql_tools = dataset.derived('sql_tools', dataset_tool_functions)
+        # O resumo do roteador tem formato próprio; só os agregados dele vêm do banco
+        if sql_tools is not None and route.name in sql_tools and route.name != 'analisar_cabecalhos':
+            response = sql_tools[route.name](param or '')
+        else:
+            response = route.handler(dataset, param)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if response.startswith("Erro"):
+                # Falha da ferramenta: o agente ainda pode responder de outra forma
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self._agent_runs:
+                self.saved_seconds += max(self._agent_seconds / self._agent_runs - elapsed, 0.0)
+        return response
+
+    def record_agent(self, seconds: float) -> None:
+        """
+        Registra a duração de uma execução do agente (base da estimativa de economia).
+        """
+        with self._lock:
+            self._agent_seconds += seconds
+            self._agent_runs += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'saved_seconds': self.saved_seconds,
+            'avg_agent_seconds': self._agent_seconds / self._agent_runs if self._agent_runs else None,
+        }
+
+
+router = IntentRouter(ROUTES)
@@ -0,0 +1,135 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_float_dtype
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Tipos das colunas conhecidas dos datasets Cabecalho e Itens.
+# Chaves, CNPJs e códigos ficam como texto para preservar zeros à esquerda e os
+# 44 dígitos da chave de acesso; colunas de baixa cardinalidade viram categorias.
+STRING_COLUMNS = [
+    'CHAVE DE ACESSO', 'CPF/CNPJ Emitente', 'CNPJ DESTINATÁRIO',
+    'INSCRIÇÃO ESTADUAL EMITENTE', 'CÓDIGO NCM/SH', 'CFOP'
+]
+FLOAT_COLUMNS = ['VALOR NOTA FISCAL', 'VALOR UNITÁRIO', 'VALOR TOTAL', 'QUANTIDADE']
+INTEGER_COLUMNS = ['NÚMERO', 'SÉRIE', 'NÚMERO PRODUTO']
+DATE_COLUMNS = ['DATA EMISSÃO', 'DATA/HORA EVENTO MAIS RECENTE']
+CATEGORY_COLUMNS = [
+    'MODELO', 'NATUREZA DA OPERAÇÃO', 'EVENTO MAIS RECENTE',
+    'UF EMITENTE', 'MUNICÍPIO EMITENTE', 'UF DESTINATÁRIO', 'MUNICÍPIO DESTINATÁRIO',
+    'INDICADOR IE DESTINATÁRIO', 'DESTINO DA OPERAÇÃO', 'CONSUMIDOR FINAL',
+    'PRESENÇA DO COMPRADOR', 'NCM/SH (TIPO DE PRODUTO)', 'UNIDADE'
+]
+# Texto de alta cardinalidade com muitas repetições (a chave de acesso se repete em cada
+# item da nota): guardado como códigos inteiros num dicionário de valores distintos, em vez
+# de um objeto str por linha. As categorias ficam ordenadas, como na leitura do CSV.
+INTERNED_COLUMNS = [
+    'CHAVE DE ACESSO', 'DESCRIÇÃO DO PRODUTO/SERVIÇO', 'RAZÃO SOCIAL EMITENTE', 'NOME DESTINATÁRIO'
+]
+
+
+def csv_dtypes(columns: list) -> dict:
+    """
+    Tipos que podem ser aplicados diretamente na leitura do CSV.
+    """
+    dtypes = {col: str for col in STRING_COLUMNS if col in columns}
+    dtypes.update({col: 'category' for col in CATEGORY_COLUMNS + INTERNED_COLUMNS if col in columns})
+    dtypes.update({col: 'float64' for col in FLOAT_COLUMNS if col in columns})
+    return dtypes
+
+
+def _log_invalid(before: pd.Series, after: pd.Series, col: str) -> None:
+    invalid = int((before.notna() & after.isna()).sum())
+    if invalid:
+        logger.warning(f"Coluna '{col}': {invalid} valores inválidos convertidos para nulo")
+
+
+def intern_strings(series: pd.Series) -> pd.Series:
+    """
+    Codifica a coluna de texto em dicionário (categoria com categorias em texto, ordenadas).
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        if series.dtype != object:
+            series = series.astype(str).where(series.notna())
+        return series.astype('category')
+    categories = series.cat.categories
+    if categories.dtype != object:
+        series = series.cat.rename_categories(categories.astype(str))
+        categories = series.cat.categories
+    if not categories.is_monotonic_increasing:
+        series = series.cat.reorder_categories(categories.sort_values())
+    return series
+
+
+def share_dictionary(left: pd.DataFrame, right: pd.DataFrame, col: str) -> None:
+    """
+    Recodifica `col` das duas tabelas num único dicionário (união ordenada das categorias).
+
+    As duas colunas passam a ter o mesmo tipo e os mesmos códigos para o mesmo valor, então
+    junções e agrupamentos entre as tabelas comparam inteiros, e o texto de cada valor
+    distinto fica guardado uma única vez.
+    """
+    if col not in left.columns or col not in right.columns:
+        return
+    a, b = left[col], right[col]
+    if not (isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype)):
+        return
+    dtype = pd.CategoricalDtype(a.cat.categories.union(b.cat.categories))
+    left[col] = _recode(a, dtype)
+    right[col] = _recode(b, dtype)
+
+
+def _recode(series: pd.Series, dtype: pd.CategoricalDtype) -> pd.Series:
+    # Traduz os códigos para o novo dicionário; o mesmo objeto de categorias fica nas duas tabelas
+    # (astype devolveria a coluna com as categorias antigas quando os conjuntos são iguais)
+    mapping = dtype.categories.get_indexer(series.cat.categories)
+    codes = series.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, mapping[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=dtype), index=series.index, name=series.name)
+
+
+def shared_codes(a: pd.Series, b: pd.Series):
+    """
+    Códigos das duas colunas quando estão no mesmo dicionário (ver `share_dictionary`),
+    como (códigos de `a`, códigos de `b`, quantidade de valores distintos); senão None.
+    Nulos têm código -1.
+    """
+    if not (isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype)):
+        return None
+    categories = a.cat.categories
+    if categories is not b.cat.categories and not categories.equals(b.cat.categories):
+        return None
+    return a.cat.codes.to_numpy(), b.cat.codes.to_numpy(), len(categories)
+
+
+def normalize_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte cada coluna conhecida para o seu tipo compacto, uma única vez no carregamento.
+
+    Colunas que já estão no tipo esperado não são reprocessadas.
+    """
+    for col in df.columns:
+        series = df[col]
+        if col in FLOAT_COLUMNS and not is_float_dtype(series):
+            df[col] = pd.to_numeric(series, errors='coerce').astype('float64')
+            _log_invalid(series, df[col], col)
+        elif col in INTEGER_COLUMNS and not isinstance(series.dtype, pd.Int64Dtype):
+            df[col] = pd.to_numeric(series, errors='coerce').astype('Int64')
+            _log_invalid(series, df[col], col)
+        elif col in DATE_COLUMNS and not is_datetime64_any_dtype(series):
+            df[col] = pd.to_datetime(series, errors='coerce')
+            _log_invalid(series, df[col], col)
+        elif col in CATEGORY_COLUMNS and not isinstance(series.dtype, pd.CategoricalDtype):
+            df[col] = series.astype('category')
+        elif col in INTERNED_COLUMNS:
+            df[col] = intern_strings(series)
+        elif col in STRING_COLUMNS and series.dtype != object:
+            df[col] = series.astype(str).where(series.notna())
+    return df
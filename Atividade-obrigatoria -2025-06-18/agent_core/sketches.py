@@ -0,0 +1,290 @@
+import os
+import math
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# Modo aproximado (opcional): estatísticas de itens respondidas por sketches de memória limitada
+APPROX_MODE = os.getenv("NFE_APPROX_MODE", "0") != "0"
+HLL_PRECISION = int(os.getenv("NFE_HLL_PRECISION", "14"))
+CMS_WIDTH = int(os.getenv("NFE_CMS_WIDTH", "4096"))
+CMS_DEPTH = int(os.getenv("NFE_CMS_DEPTH", "5"))
+HEAVY_HITTERS = int(os.getenv("NFE_HEAVY_HITTERS", "100"))
+QUANTILE_ACCURACY = float(os.getenv("NFE_QUANTILE_ACCURACY", "0.01"))
+CHUNK_ROWS = 500_000
+# Blocos lidos do banco local: a leitura por SQL cria objetos Python por valor, então os blocos são menores
+STORE_CHUNK_ROWS = 100_000
+
+DESCRICAO = 'DESCRIÇÃO DO PRODUTO/SERVIÇO'
+NCM = 'CÓDIGO NCM/SH'
+# Colunas com contagem de distintos (HyperLogLog) e com quantis
+DISTINCT_COLUMNS = [DESCRICAO, NCM, 'CHAVE DE ACESSO']
+QUANTILE_COLUMNS = ['VALOR UNITÁRIO', 'VALOR TOTAL', 'QUANTIDADE']
+# Top-k aproximado: nome -> (coluna da chave, coluna do peso; None conta ocorrências)
+HEAVY_HITTER_SPECS = {
+    'produtos_quantidade': (DESCRICAO, 'QUANTIDADE'),
+    'ncm_frequencia': (NCM, None),
+}
+
+# Multiplicadores ímpares (64 bits) que derivam uma função de hash por linha do Count-Min
+_ROW_SEEDS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+                       0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9],
+                      dtype=np.uint64)
+
+
+def hash_values(series: pd.Series) -> np.ndarray:
+    """
+    Hash de 64 bits de cada valor não nulo (o mesmo para um valor em texto ou em categoria).
+    """
+    return pd.util.hash_pandas_object(series.dropna(), index=False).to_numpy()
+
+
+class HyperLogLog:
+    """
+    Contagem aproximada de valores distintos em 2**precision registradores de um byte.
+
+    Erro padrão relativo de 1.04 / sqrt(2**precision) (~0,8% com precisão 14, em 16 KB).
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def update(self, hashes: np.ndarray) -> None:
+        if len(hashes) == 0:
+            return
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        # Posição do primeiro bit 1 nos bits restantes (zeros à esquerda + 1). Os 53 bits mais
+        # altos cabem exatos num float64 e o expoente do frexp é o comprimento em bits
+        _, bits = np.frexp(((hashes << p) >> np.uint64(11)).astype(np.float64))
+        rank = np.minimum(54 - bits, 64 - self.precision + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Faixa pequena: contagem linear pelos registradores vazios
+            raw = m * math.log(m / zeros)
+        return int(round(raw))
+
+
+class CountMinSketch:
+    """
+    Soma aproximada por chave em `depth` linhas de `width` contadores.
+
+    Com pesos não negativos a estimativa nunca fica abaixo do valor real e excede-o em no
+    máximo e/width do peso total com probabilidade 1 - e**-depth.
+    """
+
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH):
+        self.width = width
+        self.depth = min(depth, len(_ROW_SEEDS))
+        self.table = np.zeros((self.depth, width), dtype=np.float64)
+        self.total = 0.0
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+    def _columns(self, hashes: np.ndarray, row: int) -> np.ndarray:
+        return ((hashes * _ROW_SEEDS[row]) >> np.uint64(32)) % np.uint64(self.width)
+
+    def update(self, hashes: np.ndarray, weights: np.ndarray) -> None:
+        self.total += float(np.abs(weights).sum())
+        for row in range(self.depth):
+            self.table[row] += np.bincount(self._columns(hashes, row).astype(np.intp),
+                                           weights=weights, minlength=self.width)
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        return np.min([self.table[row, self._columns(hashes, row).astype(np.intp)]
+                       for row in range(self.depth)], axis=0)
+
+    def error_bound(self) -> float:
+        return self.epsilon * self.total
+
+
+class HeavyHitters:
+    """
+    Top-k aproximado por soma de pesos: Count-Min para as somas e no máximo `capacity` candidatas.
+
+    A cada bloco, as chaves do bloco são reestimadas pelo Count-Min (que já inclui o que
+    foi visto antes) e só as `capacity` maiores estimativas continuam como candidatas.
+    """
+
+    def __init__(self, capacity: int = HEAVY_HITTERS, width: int = CMS_WIDTH, depth: int = CMS_DEPTH):
+        self.capacity = capacity
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = pd.Series(dtype=np.float64)
+
+    def update(self, keys: pd.Series, weights: Optional[pd.Series] = None) -> None:
+        valid = keys.notna()
+        if weights is None:
+            # Sem peso, cada ocorrência conta 1; o bloco é agregado por chave antes do sketch
+            por_chave = keys[valid].value_counts(sort=False).astype(np.float64)
+        else:
+            por_chave = weights[valid].fillna(0).groupby(keys[valid], observed=True, sort=False).sum()
+        por_chave = por_chave[por_chave.index.notna()]
+        if por_chave.empty:
+            return
+        indice = pd.Series(por_chave.index.astype(str))
+        hashes = hash_values(indice)
+        self.sketch.update(hashes, por_chave.to_numpy(dtype=np.float64))
+        estimativas = pd.Series(self.sketch.estimate(hashes), index=indice.to_numpy())
+        self.candidates = pd.concat([self.candidates.drop(estimativas.index, errors='ignore'), estimativas]) \
+                            .nlargest(self.capacity)
+
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        return list(self.candidates.nlargest(k).items())
+
+    def error_bound(self) -> float:
+        return self.sketch.error_bound()
+
+
+class QuantileSketch:
+    """
+    Quantis com erro relativo limitado (buckets logarítmicos, como no DDSketch).
+
+    Cada valor cai no bucket ceil(log_gamma |x|), com gamma = (1 + a) / (1 - a); o quantil
+    devolvido difere do real em no máximo `a` (relativo). A memória cresce com o logaritmo da
+    faixa de valores, não com a quantidade de linhas.
+    """
+
+    def __init__(self, relative_accuracy: float = QUANTILE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _add(self, store: Dict[int, int], values: np.ndarray) -> None:
+        buckets, counts = np.unique(np.ceil(np.log(values) / self._log_gamma).astype(np.int64), return_counts=True)
+        for bucket, count in zip(buckets.tolist(), counts.tolist()):
+            store[bucket] = store.get(bucket, 0) + count
+
+    def update(self, values: pd.Series) -> None:
+        valores = values.dropna().to_numpy(dtype=np.float64)
+        if len(valores) == 0:
+            return
+        self.count += len(valores)
+        self.min = min(self.min, float(valores.min()))
+        self.max = max(self.max, float(valores.max()))
+        self.zeros += int(np.count_nonzero(valores == 0))
+        self._add(self.positive, valores[valores > 0])
+        self._add(self.negative, -valores[valores < 0])
+
+    def _value(self, bucket: int) -> float:
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        if q <= 0 or q >= 1:
+            # Os extremos são guardados exatos
+            return self.min if q <= 0 else self.max
+        rank = q * (self.count - 1)
+        acumulado = 0
+        # Negativos do mais negativo ao mais próximo de zero, depois zeros e positivos
+        for bucket in sorted(self.negative, reverse=True):
+            acumulado += self.negative[bucket]
+            if acumulado > rank:
+                return max(-self._value(bucket), self.min)
+        acumulado += self.zeros
+        if acumulado > rank:
+            return 0.0
+        for bucket in sorted(self.positive):
+            acumulado += self.positive[bucket]
+            if acumulado > rank:
+                return min(self._value(bucket), self.max)
+        return self.max
+
+
+class ItemSketches:
+    """
+    Sketches do dataset Itens, atualizados bloco a bloco numa única passada.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.distinct = {col: HyperLogLog() for col in DISTINCT_COLUMNS}
+        self.quantiles = {col: QuantileSketch() for col in QUANTILE_COLUMNS}
+        self.heavy_hitters = {name: HeavyHitters() for name in HEAVY_HITTER_SPECS}
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        self.rows += len(chunk)
+        for col, sketch in self.distinct.items():
+            if col in chunk.columns:
+                sketch.update(hash_values(chunk[col]))
+        for col, sketch in self.quantiles.items():
+            if col in chunk.columns:
+                sketch.update(chunk[col])
+        for name, (key, weight) in HEAVY_HITTER_SPECS.items():
+            if key in chunk.columns and (weight is None or weight in chunk.columns):
+                self.heavy_hitters[name].update(chunk[key], chunk[weight] if weight else None)
+
+    def memory_bytes(self) -> int:
+        """
+        Tamanho aproximado dos sketches (independe da quantidade de linhas).
+        """
+        total = sum(s.registers.nbytes for s in self.distinct.values())
+        total += sum(h.sketch.table.nbytes + h.capacity * 64 for h in self.heavy_hitters.values())
+        total += sum((len(s.positive) + len(s.negative)) * 16 for s in self.quantiles.values())
+        return total
+
+
+def build_item_sketches(dataset) -> ItemSketches:
+    """
+    Constrói os sketches de Itens numa única passada em blocos (uso com `dataset.derived`).
+
+    Num dataset servido pelo banco local (NFE_STORAGE), os blocos são lidos do banco e só um
+    bloco fica em memória; nos demais, os blocos são fatias dos Itens já carregados.
+    """
+    columns = list(dict.fromkeys(DISTINCT_COLUMNS + QUANTILE_COLUMNS +
+                                 [c for spec in HEAVY_HITTER_SPECS.values() for c in spec if c]))
+    store = getattr(dataset, 'store', None)
+    if store is not None:
+        chunks = store.iter_chunks('itens', columns, STORE_CHUNK_ROWS)
+    else:
+        itens_df = dataset.itens_df
+        columns = [col for col in columns if col in itens_df.columns]
+        chunks = (itens_df.iloc[start:start + CHUNK_ROWS][columns] for start in range(0, len(itens_df), CHUNK_ROWS))
+    sketches = ItemSketches()
+    for chunk in chunks:
+        sketches.update(chunk)
+    logger.info(f"Sketches de itens: {sketches.rows} linhas em ~{sketches.memory_bytes() // 1024} KB")
+    return sketches
+
+
+def approx_sketches(dataset) -> Optional[ItemSketches]:
+    """
+    Sketches de Itens quando NFE_APPROX_MODE está ativo (uso com `dataset.derived`), senão None.
+    """
+    return build_item_sketches(dataset) if APPROX_MODE else None
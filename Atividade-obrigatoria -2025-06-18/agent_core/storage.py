@@ -0,0 +1,428 @@
+import os
+import logging
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from agent_core.aggregates import build_header_aggregates
+from agent_core.schema import normalize_schema
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - duckdb é opcional
+    duckdb = None
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# '' (desligado), 'sqlite', 'duckdb' ou 'auto' (DuckDB se instalado, senão SQLite)
+STORAGE_BACKEND = os.getenv("NFE_STORAGE", "").strip().lower()
+STORAGE_DIR = os.getenv("NFE_STORAGE_DIR", os.path.join(tempfile.gettempdir(), "nfe_store"))
+# Leitura do SQLite mapeada em memória: as páginas do arquivo ficam no cache do sistema
+# operacional, compartilhadas por todos os processos que abrem o mesmo banco
+MMAP_BYTES = int(os.getenv("NFE_STORAGE_MMAP_MB", "1024")) * 1024 * 1024
+
+TABLES = ('cabecalho', 'itens')
+PERIOD_COLUMN = 'PERIODO'
+DATE_COLUMN = 'DATA EMISSÃO'
+# Colunas indexadas em cada tabela (as ausentes no dataset são ignoradas)
+INDEXED_COLUMNS = {
+    'cabecalho': ['CHAVE DE ACESSO', 'CPF/CNPJ Emitente', 'NÚMERO'],
+    'itens': ['CHAVE DE ACESSO', 'CÓDIGO NCM/SH'],
+}
+
+# Expressões de data de cada banco: ANO_MES, DATA e DIA_SEMANA (0 = segunda-feira, como no pandas)
+_DATE_SQL = {
+    'sqlite': {
+        'ANO_MES': "strftime('%Y-%m', {col})",
+        'DATA': "date({col})",
+        'DIA_SEMANA': "(CAST(strftime('%w', {col}) AS INTEGER) + 6) % 7",
+    },
+    'duckdb': {
+        'ANO_MES': "strftime({col}, '%Y-%m')",
+        'DATA': "strftime({col}, '%Y-%m-%d')",
+        'DIA_SEMANA': "isodow({col}) - 1",
+    },
+}
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def resolve_backend(backend: str) -> Optional[str]:
+    """
+    Banco efetivo para a configuração `backend`, ou None quando o armazenamento está desligado.
+    """
+    if backend in ('', '0', 'off', 'none'):
+        return None
+    if backend in ('duckdb', 'auto') and duckdb is not None:
+        return 'duckdb'
+    if backend == 'duckdb':
+        logger.warning("duckdb não está instalado; usando SQLite como armazenamento local")
+    return 'sqlite'
+
+
+def storage_enabled() -> bool:
+    return resolve_backend(STORAGE_BACKEND) is not None
+
+
+def _sql_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # Categorias viram texto: no banco a ordenação e o agrupamento são pelo valor, não pelo código
+    return df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+
+
+class SQLStore:
+    """
+    Banco analítico local (arquivo SQLite ou DuckDB) com as tabelas Cabecalho e Itens de um dataset.
+
+    O arquivo é criado uma única vez por conteúdo (impressão digital do dataset) e reaproveitado
+    por todas as sessões e processos, inclusive após reiniciar a aplicação. Cada thread usa a
+    própria conexão, registrada para que `close` feche todas; as consultas rodam no banco e só
+    o resultado volta ao pandas.
+    """
+
+    def __init__(self, path: str, backend: str = 'sqlite'):
+        self.path = path
+        self.backend = backend
+        self._local = threading.local()
+        self._db = None
+        self._lock = threading.Lock()
+        self._connections = []
+        # Incrementada por `close`: conexões de threads abertas antes disso não são reutilizadas
+        self._generation = 0
+        self._columns = {}
+        self._counts = {}
+        self._probe = {}
+
+    def _connection(self):
+        if getattr(self._local, 'generation', None) != self._generation:
+            with self._lock:
+                if self.backend == 'duckdb':
+                    if self._db is None:
+                        self._db = duckdb.connect(self.path, read_only=True)
+                    conn = self._db.cursor()
+                else:
+                    conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+                    conn.execute(f"PRAGMA mmap_size = {MMAP_BYTES}")
+                self._connections.append(conn)
+                self._local.conn, self._local.generation = conn, self._generation
+        return self._local.conn
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        """
+        Executa a consulta e retorna o resultado como DataFrame (nulos de texto como NaN, como no pandas).
+        """
+        return self._read(sql, params).replace({None: np.nan})
+
+    def _read(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        conn = self._connection()
+        if self.backend == 'duckdb':
+            return conn.execute(sql, list(params)).df()
+        return pd.read_sql_query(sql, conn, params=list(params))
+
+    def scalar(self, sql: str, params: Sequence[Any] = ()) -> Any:
+        value = self.query(sql, params).iloc[0, 0]
+        return None if pd.isna(value) else value
+
+    def date_expr(self, dim: str, col: str = 'DATA EMISSÃO') -> str:
+        return _DATE_SQL[self.backend][dim].format(col=quote(col))
+
+    def columns(self, table: str) -> List[str]:
+        if table not in self._columns:
+            self._columns[table] = list(self.query(f"SELECT * FROM {table} LIMIT 0").columns)
+        return self._columns[table]
+
+    def count(self, table: str) -> int:
+        # O banco é somente leitura, então a contagem pode ser memorizada
+        if table not in self._counts:
+            self._counts[table] = int(self.scalar(f"SELECT COUNT(*) FROM {table}"))
+        return self._counts[table]
+
+    def probe(self, table: str) -> pd.DataFrame:
+        """
+        Uma linha da tabela com as colunas do dataset (com DATA EMISSÃO válida, se houver).
+
+        As ferramentas de pandas só usam o DataFrame recebido para validar colunas e dados
+        disponíveis quando recebem os agregados prontos; a amostra substitui a tabela inteira.
+        """
+        if table not in self._probe:
+            df = pd.DataFrame()
+            if 'DATA EMISSÃO' in self.columns(table):
+                df = self.query(f"SELECT * FROM {table} WHERE {quote('DATA EMISSÃO')} IS NOT NULL LIMIT 1")
+            if df.empty:
+                df = self.query(f"SELECT * FROM {table} LIMIT 1")
+            if 'DATA EMISSÃO' in df.columns:
+                df['DATA EMISSÃO'] = pd.to_datetime(df['DATA EMISSÃO'], errors='coerce')
+            self._probe[table] = df
+        return self._probe[table]
+
+    def _typed(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Mesmos tipos do carregamento dos arquivos; a linha do banco (rowid) vira o índice
+        df = df.set_index('__linha')
+        df.index.name = None
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].where(df[col].notna(), np.nan)
+        df = normalize_schema(df)
+        if PERIOD_COLUMN in df.columns:
+            df[PERIOD_COLUMN] = df[PERIOD_COLUMN].astype('category')
+        return df
+
+    def read_table(self, table: str, columns: Optional[List[str]] = None,
+                   inicio: Optional[pd.Timestamp] = None, fim: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """
+        Lê apenas as colunas pedidas da tabela (todas, sem `columns`), tipadas como no carregamento
+        e indexadas pela linha do banco. Colunas inexistentes são ignoradas.
+
+        Com `inicio`/`fim`, lê só as linhas com DATA EMISSÃO no intervalo (limites inclusivos),
+        quando a tabela tem essa coluna; quem chamar ainda aplica o filtro exato.
+        """
+        available = self.columns(table)
+        columns = available if columns is None else [col for col in columns if col in available]
+        where, params = [], []
+        if DATE_COLUMN in available:
+            if inicio is not None:
+                where.append(f"{quote(DATE_COLUMN)} >= ?")
+                params.append(str(pd.Timestamp(inicio)))
+            if fim is not None:
+                where.append(f"{quote(DATE_COLUMN)} <= ?")
+                params.append(str(pd.Timestamp(fim)))
+        select = ", ".join(["rowid AS __linha"] + [quote(col) for col in columns])
+        sql = f"SELECT {select} FROM {table}" + (f" WHERE {' AND '.join(where)}" if where else "") + " ORDER BY rowid"
+        return self._typed(self._read(sql, params))
+
+    def iter_chunks(self, table: str, columns: List[str], chunksize: int = 500_000):
+        """
+        Percorre a tabela em blocos de `chunksize` linhas, na ordem das linhas, lendo só as colunas
+        pedidas (tipadas como em `read_table`); apenas um bloco fica em memória por vez.
+        """
+        select = ", ".join(["rowid AS __linha"] + [quote(col) for col in columns if col in self.columns(table)])
+        ultima = 0
+        while True:
+            chunk = self._read(f"SELECT {select} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                               [ultima, chunksize])
+            if chunk.empty:
+                return
+            ultima = int(chunk['__linha'].iloc[-1])
+            yield self._typed(chunk)
+
+    def read_rows(self, table: str, rows: Sequence[int], batch: int = 900) -> pd.DataFrame:
+        """
+        Todas as colunas das linhas `rows` (linhas do banco, como no índice de `read_table`), na ordem pedida.
+        """
+        rows = [int(row) for row in rows]
+        partes = [
+            self._read(f"SELECT rowid AS __linha, * FROM {table} WHERE rowid IN ({', '.join('?' * len(lote))})", lote)
+            for lote in (rows[i:i + batch] for i in range(0, len(rows), batch))
+        ]
+        if not partes:
+            partes = [self._read(f"SELECT rowid AS __linha, * FROM {table} LIMIT 0")]
+        return self._typed(pd.concat(partes, ignore_index=True)).reindex(rows)
+
+    def close(self) -> None:
+        """
+        Fecha as conexões de todas as threads; uma consulta posterior abre uma conexão nova.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+            db, self._db = self._db, None
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+        if db is not None:
+            db.close()
+
+
+_DUCKDB_TYPES = {'f': 'DOUBLE', 'i': 'BIGINT', 'u': 'BIGINT', 'b': 'BOOLEAN', 'M': 'TIMESTAMP'}
+
+
+def _add_columns(conn, table: str, df: pd.DataFrame, written: List[str], typed: bool) -> None:
+    # Arquivos da mesma tabela com colunas diferentes: as colunas novas são acrescentadas,
+    # nulas nas linhas já gravadas (como na concatenação dos DataFrames)
+    for col in df.columns:
+        if col not in written:
+            kind = _DUCKDB_TYPES.get(df[col].dtype.kind, 'VARCHAR') if typed else ''
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {quote(col)} {kind}".rstrip())
+            written.append(col)
+
+
+def _write_sqlite(path: str, frames: Iterable[Tuple[str, pd.DataFrame]]) -> List[str]:
+    written = {}
+    conn = sqlite3.connect(path)
+    try:
+        for table, df in frames:
+            df = _sql_frame(df)
+            if table in written:
+                _add_columns(conn, table, df, written[table], typed=False)
+            df.to_sql(table, conn, index=False, if_exists='append', chunksize=100_000)
+            written.setdefault(table, list(df.columns))
+        for table, columns in written.items():
+            for col in INDEXED_COLUMNS[table]:
+                if col in columns:
+                    conn.execute(f"CREATE INDEX {quote(f'idx_{table}_{col}')} ON {table} ({quote(col)})")
+        conn.commit()
+    finally:
+        conn.close()
+    return list(written)
+
+
+def _write_duckdb(path: str, frames: Iterable[Tuple[str, pd.DataFrame]]) -> List[str]:
+    written = {}
+    conn = duckdb.connect(path)
+    try:
+        for table, df in frames:
+            conn.register('origem', _sql_frame(df))
+            if table in written:
+                _add_columns(conn, table, df, written[table], typed=True)
+                conn.execute(f"INSERT INTO {table} BY NAME SELECT * FROM origem")
+            else:
+                conn.execute(f"CREATE TABLE {table} AS SELECT * FROM origem")
+                written[table] = list(df.columns)
+            conn.unregister('origem')
+        for table, columns in written.items():
+            for col in INDEXED_COLUMNS[table]:
+                if col in columns:
+                    conn.execute(f"CREATE INDEX {quote(f'idx_{table}_{col}')} ON {table} ({quote(col)})")
+    finally:
+        conn.close()
+    return list(written)
+
+
+def build_store(fingerprint: str, frames: Callable[[], Iterable[Tuple[str, pd.DataFrame]]],
+                backend: Optional[str] = None, directory: Optional[str] = None) -> Optional[SQLStore]:
+    """
+    Abre o banco local do dataset `fingerprint`, criando-o se ainda não existir.
+
+    `frames` só é chamada na criação e produz (tabela, DataFrame) arquivo a arquivo, na ordem
+    das linhas; cada bloco é gravado e descartado antes do próximo. Retorna None se o banco
+    criado não tiver as duas tabelas.
+    """
+    backend = resolve_backend(backend if backend is not None else STORAGE_BACKEND) or 'sqlite'
+    directory = directory or STORAGE_DIR
+    extension = 'duckdb' if backend == 'duckdb' else 'sqlite'
+    path = os.path.join(directory, f"{fingerprint[:24]}.{extension}")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        # Gravado num arquivo temporário e renomeado: outro processo nunca vê um banco incompleto
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        logger.info(f"Criando banco local ({backend}) em {path}")
+        writer = _write_duckdb if backend == 'duckdb' else _write_sqlite
+        try:
+            tables = writer(tmp_path, frames())
+            if not all(table in tables for table in TABLES):
+                return None
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    else:
+        logger.info(f"Reutilizando banco local em {path}")
+    return SQLStore(path, backend)
+
+
+class SQLAggregates:
+    """
+    Mesma interface de `HeaderAggregates`, calculada no banco local com GROUP BY.
+
+    Os resultados têm os mesmos índices e a mesma ordem dos agregados em pandas, então as
+    ferramentas de cabeçalho os usam sem mudança no relatório.
+    """
+
+    def __init__(self, store: SQLStore):
+        self.store = store
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _memo(self, key: tuple, builder: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = builder()
+            return self._cache[key]
+
+    def _dimension(self, dim: str) -> str:
+        if dim in _DATE_SQL[self.store.backend]:
+            return self.store.date_expr(dim)
+        return quote(dim)
+
+    def _index(self, dim: str, values: pd.Series) -> pd.Index:
+        if dim == 'DATA':
+            return pd.DatetimeIndex(pd.to_datetime(values), name=dim)
+        if dim == 'ANO_MES':
+            return pd.PeriodIndex(values, freq='M', name=dim)
+        if dim == 'DIA_SEMANA':
+            return pd.Index(values.astype('int64'), name=dim)
+        return pd.Index(values, name=dim)
+
+    def summary(self) -> dict:
+        def build():
+            valor = quote('VALOR NOTA FISCAL')
+            row = self.store.query(f"SELECT COUNT(*) AS quantidade, SUM({valor}) AS soma, "
+                                   f"AVG({valor}) AS media FROM cabecalho").iloc[0]
+            soma = 0.0 if pd.isna(row['soma']) else float(row['soma'])
+            return {'quantidade': int(row['quantidade']), 'soma': soma, 'media': row['media']}
+        return self._memo(('summary',), build)
+
+    def counts(self, dim: str) -> pd.Series:
+        def build():
+            expr = self._dimension(dim)
+            df = self.store.query(f"SELECT {expr} AS chave, COUNT(*) AS n FROM cabecalho WHERE {expr} IS NOT NULL "
+                                  f"GROUP BY {expr} ORDER BY n DESC, chave")
+            return pd.Series(df['n'].astype('int64').to_numpy(), index=self._index(dim, df['chave']), name='count')
+        return self._memo(('counts', dim), build)
+
+    def stats(self, dim: str) -> pd.DataFrame:
+        def build():
+            expr = self._dimension(dim)
+            valor = f"COALESCE({quote('VALOR NOTA FISCAL')}, 0)"
+            df = self.store.query(f"SELECT {expr} AS chave, COUNT(*) AS quantidade, SUM({valor}) AS soma, "
+                                  f"AVG({valor}) AS media FROM cabecalho WHERE {expr} IS NOT NULL "
+                                  f"GROUP BY {expr} ORDER BY chave")
+            return df[['quantidade', 'soma', 'media']].set_index(self._index(dim, df['chave']))
+        return self._memo(('stats', dim), build)
+
+
+def open_store(dataset) -> Optional[SQLStore]:
+    """
+    Banco local do dataset quando NFE_STORAGE está ativo (uso com `dataset.derived`), senão None.
+
+    Um dataset carregado com NFE_STORAGE já é servido pelo banco (`dataset.store`); para um
+    dataset montado em memória, o banco é criado a partir dos seus DataFrames.
+    """
+    if not storage_enabled():
+        return None
+    store = getattr(dataset, 'store', None)
+    if store is not None:
+        return store
+    return build_store(dataset.fingerprint, lambda: [('cabecalho', dataset.cabecalho_df), ('itens', dataset.itens_df)])
+
+
+def open_aggregates(dataset) -> Optional[SQLAggregates]:
+    """
+    Agregados do banco local do dataset (uso com `dataset.derived`), ou None sem NFE_STORAGE.
+    """
+    store = dataset.derived('sql_store', open_store)
+    return SQLAggregates(store) if store is not None else None
+
+
+def dataset_aggregates(dataset):
+    """
+    Agregados de cabeçalho do dataset: os do banco local quando NFE_STORAGE está ativo,
+    senão os calculados em memória (`HeaderAggregates`).
+    """
+    aggregates = dataset.derived('sql_aggregates', open_aggregates)
+    if aggregates is None:
+        aggregates = dataset.derived('header_aggregates', build_header_aggregates)
+    return aggregates
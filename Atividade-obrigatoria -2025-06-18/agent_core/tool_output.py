@@ -0,0 +1,162 @@
+import os
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from dotenv import load_dotenv
+from langchain.tools import Tool
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# Mesma estimativa usada nos spans quando o provedor não informa tokens: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+PAGE_TOOL = "ler_pagina"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def split_pages(text: str, max_chars: int) -> List[str]:
+    """
+    Divide o texto em páginas de até `max_chars` caracteres, quebrando entre linhas
+    (uma linha maior que a página é quebrada no meio).
+    """
+    pages, current, size = [], [], 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pages.append("".join(current))
+                current, size = [], 0
+            pages.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) > max_chars and current:
+            pages.append("".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        pages.append("".join(current))
+    return pages
+
+
+class ResultPager:
+    """
+    Limita a saída das ferramentas a um orçamento de tokens.
+
+    Uma saída maior que o orçamento é dividida em páginas: o agente recebe um resumo e a
+    primeira página, e as seguintes ficam guardadas sob um cursor, lidas pela ferramenta
+    `ler_pagina`. A memória é limitada pelo total de caracteres guardados (`max_chars`):
+    os cursores mais antigos são descartados primeiro, e de uma saída que sozinha passe
+    do limite só são guardadas as primeiras páginas.
+    """
+
+    def __init__(self, token_budget: int = 1500, max_chars: int = 16 * 1024 * 1024):
+        self.token_budget = token_budget
+        self.max_chars = max_chars
+        self.total_chars = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def shape(self, tool_name: str, text: str) -> str:
+        """
+        Retorna o texto inteiro se couber no orçamento; senão, o resumo com a primeira página.
+        """
+        if estimate_tokens(text) <= self.token_budget:
+            return text
+        pages = split_pages(text, self.token_budget * CHARS_PER_TOKEN)
+        cursor = uuid.uuid4().hex[:8]
+        kept, size = [], 0
+        for page in pages:
+            if kept and size + len(page) > self.max_chars:
+                break
+            kept.append(page)
+            size += len(page)
+        with self._lock:
+            while self._pages and self.total_chars + size > self.max_chars:
+                _, (_, _, old_size) = self._pages.popitem(last=False)
+                self.total_chars -= old_size
+            self._pages[cursor] = (tool_name, kept, size)
+            self.total_chars += size
+        title = text.strip().splitlines()[0]
+        summary = (f"[{tool_name}] {title} — resultado com {text.count(chr(10)) + 1} linhas "
+                   f"(~{estimate_tokens(text)} tokens), dividido em {len(pages)} páginas.\n\n")
+        if len(kept) < len(pages):
+            summary += (f"(Apenas as {len(kept)} primeiras páginas ficam disponíveis; "
+                        f"refine a consulta para ver o restante.)\n\n")
+        return summary + self._page(cursor, kept, 1)
+
+    def read(self, request: str) -> str:
+        """
+        Lê uma página guardada; `request` é 'cursor' (página 2) ou 'cursor:N'.
+        """
+        cursor, _, number = request.strip().strip("'\"").partition(":")
+        with self._lock:
+            entry = self._pages.get(cursor)
+        if entry is None:
+            return f"Cursor '{cursor}' não encontrado ou expirado; execute a ferramenta original novamente."
+        try:
+            page = int(number) if number else 2
+        except ValueError:
+            return "Formato inválido. Use 'cursor:N', por exemplo 'ab12cd34:2'."
+        _, pages, _ = entry
+        if not 1 <= page <= len(pages):
+            return f"Página {page} inexistente; estão disponíveis {len(pages)} páginas."
+        return self._page(cursor, pages, page)
+
+    @staticmethod
+    def _page(cursor: str, pages: List[str], page: int) -> str:
+        text = f"Página {page} de {len(pages)}:\n\n{pages[page - 1].rstrip()}\n"
+        if page < len(pages):
+            text += f"\n(Para continuar, use a ferramenta {PAGE_TOOL} com o input '{cursor}:{page + 1}'.)"
+        return text
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+            self.total_chars = 0
+
+
+def _shaped(name: str, func: Callable[[str], str], pager: ResultPager) -> Callable[[str], str]:
+    def run(tool_input: str) -> str:
+        output = str(func(tool_input))
+        shaped = pager.shape(name, output)
+        paginated = shaped is not output
+        logger.info(f"Ferramenta {name}: {len(output)} caracteres (~{estimate_tokens(output)} tokens)"
+                    f"{f', enviados {len(shaped)} caracteres (paginado)' if paginated else ''}")
+        return shaped
+    return run
+
+
+def shape_tools(tools: List[Tool], pager: Optional[ResultPager] = None) -> List[Tool]:
+    """
+    Aplica o orçamento de tokens à saída de cada ferramenta e acrescenta a ferramenta `ler_pagina`.
+    """
+    pager = pager or result_pager
+    shaped = [
+        Tool(name=tool.name, func=_shaped(tool.name, tool.func, pager), description=tool.description)
+        for tool in tools
+    ]
+    shaped.append(Tool(
+        name=PAGE_TOOL,
+        func=pager.read,
+        description="Lê a próxima página de um resultado longo de outra ferramenta. O input é o cursor "
+                    "informado no resultado, no formato 'cursor:N' (N é o número da página)."
+    ))
+    return shaped
+
+
+result_pager = ResultPager(
+    token_budget=int(os.getenv("NFE_TOOL_TOKEN_BUDGET", "1500")),
+    max_chars=int(os.getenv("NFE_TOOL_PAGES_MAX_MB", "16")) * 1024 * 1024
+)
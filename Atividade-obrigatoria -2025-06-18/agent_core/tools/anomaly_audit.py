@@ -0,0 +1,276 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from agent_core.indexes import NFeIndexes
+from agent_core.money import MoneyColumns, exceeds, from_cents, item_total_cents, sum_by_code, to_cents
+from agent_core.schema import shared_codes
+from agent_core.tools.consistency_validation import _divergence_report
+from agent_core.tools.header_analysis import find_negative_value_notes, find_duplicate_note_numbers
+from agent_core.tools.item_analysis import (
+    find_zero_unit_value_items,
+    find_negative_quantity_items,
+    find_inconsistent_item_values
+)
+from agent_core.tools.report import render_report
+
+logger = logging.getLogger(__name__)
+
+# Processos da auditoria; abaixo de PARALLEL_MIN_ROWS linhas as partições rodam no próprio processo
+AUDIT_WORKERS = int(os.getenv("NFE_AUDIT_WORKERS", "0")) or os.cpu_count() or 1
+PARALLEL_MIN_ROWS = int(os.getenv("NFE_AUDIT_PARALLEL_MIN_ROWS", "2000000"))
+
+# Verificações por partição: (nome, descrição) na ordem do resumo
+CHECKS = [
+    ('divergentes', 'Notas com valor divergente da soma dos itens'),
+    ('sem_itens', 'Notas sem itens'),
+    ('nota_zerada', 'Notas com VALOR NOTA FISCAL zerado'),
+    ('nota_negativa', 'Notas com VALOR NOTA FISCAL negativo'),
+    ('unitario_zerado', 'Itens com VALOR UNITÁRIO zerado'),
+    ('quantidade_negativa', 'Itens com QUANTIDADE negativa'),
+    ('item_inconsistente', 'Itens com VALOR TOTAL inconsistente com (QUANTIDADE * VALOR UNITÁRIO)'),
+]
+
+# Colunas usadas pelas verificações em cada tabela
+REQUIRED_CABECALHO = ['CHAVE DE ACESSO', 'VALOR NOTA FISCAL', 'NÚMERO']
+REQUIRED_ITENS = ['CHAVE DE ACESSO', 'QUANTIDADE', 'VALOR UNITÁRIO', 'VALOR TOTAL', 'DESCRIÇÃO DO PRODUTO/SERVIÇO']
+MISSING_COLUMNS = f"Colunas necessárias ausentes: {', '.join(REQUIRED_CABECALHO + REQUIRED_ITENS)}"
+
+def _key_codes(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame,
+               indexes: Optional[NFeIndexes]) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Código da 'CHAVE DE ACESSO' de cada item e de cada nota no mesmo espaço de códigos.
+    Notas sem itens recebem códigos próprios, acima dos códigos dos itens.
+    """
+    compartilhados = shared_codes(itens_df['CHAVE DE ACESSO'], cabecalho_df['CHAVE DE ACESSO'])
+    if compartilhados is not None:
+        # Mesmo dicionário nas duas tabelas: os códigos já estão no mesmo espaço
+        codigos_itens, codigos_notas, n_codigos = compartilhados
+        codigos_notas = codigos_notas.astype(np.int64)
+    elif indexes is not None and indexes.chave_itens is not None:
+        codigos_itens = indexes.chave_itens.codes
+        codigos_notas = indexes.chave_itens.codes_for(cabecalho_df['CHAVE DE ACESSO'])
+        n_codigos = len(indexes.chave_itens)
+    else:
+        chaves = pd.concat([itens_df['CHAVE DE ACESSO'], cabecalho_df['CHAVE DE ACESSO']], ignore_index=True)
+        codigos, uniques = pd.factorize(chaves.astype(object), sort=False)
+        codigos_itens, codigos_notas = codigos[:len(itens_df)], codigos[len(itens_df):]
+        n_codigos = len(uniques)
+    sem_codigo = codigos_notas < 0
+    codigos_notas = codigos_notas.copy()
+    codigos_notas[sem_codigo] = n_codigos + np.arange(int(sem_codigo.sum()))
+    return np.asarray(codigos_itens, dtype=np.int64), codigos_notas.astype(np.int64), n_codigos + int(sem_codigo.sum())
+
+def _shard_order(codigos: np.ndarray, n_shards: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Linhas agrupadas por partição (código da chave módulo `n_shards`) e o início de cada partição.
+    Itens sem chave ficam distribuídos pela posição.
+    """
+    shards = np.where(codigos >= 0, codigos, np.arange(len(codigos))) % n_shards
+    order = np.argsort(shards, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(shards, minlength=n_shards))))
+    return order, offsets
+
+def _audit_arrays(arrays: Dict[str, np.ndarray], shard: int, n_codigos: int) -> Dict[str, np.ndarray]:
+    """
+    Executa todas as verificações nas linhas de uma partição.
+    Retorna as posições (nas tabelas completas) das linhas anômalas de cada verificação.
+    """
+    itens = arrays['itens_ordem'][arrays['itens_offsets'][shard]:arrays['itens_offsets'][shard + 1]]
+    notas = arrays['notas_ordem'][arrays['notas_offsets'][shard]:arrays['notas_offsets'][shard + 1]]
+
+    # Valores ausentes contam como zero, como nas ferramentas individuais; valores monetários em centavos
+    quantidade = np.nan_to_num(arrays['quantidade'][itens])
+    unitario = np.nan_to_num(arrays['unitario'][itens])
+    total = arrays['total_centavos'][itens]
+    codigos_itens = arrays['codigos_itens'][itens]
+    valor_nota = arrays['valor_nota'][notas]
+    codigos_notas = arrays['codigos_notas'][notas]
+
+    # Todas as linhas de uma chave estão na mesma partição, então a soma por nota é local
+    validos = codigos_itens >= 0
+    somas = sum_by_code(codigos_itens, total, n_codigos)
+    contagens = np.bincount(codigos_itens[validos], minlength=n_codigos)
+    soma_notas = somas[codigos_notas]
+    divergentes = ~np.isnan(valor_nota) & exceeds(to_cents(valor_nota) - soma_notas, 'nota_itens')
+
+    return {
+        'divergentes': notas[divergentes],
+        'soma_divergentes': from_cents(soma_notas[divergentes]),
+        'sem_itens': notas[contagens[codigos_notas] == 0],
+        'nota_zerada': notas[valor_nota == 0],
+        'nota_negativa': notas[valor_nota < 0],
+        'unitario_zerado': itens[unitario == 0],
+        'quantidade_negativa': itens[quantidade < 0],
+        'item_inconsistente': itens[exceeds(total - to_cents(quantidade * unitario), 'item_total')],
+    }
+
+def _attach(spec: Dict[str, tuple]) -> Tuple[Dict[str, np.ndarray], list]:
+    blocks, arrays = [], {}
+    for name, (shm_name, dtype, length) in spec.items():
+        # Os processos do pool usam o mesmo resource_tracker do processo principal, que remove os blocos
+        block = shared_memory.SharedMemory(name=shm_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray((length,), dtype=dtype, buffer=block.buf)
+    return arrays, blocks
+
+def _audit_shard(spec: Dict[str, tuple], shard: int, n_codigos: int) -> Dict[str, np.ndarray]:
+    """
+    Auditoria de uma partição num processo do pool, sobre os buffers compartilhados.
+    """
+    arrays, blocks = _attach(spec)
+    try:
+        # Cópia do resultado antes de liberar os buffers
+        return {name: np.array(values) for name, values in _audit_arrays(arrays, shard, n_codigos).items()}
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+
+def _run_pool(arrays: Dict[str, np.ndarray], n_shards: int, n_codigos: int, on_wait=None) -> Tuple[list, object]:
+    """
+    Executa as partições num pool de processos, sobre cópias dos arrays em memória compartilhada.
+    """
+    blocks = []
+    try:
+        spec = {}
+        for name, values in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+            spec[name] = (block.name, values.dtype.str, len(values))
+        with ProcessPoolExecutor(n_shards, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(_audit_shard, spec, shard, n_codigos) for shard in range(n_shards)]
+            extra = on_wait() if on_wait else None
+            return [future.result() for future in futures], extra
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def _run_shards(arrays: Dict[str, np.ndarray], n_shards: int, n_codigos: int,
+                on_wait=None) -> Tuple[Dict[str, np.ndarray], list]:
+    """
+    Executa as partições (em paralelo quando n_shards > 1) e junta as posições em ordem de linha.
+    `on_wait` roda no processo principal enquanto o pool trabalha. Se o pool ou a memória
+    compartilhada não estiverem disponíveis, as partições rodam no próprio processo.
+    """
+    parciais = None
+    if n_shards > 1:
+        try:
+            parciais, extra = _run_pool(arrays, n_shards, n_codigos, on_wait)
+        except Exception as e:
+            logger.warning(f"Auditoria paralela indisponível ({str(e)}); as partições rodam no próprio processo")
+    if parciais is None:
+        extra = on_wait() if on_wait else None
+        parciais = [_audit_arrays(arrays, shard, n_codigos) for shard in range(n_shards)]
+
+    resultado = {}
+    for name in parciais[0]:
+        resultado[name] = np.concatenate([p[name] for p in parciais])
+    # A soma acompanha as posições das notas divergentes
+    ordem = np.argsort(resultado['divergentes'], kind='stable')
+    resultado['divergentes'] = resultado['divergentes'][ordem]
+    resultado['soma_divergentes'] = resultado['soma_divergentes'][ordem]
+    for name, _ in CHECKS[1:]:
+        resultado[name] = np.sort(resultado[name])
+    return resultado, extra
+
+def audit_anomalies(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame, max_rows: Optional[int] = None,
+                    indexes: Optional[NFeIndexes] = None, workers: Optional[int] = None,
+                    money: Optional[MoneyColumns] = None) -> str:
+    """
+    Executa de uma vez todas as verificações de anomalias e retorna um relatório combinado.
+
+    As linhas são particionadas pela 'CHAVE DE ACESSO' (todas as linhas de uma nota na mesma
+    partição) e as partições rodam num pool de processos sobre buffers de memória compartilhada;
+    com poucas linhas ou um único núcleo, rodam no próprio processo. A verificação de números
+    duplicados agrupa por 'NÚMERO' e roda no processo principal enquanto o pool trabalha.
+    Cada seção tem o mesmo formato da ferramenta individual correspondente.
+    Com `max_rows`, cada seção lista apenas os primeiros registros.
+    """
+    if cabecalho_df.empty or itens_df.empty:
+        return "Dados de cabeçalho ou itens não disponíveis para auditoria de anomalias."
+    if not all(col in cabecalho_df.columns for col in REQUIRED_CABECALHO) or \
+            not all(col in itens_df.columns for col in REQUIRED_ITENS):
+        return MISSING_COLUMNS
+
+    try:
+        workers = workers or AUDIT_WORKERS
+        n_shards = workers if len(cabecalho_df) + len(itens_df) >= PARALLEL_MIN_ROWS else 1
+        codigos_itens, codigos_notas, n_codigos = _key_codes(cabecalho_df, itens_df, indexes)
+        itens_ordem, itens_offsets = _shard_order(codigos_itens, n_shards)
+        notas_ordem, notas_offsets = _shard_order(codigos_notas, n_shards)
+        arrays = {
+            'codigos_itens': codigos_itens,
+            'codigos_notas': codigos_notas,
+            'quantidade': itens_df['QUANTIDADE'].to_numpy(dtype='float64', na_value=np.nan),
+            'unitario': itens_df['VALOR UNITÁRIO'].to_numpy(dtype='float64', na_value=np.nan),
+            'total_centavos': item_total_cents(itens_df, money),
+            'valor_nota': cabecalho_df['VALOR NOTA FISCAL'].to_numpy(dtype='float64', na_value=np.nan),
+            'itens_ordem': itens_ordem,
+            'itens_offsets': itens_offsets,
+            'notas_ordem': notas_ordem,
+            'notas_offsets': notas_offsets,
+        }
+
+        def duplicados():
+            numero_index = indexes.numero if indexes is not None else None
+            if numero_index is not None:
+                quantidade = int((numero_index.group_sizes() > 1).sum())
+            else:
+                quantidade = int(cabecalho_df['NÚMERO'].value_counts().gt(1).sum())
+            relatorio = find_duplicate_note_numbers(cabecalho_df, max_rows, index=numero_index) if quantidade else None
+            return quantidade, relatorio
+
+        logger.info(f"Auditoria de anomalias em {n_shards} partição(ões)")
+        resultado, (n_duplicados, relatorio_duplicados) = _run_shards(arrays, n_shards, n_codigos, duplicados)
+    except Exception as e: return f"Erro ao auditar anomalias: {str(e)}"
+
+    return render_audit(len(cabecalho_df), len(itens_df), {name: len(resultado[name]) for name, _ in CHECKS},
+                        lambda name: cabecalho_df.iloc[resultado[name]], lambda name: itens_df.iloc[resultado[name]],
+                        resultado['soma_divergentes'], (n_duplicados, relatorio_duplicados), max_rows)
+
+def render_audit(n_notas: int, n_itens: int, contagens: Dict[str, int],
+                 notas: Callable[[str], pd.DataFrame], itens: Callable[[str], pd.DataFrame],
+                 soma_divergentes, duplicados: Tuple[int, Optional[str]], max_rows: Optional[int] = None) -> str:
+    """
+    Monta o relatório combinado a partir da quantidade de linhas de cada verificação e das linhas
+    anômalas (`notas(nome)` / `itens(nome)`, só chamadas para as verificações com anomalias).
+    `soma_divergentes` é a soma dos itens das notas divergentes e `duplicados` a quantidade de
+    números duplicados com o relatório da ferramenta individual.
+    """
+    n_duplicados, relatorio_duplicados = duplicados
+    secoes = {
+        'divergentes': lambda: _divergence_report(notas('divergentes'), soma_divergentes, max_rows),
+        'sem_itens': lambda: render_report("Notas Fiscais sem itens:\n\n", notas('sem_itens'),
+                                           "- Chave de Acesso: {}, Valor: R$ {:.2f}\n",
+                                           ['CHAVE DE ACESSO', 'VALOR NOTA FISCAL'], max_rows),
+        'nota_zerada': lambda: render_report("Notas Fiscais com VALOR NOTA FISCAL zerado:\n\n", notas('nota_zerada'),
+                                             "- Chave de Acesso: {}, Número: {}\n",
+                                             ['CHAVE DE ACESSO', 'NÚMERO'], max_rows),
+        'nota_negativa': lambda: find_negative_value_notes(notas('nota_negativa'), max_rows),
+        'unitario_zerado': lambda: find_zero_unit_value_items(itens('unitario_zerado'), max_rows),
+        'quantidade_negativa': lambda: find_negative_quantity_items(itens('quantidade_negativa'), max_rows),
+        'item_inconsistente': lambda: find_inconsistent_item_values(itens('item_inconsistente'), max_rows),
+    }
+
+    resumo = [f"- {descricao}: {contagens[name]}\n" for name, descricao in CHECKS]
+    resumo.insert(4, f"- Números de nota duplicados: {n_duplicados}\n")
+    total = sum(contagens.values()) + n_duplicados
+    if total == 0:
+        return "Nenhuma anomalia encontrada nas notas fiscais e nos itens."
+
+    partes = [f"Auditoria de anomalias ({n_notas} notas, {n_itens} itens):\n\n", "".join(resumo)]
+    for name, _ in CHECKS:
+        if contagens[name]:
+            partes.append("\n" + secoes[name]().rstrip("\n") + "\n")
+        if name == 'nota_negativa' and relatorio_duplicados:
+            partes.append("\n" + relatorio_duplicados.rstrip("\n") + "\n")
+    return "".join(partes)
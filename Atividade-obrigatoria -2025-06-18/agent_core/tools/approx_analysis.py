@@ -0,0 +1,64 @@
+from typing import Callable, Dict
+
+import pandas as pd
+
+from agent_core.sketches import DESCRICAO, NCM, ItemSketches
+from agent_core.tools.report import render_report
+
+# Versões aproximadas (NFE_APPROX_MODE) das ferramentas de estatística de itens: respondem
+# a partir dos sketches construídos no carregamento, sem percorrer os itens, e informam o
+# erro de cada estimativa.
+
+QUANTILES = [0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def distinct_products(sketches: ItemSketches) -> str:
+    hll = sketches.distinct[DESCRICAO]
+    return f"~{hll.estimate()} (estimativa, erro padrão de {hll.relative_error:.1%})"
+
+def analyze_items(sketches: ItemSketches) -> str:
+    return f"Análise dos itens: Total de itens: {sketches.rows}, Serviços únicos: {distinct_products(sketches)}"
+
+def top_products_by_total_quantity(sketches: ItemSketches, top_n: int = 10) -> str:
+    if sketches.rows == 0: return "Dados de itens não disponíveis."
+    hitters = sketches.heavy_hitters['produtos_quantidade']
+    top_products = pd.DataFrame(hitters.top(top_n), columns=[DESCRICAO, 'QUANTIDADE'])
+    if top_products.empty: return "Nenhum produto encontrado por quantidade."
+    return render_report(
+        f"Top {top_n} Produtos/Serviços por Quantidade Total Acumulada (aproximado, cada soma pode "
+        f"exceder a real em até {hitters.error_bound():.2f} com {1 - hitters.sketch.delta:.0%} de confiança):\n\n",
+        top_products, "- {}: {:.2f}\n", [DESCRICAO, 'QUANTIDADE']
+    )
+
+def summarize_items(sketches: ItemSketches) -> str:
+    """
+    Resumo estatístico dos itens pelos sketches: distintos, quantis e NCMs mais frequentes.
+    """
+    if sketches.rows == 0: return "Dados de itens não disponíveis."
+    linhas = [f"Resumo aproximado dos itens ({sketches.rows} linhas, sketches de ~{sketches.memory_bytes() // 1024} KB):", ""]
+    linhas.append("Valores distintos (HyperLogLog):")
+    for col, hll in sketches.distinct.items():
+        if hll.estimate():
+            linhas.append(f"- {col}: ~{hll.estimate()} (erro padrão de {hll.relative_error:.1%})")
+    linhas += ["", "Quantis (erro relativo de até "
+               f"{next(iter(sketches.quantiles.values())).relative_accuracy:.0%}):"]
+    for col, sketch in sketches.quantiles.items():
+        if sketch.count:
+            quantis = ", ".join(f"p{int(q * 100)} {sketch.quantile(q):.2f}" for q in QUANTILES)
+            linhas.append(f"- {col}: mín {sketch.min:.2f}, {quantis}, máx {sketch.max:.2f}")
+    hitters = sketches.heavy_hitters['ncm_frequencia']
+    if not hitters.candidates.empty:
+        linhas += ["", f"{NCM} mais frequentes (Count-Min, cada contagem pode exceder a real em até "
+                   f"{hitters.error_bound():.0f}):"]
+        linhas += [f"- {ncm}: ~{contagem:.0f} itens" for ncm, contagem in hitters.top(5)]
+    return "\n".join(linhas)
+
+def tool_functions(sketches: ItemSketches) -> Dict[str, Callable[[str], str]]:
+    """
+    Funções das ferramentas do agente (por nome) respondidas pelos sketches.
+    """
+    return {
+        'analisar_itens': lambda x: analyze_items(sketches),
+        'top_produtos_por_quantidade_total': lambda x: top_products_by_total_quantity(sketches),
+        'resumir_itens': lambda x: summarize_items(sketches),
+    }
@@ -1,43 +1,137 @@
+from typing import Optional
+
+import numpy as np
 import pandas as pd
 
-def validate_nfe_consistency(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame) -> str:
+from agent_core.columnar import STREAMING_MIN_BYTES, iter_table_chunks
+from agent_core.indexes import KeyIndex, build_indexes
+from agent_core.money import MoneyColumns, build_money, exceeds, from_cents, item_total_cents, sum_by_code, to_cents
+from agent_core.schema import shared_codes
+from agent_core.tools.report import render_report
+
+def _divergence_report(cabecalho_df: pd.DataFrame, soma_itens: pd.Series,
+                       max_rows: Optional[int] = None) -> str:
+    """
+    Monta o relatório de divergências a partir da soma dos itens de cada nota
+    (`soma_itens` alinhada às linhas de `cabecalho_df`).
+    """
+    merged_df = cabecalho_df[['CHAVE DE ACESSO', 'VALOR NOTA FISCAL']].copy()
+
+    # Comparação em centavos inteiros: sem erro de float acumulado; NaN em 'SOMA_ITENS' (notas sem itens) vira 0
+    valor_centavos = to_cents(merged_df['VALOR NOTA FISCAL'])
+    soma_centavos = to_cents(soma_itens)
+    diferenca = valor_centavos - soma_centavos
+    merged_df['SOMA_ITENS'] = from_cents(soma_centavos)
+    merged_df['DIFERENCA'] = from_cents(diferenca)
+
+    # Identificar divergências acima da tolerância da regra (notas sem valor não são comparadas)
+    divergencias = merged_df[merged_df['VALOR NOTA FISCAL'].notna().to_numpy() & exceeds(diferenca, 'nota_itens')]
+
+    if divergencias.empty:
+        return "Nenhuma divergência encontrada entre o valor total das notas e a soma dos itens."
+    else:
+        return render_report(
+            "Divergências encontradas entre o Valor Total da Nota e a Soma dos Itens:\n\n",
+            divergencias,
+            "- Chave de Acesso: {}\n"
+            "  Valor Total da Nota: R$ {:.2f}\n"
+            "  Soma dos Itens: R$ {:.2f}\n"
+            "  Diferença: R$ {:.2f}\n\n",
+            ['CHAVE DE ACESSO', 'VALOR NOTA FISCAL', 'SOMA_ITENS', 'DIFERENCA'],
+            max_rows
+        )
+
+def validate_nfe_consistency(cabecalho_df: pd.DataFrame, itens_df: pd.DataFrame,
+                             max_rows: Optional[int] = None, index: Optional[KeyIndex] = None,
+                             money: Optional[MoneyColumns] = None) -> str:
     """
     Valida a consistência entre o valor total da nota e a soma dos itens.
     Retorna um relatório de divergências ou confirma a consistência.
+    Com `max_rows`, lista apenas as primeiras divergências e informa o total.
+    Com as chaves das duas tabelas no mesmo dicionário, a junção usa os códigos do dicionário;
+    senão, com `index` (índice de 'CHAVE DE ACESSO' dos itens), os códigos do índice.
+    As somas são feitas em centavos inteiros; `money` traz o VALOR TOTAL já convertido.
     """
     if cabecalho_df.empty or itens_df.empty:
         return "Dados de cabeçalho ou itens não disponíveis para validação de consistência."
 
-    # Agrupar itens por 'CHAVE DE ACESSO' e somar 'VALOR TOTAL'
-    itens_agregados = itens_df.groupby('CHAVE DE ACESSO')['VALOR TOTAL'].sum().reset_index()
-    itens_agregados.rename(columns={'VALOR TOTAL': 'SOMA_ITENS'}, inplace=True)
+    centavos = item_total_cents(itens_df, money)
+    codigos = shared_codes(cabecalho_df['CHAVE DE ACESSO'], itens_df['CHAVE DE ACESSO'])
+    if codigos is not None:
+        # Chaves no mesmo dicionário nas duas tabelas: soma e junção direto pelos códigos
+        codigos_notas, codigos_itens, n_codigos = codigos
+        somas = sum_by_code(codigos_itens, centavos, n_codigos)
+        soma_itens = from_cents(np.where(codigos_notas >= 0, somas[codigos_notas], 0))
+    elif index is not None:
+        # Soma por código da chave e leva o resultado às notas pelos mesmos códigos
+        somas = sum_by_code(index.codes, centavos, len(index))
+        codigos_notas = index.codes_for(cabecalho_df['CHAVE DE ACESSO'])
+        soma_itens = from_cents(np.where(codigos_notas >= 0, somas[codigos_notas], 0))
+    else:
+        # Agrupar itens por 'CHAVE DE ACESSO' e somar 'VALOR TOTAL' (em centavos)
+        somas = pd.Series(centavos, index=itens_df.index).groupby(itens_df['CHAVE DE ACESSO'], observed=True).sum()
+        soma_itens = from_cents(cabecalho_df['CHAVE DE ACESSO'].map(somas).fillna(0))
 
-    # Mesclar com os dados do cabeçalho
-    merged_df = pd.merge(
-        cabecalho_df,
-        itens_agregados,
-        on='CHAVE DE ACESSO',
-        how='left'
-    )
+    return _divergence_report(cabecalho_df, soma_itens, max_rows)
 
-    # Preencher NaN em 'SOMA_ITENS' com 0 para notas sem itens
-    merged_df['SOMA_ITENS'].fillna(0, inplace=True)
+def validate_nfe_consistency_streaming(cabecalho_df: pd.DataFrame, itens_path: str,
+                                       chunksize: int = 500_000, cache_key: Optional[str] = None,
+                                       max_rows: Optional[int] = None) -> str:
+    """
+    Valida a consistência lendo o arquivo de Itens em blocos.
+    Apenas as somas parciais por 'CHAVE DE ACESSO' ficam em memória, então o pico de memória
+    não depende da quantidade de itens. O relatório é o mesmo da validação em memória.
+    """
+    if cabecalho_df.empty:
+        return "Dados de cabeçalho ou itens não disponíveis para validação de consistência."
 
-    # Calcular a diferença
-    merged_df['DIFERENCA'] = merged_df['VALOR NOTA FISCAL'] - merged_df['SOMA_ITENS']
+    somas = None
+    parciais = []
+    linhas_parciais = 0
+    total_itens = 0
+    categorias, somas_codigos = None, None
+    for chunk in iter_table_chunks(itens_path, ['CHAVE DE ACESSO', 'VALOR TOTAL'], chunksize, cache_key):
+        total_itens += len(chunk)
+        chaves = chunk['CHAVE DE ACESSO']
+        if isinstance(chaves.dtype, pd.CategoricalDtype) and (categorias is None or chaves.cat.categories is categorias):
+            # Blocos do arquivo colunar compartilham o dicionário das chaves: a soma acumula por código
+            if categorias is None:
+                categorias = chaves.cat.categories
+                somas_codigos = np.zeros(len(categorias), dtype=np.int64)
+            somas_codigos += sum_by_code(chaves.cat.codes.to_numpy(), to_cents(chunk['VALOR TOTAL']), len(categorias))
+            continue
+        parcial = pd.Series(to_cents(chunk['VALOR TOTAL']), index=chunk.index) \
+                    .groupby(chunk['CHAVE DE ACESSO'], observed=True, sort=False).sum()
+        parciais.append(parcial)
+        linhas_parciais += len(parcial)
+        # Compacta as somas parciais quando elas passam do dobro do mapa acumulado
+        if linhas_parciais > max(chunksize, 2 * (len(somas) if somas is not None else 0)):
+            somas = pd.concat(parciais).groupby(level=0, observed=True, sort=False).sum()
+            parciais = [somas]
+            linhas_parciais = len(somas)
 
-    # Identificar divergências (usando uma pequena tolerância para floats)
-    divergencias = merged_df[abs(merged_df['DIFERENCA']) > 0.01]
+    if total_itens == 0:
+        return "Dados de cabeçalho ou itens não disponíveis para validação de consistência."
 
-    if divergencias.empty:
-        return "Nenhuma divergência encontrada entre o valor total das notas e a soma dos itens."
-    else:
-        report = "Divergências encontradas entre o Valor Total da Nota e a Soma dos Itens:\n\n"
-        for _, row in divergencias.iterrows():
-            report += (
-                f"- Chave de Acesso: {row['CHAVE DE ACESSO']}\n"
-                f"  Valor Total da Nota: R$ {row['VALOR NOTA FISCAL']:.2f}\n"
-                f"  Soma dos Itens: R$ {row['SOMA_ITENS']:.2f}\n"
-                f"  Diferença: R$ {row['DIFERENCA']:.2f}\n\n"
-            )
-        return report 
\ No newline at end of file
+    if somas_codigos is not None:
+        parciais.append(pd.Series(somas_codigos, index=categorias))
+    somas = parciais[0] if len(parciais) == 1 else \
+        pd.concat(parciais).groupby(level=0, observed=True, sort=False).sum()
+
+    return _divergence_report(cabecalho_df, from_cents(cabecalho_df['CHAVE DE ACESSO'].map(somas).fillna(0)), max_rows)
+
+def validate_dataset_consistency(dataset, max_rows: Optional[int] = None,
+                                 min_stream_bytes: int = STREAMING_MIN_BYTES) -> str:
+    """
+    Valida a consistência de um dataset carregado escolhendo o caminho pelo tamanho dos Itens.
+    Itens vindos de um único arquivo com pelo menos `min_stream_bytes` (NFE_STREAMING_MIN_MB) são
+    somados em blocos a partir do disco; os demais, em memória com o índice da chave de acesso.
+    """
+    cabecalho_df, itens_df = dataset.frames()
+    fonte = dataset.stream_source('itens', min_stream_bytes)
+    if fonte is not None:
+        itens_path, cache_key = fonte
+        return validate_nfe_consistency_streaming(cabecalho_df, itens_path, cache_key=cache_key, max_rows=max_rows)
+    return validate_nfe_consistency(cabecalho_df, itens_df, max_rows,
+                                    index=dataset.derived('indexes', build_indexes).chave_itens,
+                                    money=dataset.derived('money', build_money))
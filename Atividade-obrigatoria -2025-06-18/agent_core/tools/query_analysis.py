@@ -0,0 +1,54 @@
+from typing import Optional
+
+import pandas as pd
+
+from agent_core.query import QueryError, parse_query
+from agent_core.tools.report import render_report
+
+# A descrição entra no prompt do agente, que é um template: as chaves do JSON vão duplicadas
+QUERY_TOOL_DESCRIPTION = (
+    "Consulta composta sobre os dados, para perguntas que combinam filtros, agrupamentos e rankings "
+    "(ex.: 'top 5 emitentes de SP em março'). A entrada é um JSON com os campos: "
+    "tabela ('cabecalho' ou 'itens'); filtros (lista de [coluna, operador, valor], operadores "
+    "==, !=, >, >=, <, <=, em, contem, nulo, nao_nulo); mes ('AAAA-MM') ou periodo ({{\"inicio\": \"AAAA-MM-DD\", "
+    "\"fim\": \"AAAA-MM-DD\"}}) sobre DATA EMISSÃO; agrupar_por (lista de colunas); agregacoes "
+    "({{nome: [coluna, funcao]}}, funções soma, media, contagem, minimo, maximo, distintos); "
+    "ordenar_por (coluna ou nome de agregação); crescente (true/false); top (N); colunas (lista, "
+    "para consultas sem agregação). Use os nomes exatos das colunas. Exemplo: "
+    "{{\"tabela\": \"cabecalho\", \"filtros\": [[\"UF EMITENTE\", \"==\", \"SP\"]], \"mes\": \"2024-03\", "
+    "\"agrupar_por\": [\"RAZÃO SOCIAL EMITENTE\"], \"agregacoes\": {{\"valor\": [\"VALOR NOTA FISCAL\", \"soma\"]}}, "
+    "\"top\": 5}}"
+)
+
+def _row_template(df: pd.DataFrame) -> str:
+    # Valores decimais com duas casas; demais colunas como texto
+    fields = [f"{col}: {{:.2f}}" if pd.api.types.is_float_dtype(df[col].dtype) else f"{col}: {{}}"
+              for col in df.columns]
+    return "- " + ", ".join(fields) + "\n"
+
+def run_query(source, spec: str, max_rows: Optional[int] = 20) -> str:
+    """
+    Executa uma consulta em JSON (filtros, agrupamento, agregações e top-k) sobre o dataset
+    e formata o resultado, uma linha por registro.
+    """
+    try:
+        query = parse_query(spec)
+        if not query.is_aggregate and query.top_n is None and max_rows is not None:
+            # Sem agregação, só as linhas exibidas são lidas; o total vem da máscara dos filtros
+            query = query.limit(max_rows if query.row_limit is None else min(query.row_limit, max_rows))
+        result = query.execute(source)
+    except QueryError as e:
+        return f"Consulta inválida: {str(e)}"
+    except Exception as e:
+        return f"Erro ao executar a consulta: {str(e)}"
+
+    frame = result.frame
+    if frame.empty: return "Nenhum registro encontrado para a consulta."
+    if query.is_aggregate:
+        title = f"Resultado da consulta ({len(frame)} linhas, {result.total} registros considerados):\n\n"
+        return render_report(title, frame, _row_template(frame), list(frame.columns), max_rows)
+    title = f"Resultado da consulta ({result.total} registros encontrados):\n\n"
+    report = render_report(title, frame, _row_template(frame), list(frame.columns))
+    if result.total > len(frame) and query.top_n is None:
+        report += f"\n... {result.total - len(frame)} registros omitidos (exibindo {len(frame)} de {result.total}).\n"
+    return report
@@ -0,0 +1,25 @@
+from typing import List, Optional
+
+import pandas as pd
+
+def render_rows(df: pd.DataFrame, template: str, columns: List[str]) -> List[str]:
+    """
+    Formata as linhas do relatório coluna a coluna.
+    `template` usa campos posicionais do str.format (ex.: "- {}: R$ {:.2f}\\n"),
+    preenchidos na ordem de `columns`.
+    """
+    return list(map(template.format, *(df[col].tolist() for col in columns)))
+
+def render_report(title: str, df: pd.DataFrame, template: str, columns: List[str],
+                  max_rows: Optional[int] = None) -> str:
+    """
+    Monta o relatório completo: título seguido de uma linha por registro de `df`.
+    Com `max_rows`, formata apenas os primeiros registros e informa quantos foram omitidos.
+    """
+    total = len(df)
+    if max_rows is not None and total > max_rows:
+        body = "".join(render_rows(df.head(max_rows), template, columns))
+        separator = "" if body.endswith("\n\n") else "\n"
+        summary = f"... {total - max_rows} registros omitidos (exibindo {max_rows} de {total}).\n"
+        return title + body + separator + summary
+    return title + "".join(render_rows(df, template, columns))
@@ -0,0 +1,295 @@
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+from agent_core.money import CENTS, TOLERANCES, from_cents
+from agent_core.schema import share_dictionary
+from agent_core.storage import TABLES, SQLAggregates, SQLStore, open_aggregates, open_store, quote
+from agent_core.tools import header_analysis as header
+from agent_core.tools import anomaly_audit as audit
+from agent_core.tools import item_analysis as items
+from agent_core.tools.consistency_validation import _divergence_report
+from agent_core.tools.query_analysis import run_query
+
+# Versões das ferramentas que consultam o banco local (`SQLStore`) em vez dos DataFrames.
+# O filtro ou agregado roda no banco e o resultado, já reduzido, passa pelas mesmas funções
+# de pandas, então os relatórios são os mesmos; só as mensagens de "nenhum resultado" são
+# repetidas aqui, porque as funções de pandas tratam um DataFrame vazio como dados ausentes.
+
+CHAVE = quote('CHAVE DE ACESSO')
+DESCRICAO = quote('DESCRIÇÃO DO PRODUTO/SERVIÇO')
+
+
+def _has(store: SQLStore, table: str, *cols: str) -> bool:
+    return all(col in store.columns(table) for col in cols)
+
+def _count(store: SQLStore, table: str) -> int:
+    return store.count(table)
+
+def _cents(expr: str) -> str:
+    # Reais para centavos inteiros no banco, com o mesmo arredondamento de `to_cents` (nulos continuam nulos)
+    return f"CAST(ROUND(({expr}) * {CENTS}) AS BIGINT)"
+
+def validate_nfe_consistency(store: SQLStore, max_rows=None) -> str:
+    if _count(store, 'cabecalho') == 0 or _count(store, 'itens') == 0:
+        return "Dados de cabeçalho ou itens não disponíveis para validação de consistência."
+    # Somas e comparação em centavos inteiros, como na versão em pandas
+    divergencias = store.query(
+        f"SELECT c.{CHAVE}, c.{quote('VALOR NOTA FISCAL')}, COALESCE(s.soma, 0) AS SOMA_ITENS "
+        f"FROM cabecalho c LEFT JOIN (SELECT {CHAVE}, SUM({_cents(quote('VALOR TOTAL'))}) AS soma FROM itens "
+        f"GROUP BY {CHAVE}) s ON s.{CHAVE} = c.{CHAVE} "
+        f"WHERE ABS({_cents('c.' + quote('VALOR NOTA FISCAL'))} - COALESCE(s.soma, 0)) > ? ORDER BY c.rowid",
+        [TOLERANCES['nota_itens']]
+    )
+    return _divergence_report(divergencias[['CHAVE DE ACESSO', 'VALOR NOTA FISCAL']],
+                              from_cents(divergencias['SOMA_ITENS']), max_rows)
+
+def list_notes_by_cnpj_emitter(store: SQLStore, cnpj: str, max_rows=None) -> str:
+    if _count(store, 'cabecalho') == 0: return "Dados de cabeçalho não disponíveis."
+    if not _has(store, 'cabecalho', 'CPF/CNPJ Emitente', 'CHAVE DE ACESSO', 'VALOR NOTA FISCAL'):
+        return header.list_notes_by_cnpj_emitter(store.probe('cabecalho'), cnpj, max_rows)
+    notas = store.query(f"SELECT {CHAVE}, {quote('VALOR NOTA FISCAL')}, {quote('CPF/CNPJ Emitente')} FROM cabecalho "
+                        f"WHERE {quote('CPF/CNPJ Emitente')} = ? ORDER BY rowid", [str(cnpj)])
+    if notas.empty: return f"Nenhuma nota fiscal encontrada para o CNPJ Emitente '{cnpj}'."
+    return header.list_notes_by_cnpj_emitter(notas, cnpj, max_rows)
+
+def find_negative_value_notes(store: SQLStore, max_rows=None) -> str:
+    if _count(store, 'cabecalho') == 0: return "Dados de cabeçalho não disponíveis."
+    if not _has(store, 'cabecalho', 'VALOR NOTA FISCAL', 'CHAVE DE ACESSO'):
+        return header.find_negative_value_notes(store.probe('cabecalho'), max_rows)
+    notas = store.query(f"SELECT {CHAVE}, {quote('VALOR NOTA FISCAL')} FROM cabecalho "
+                        f"WHERE {quote('VALOR NOTA FISCAL')} < 0 ORDER BY rowid")
+    if notas.empty: return "Nenhuma nota fiscal encontrada com valor total negativo."
+    return header.find_negative_value_notes(notas, max_rows)
+
+def find_duplicate_note_numbers(store: SQLStore, max_rows=None) -> str:
+    if _count(store, 'cabecalho') == 0: return "Dados de cabeçalho não disponíveis."
+    if not _has(store, 'cabecalho', 'NÚMERO'): return "Coluna 'NÚMERO' ausente."
+    numero = quote('NÚMERO')
+    notas = store.query(f"SELECT {numero}, {CHAVE} FROM cabecalho WHERE {numero} IN "
+                        f"(SELECT {numero} FROM cabecalho WHERE {numero} IS NOT NULL GROUP BY {numero} "
+                        f"HAVING COUNT(*) > 1) ORDER BY rowid")
+    if notas.empty: return "Nenhum número de nota fiscal duplicado encontrado."
+    return header.find_duplicate_note_numbers(notas.astype({'NÚMERO': 'Int64'}), max_rows)
+
+def list_top_expensive_items(store: SQLStore, top_n: int = 10) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis para listar produtos caros."
+    if not _has(store, 'itens', 'DESCRIÇÃO DO PRODUTO/SERVIÇO', 'VALOR UNITÁRIO'):
+        return items.list_top_expensive_items(store.probe('itens'), top_n)
+    valor = quote('VALOR UNITÁRIO')
+    top_items = store.query(f"SELECT {DESCRICAO}, MAX({valor}) AS {valor} FROM itens WHERE {valor} IS NOT NULL "
+                            f"GROUP BY {DESCRICAO} ORDER BY {valor} DESC, {DESCRICAO} LIMIT ?", [top_n])
+    if top_items.empty: return "Não há itens com valor unitário válido para análise."
+    return items.list_top_expensive_items(top_items, top_n)
+
+def list_product_ncm_pairs(store: SQLStore, max_rows=None) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis para listar descrições e NCMs."
+    tipo = quote('NCM/SH (TIPO DE PRODUTO)')
+    if not _has(store, 'itens', 'DESCRIÇÃO DO PRODUTO/SERVIÇO', 'NCM/SH (TIPO DE PRODUTO)'):
+        return items.list_product_ncm_pairs(store.probe('itens'), max_rows)
+    # Pares na ordem da primeira ocorrência, como no drop_duplicates
+    pares = store.query(f"SELECT {DESCRICAO}, {tipo} FROM itens GROUP BY {DESCRICAO}, {tipo} ORDER BY MIN(rowid)")
+    return items.list_product_ncm_pairs(pares, max_rows)
+
+def top_products_by_total_quantity(store: SQLStore, top_n: int = 10) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis."
+    if not _has(store, 'itens', 'DESCRIÇÃO DO PRODUTO/SERVIÇO', 'QUANTIDADE'):
+        return items.top_products_by_total_quantity(store.probe('itens'), top_n)
+    quantidade = quote('QUANTIDADE')
+    top_products = store.query(f"SELECT {DESCRICAO}, COALESCE(SUM({quantidade}), 0) AS {quantidade} FROM itens "
+                               f"WHERE {DESCRICAO} IS NOT NULL GROUP BY {DESCRICAO} "
+                               f"ORDER BY {quantidade} DESC, {DESCRICAO} LIMIT ?", [top_n])
+    if top_products.empty: return "Nenhum produto encontrado por quantidade."
+    return items.top_products_by_total_quantity(top_products, top_n)
+
+def total_value_by_ncm_code(store: SQLStore, ncm_code: str) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis."
+    if not _has(store, 'itens', 'CÓDIGO NCM/SH', 'VALOR TOTAL'):
+        return items.total_value_by_ncm_code(store.probe('itens'), ncm_code)
+    resultado = store.query(f"SELECT COUNT(*) AS n, COALESCE(SUM({quote('VALOR TOTAL')}), 0) AS total FROM itens "
+                            f"WHERE {quote('CÓDIGO NCM/SH')} = ?", [str(ncm_code)]).iloc[0]
+    if resultado['n'] == 0: return f"Nenhum item encontrado para o CÓDIGO NCM/SH '{ncm_code}'."
+    return f"O valor total de todos os itens para o CÓDIGO NCM/SH '{ncm_code}' é R$ {resultado['total']:.2f}."
+
+def list_items_by_access_key(store: SQLStore, chave: str, max_rows=None) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis."
+    if not _has(store, 'itens', 'CHAVE DE ACESSO', 'DESCRIÇÃO DO PRODUTO/SERVIÇO', 'QUANTIDADE', 'VALOR TOTAL'):
+        return items.list_items_by_access_key(store.probe('itens'), chave, max_rows)
+    chave = str(chave).strip()
+    itens_nota = store.query(f"SELECT {CHAVE}, {DESCRICAO}, {quote('QUANTIDADE')}, {quote('VALOR TOTAL')} "
+                             f"FROM itens WHERE {CHAVE} = ? ORDER BY rowid", [chave])
+    if itens_nota.empty: return f"Nenhum item encontrado para a Chave de Acesso '{chave}'."
+    return items.list_items_by_access_key(itens_nota, chave, max_rows)
+
+def _average(store: SQLStore, col: str) -> float:
+    return store.scalar(f"SELECT AVG({quote(col)}) FROM itens")
+
+def avg_item_quantity(store: SQLStore) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis."
+    if not _has(store, 'itens', 'QUANTIDADE'): return "Coluna 'QUANTIDADE' ausente."
+    avg_qty = _average(store, 'QUANTIDADE')
+    if avg_qty is None: return "Não foi possível calcular a quantidade média por item."
+    return f"A quantidade média por item em todas as notas é {avg_qty:.2f}."
+
+def avg_item_total_value(store: SQLStore) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis."
+    if not _has(store, 'itens', 'VALOR TOTAL'): return "Coluna 'VALOR TOTAL' ausente."
+    avg_value = _average(store, 'VALOR TOTAL')
+    if avg_value is None: return "Não foi possível calcular o valor total médio por item."
+    return f"O valor total médio de um item é R$ {avg_value:.2f}."
+
+def find_zero_unit_value_items(store: SQLStore, max_rows=None) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis."
+    if not _has(store, 'itens', 'DESCRIÇÃO DO PRODUTO/SERVIÇO', 'VALOR UNITÁRIO', 'CHAVE DE ACESSO'):
+        return items.find_zero_unit_value_items(store.probe('itens'), max_rows)
+    itens = store.query(f"SELECT {DESCRICAO}, {quote('VALOR UNITÁRIO')}, {CHAVE} FROM itens "
+                        f"WHERE COALESCE({quote('VALOR UNITÁRIO')}, 0) = 0 ORDER BY rowid")
+    if itens.empty: return "Nenhum item encontrado com valor unitário zerado."
+    return items.find_zero_unit_value_items(itens, max_rows)
+
+def find_negative_quantity_items(store: SQLStore, max_rows=None) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis."
+    if not _has(store, 'itens', 'DESCRIÇÃO DO PRODUTO/SERVIÇO', 'QUANTIDADE', 'CHAVE DE ACESSO'):
+        return items.find_negative_quantity_items(store.probe('itens'), max_rows)
+    itens = store.query(f"SELECT {DESCRICAO}, {quote('QUANTIDADE')}, {CHAVE} FROM itens "
+                        f"WHERE {quote('QUANTIDADE')} < 0 ORDER BY rowid")
+    if itens.empty: return "Nenhum item encontrado com quantidade negativa."
+    return items.find_negative_quantity_items(itens, max_rows)
+
+def find_inconsistent_item_values(store: SQLStore, max_rows=None) -> str:
+    if _count(store, 'itens') == 0: return "Dados de itens não disponíveis."
+    cols = ['QUANTIDADE', 'VALOR UNITÁRIO', 'VALOR TOTAL', 'DESCRIÇÃO DO PRODUTO/SERVIÇO', 'CHAVE DE ACESSO']
+    if not _has(store, 'itens', *cols):
+        return items.find_inconsistent_item_values(store.probe('itens'), max_rows)
+    quantidade, unitario, total = (f"COALESCE({quote(col)}, 0)" for col in cols[:3])
+    itens = store.query(f"SELECT {', '.join(quote(col) for col in cols)} FROM itens "
+                        f"WHERE ABS({_cents(total)} - {_cents(f'{quantidade} * {unitario}')}) > ? ORDER BY rowid",
+                        [TOLERANCES['item_total']])
+    if itens.empty: return "Nenhum item encontrado com inconsistência entre Valor Total e (Quantidade * Valor Unitário)."
+    return items.find_inconsistent_item_values(itens, max_rows)
+
+def audit_anomalies(store: SQLStore, max_rows=None) -> str:
+    if _count(store, 'cabecalho') == 0 or _count(store, 'itens') == 0:
+        return "Dados de cabeçalho ou itens não disponíveis para auditoria de anomalias."
+    if not _has(store, 'cabecalho', *audit.REQUIRED_CABECALHO) or not _has(store, 'itens', *audit.REQUIRED_ITENS):
+        return audit.MISSING_COLUMNS
+    valor, numero = quote('VALOR NOTA FISCAL'), quote('NÚMERO')
+    quantidade, unitario, total = (f"COALESCE({quote(col)}, 0)" for col in ('QUANTIDADE', 'VALOR UNITÁRIO', 'VALOR TOTAL'))
+    # Uma leitura por tabela traz só as linhas com alguma anomalia, marcadas por verificação;
+    # valores ausentes contam como zero e os valores monetários são comparados em centavos
+    notas = store.query(
+        f"SELECT c.{CHAVE}, c.{valor}, c.{numero}, COALESCE(s.soma, 0) AS SOMA_ITENS, "
+        f"COALESCE(c.{valor} IS NOT NULL AND ABS({_cents('c.' + valor)} - COALESCE(s.soma, 0)) > ?, 0) AS divergentes, "
+        f"s.n IS NULL AS sem_itens, COALESCE(c.{valor} = 0, 0) AS nota_zerada, COALESCE(c.{valor} < 0, 0) AS nota_negativa "
+        f"FROM cabecalho c LEFT JOIN (SELECT {CHAVE}, SUM({_cents(total)}) AS soma, COUNT(*) AS n FROM itens "
+        f"WHERE {CHAVE} IS NOT NULL GROUP BY {CHAVE}) s ON s.{CHAVE} = c.{CHAVE} "
+        f"WHERE s.n IS NULL OR c.{valor} <= 0 OR ABS({_cents('c.' + valor)} - COALESCE(s.soma, 0)) > ? ORDER BY c.rowid",
+        [TOLERANCES['nota_itens']] * 2
+    )
+    linhas_itens = store.query(
+        f"SELECT {', '.join(quote(col) for col in audit.REQUIRED_ITENS)}, {unitario} = 0 AS unitario_zerado, "
+        f"{quantidade} < 0 AS quantidade_negativa, "
+        f"ABS({_cents(total)} - {_cents(f'{quantidade} * {unitario}')}) > ? AS item_inconsistente FROM itens "
+        f"WHERE {unitario} = 0 OR {quantidade} < 0 OR ABS({_cents(total)} - {_cents(f'{quantidade} * {unitario}')}) > ? "
+        f"ORDER BY rowid",
+        [TOLERANCES['item_total']] * 2
+    )
+    flagged = lambda df, name: df[df[name].astype(bool)]
+    contagens = {name: int((notas if name in notas.columns else linhas_itens)[name].sum()) for name, _ in audit.CHECKS}
+    n_duplicados = int(store.scalar(f"SELECT COUNT(*) FROM (SELECT {numero} FROM cabecalho WHERE {numero} IS NOT NULL "
+                                    f"GROUP BY {numero} HAVING COUNT(*) > 1) d") or 0)
+    relatorio_duplicados = find_duplicate_note_numbers(store, max_rows) if n_duplicados else None
+    return audit.render_audit(_count(store, 'cabecalho'), _count(store, 'itens'), contagens,
+                              lambda name: flagged(notas, name), lambda name: flagged(linhas_itens, name),
+                              from_cents(flagged(notas, 'divergentes')['SOMA_ITENS']),
+                              (n_duplicados, relatorio_duplicados), max_rows)
+
+def _describe_order(summaries) -> list:
+    # Linhas do resumo na mesma ordem do DataFrame.describe(include='all')
+    names = []
+    for index in sorted((summary.index for summary in summaries), key=len):
+        names += [name for name in index if name not in names]
+    return names
+
+def _column(store: SQLStore, table: str, col: str) -> pd.Series:
+    if col != 'CHAVE DE ACESSO':
+        return store.read_table(table, [col])[col]
+    # Chave no dicionário comum às duas tabelas, como nos DataFrames carregados (ver `share_dictionary`)
+    tabelas = {name: store.read_table(name, [col]) for name in TABLES}
+    share_dictionary(tabelas['cabecalho'], tabelas['itens'], col)
+    return tabelas[table][col]
+
+def describe_table(store: SQLStore, table: str) -> str:
+    """
+    Resumo estatístico da tabela (como `describe(include='all')`), lendo uma coluna por vez do banco.
+    """
+    summaries = [_column(store, table, col).describe() for col in store.columns(table)]
+    names = _describe_order(summaries)
+    return pd.concat([summary.reindex(names) for summary in summaries], axis=1, sort=False).to_string()
+
+def items_summary(store: SQLStore) -> dict:
+    descricoes = store.scalar(f"SELECT COUNT(DISTINCT {DESCRICAO}) FROM itens")
+    return {'quantidade': _count(store, 'itens'), 'servicos': int(descricoes or 0)}
+
+def tool_functions(store: SQLStore, aggregates: Optional[SQLAggregates] = None,
+                   max_rows: Optional[int] = None) -> Dict[str, Callable[[str], str]]:
+    """
+    Funções das ferramentas do agente (por nome) respondidas pelo banco local.
+    As ferramentas de cabeçalho baseadas em agregados recebem os agregados calculados no banco;
+    `max_rows` limita as linhas dos relatórios em lista.
+    """
+    aggregates = aggregates or SQLAggregates(store)
+    cabecalho = lambda: store.probe('cabecalho')
+
+    def analisar_itens(x: str) -> str:
+        resumo = items_summary(store)
+        return f"Análise dos itens: Total de itens: {resumo['quantidade']}, Serviços únicos: {resumo['servicos']}"
+
+    return {
+        'analisar_cabecalhos': lambda x: (
+            f"Análise do cabeçalho: Total de notas: {aggregates.summary()['quantidade']}, "
+            f"Valor total: R$ {aggregates.summary()['soma']:,.2f}"),
+        'analisar_itens': analisar_itens,
+        'validar_consistencia': lambda x: validate_nfe_consistency(store, max_rows),
+        'listar_top_produtos_caros': lambda x: list_top_expensive_items(store, 10),
+        'listar_descricoes_ncm': lambda x: list_product_ncm_pairs(store, max_rows),
+        'analisar_top_emitentes_por_valor': lambda x: header.analyze_top_emitters_by_value(cabecalho(), aggregates=aggregates),
+        'contar_notas_por_uf_emitente': lambda x: header.count_notes_by_uf_emitter(cabecalho(), aggregates=aggregates),
+        'valor_medio_por_municipio_emitente': lambda x: header.avg_note_value_by_municipio_emitter(cabecalho(), max_rows, aggregates=aggregates),
+        'listar_notas_por_cnpj_emitente': lambda cnpj: list_notes_by_cnpj_emitter(store, cnpj, max_rows),
+        'analisar_top_destinatarios_por_valor': lambda x: header.analyze_top_recipients_by_value(cabecalho(), aggregates=aggregates),
+        'contar_notas_por_uf_destinatario': lambda x: header.count_notes_by_uf_recipient(cabecalho(), aggregates=aggregates),
+        'contar_notas_por_municipio_destinatario': lambda x: header.count_notes_by_municipio_recipient(cabecalho(), max_rows, aggregates=aggregates),
+        'valor_total_por_mes': lambda x: header.total_value_by_month(cabecalho(), aggregates=aggregates),
+        'contar_notas_por_data_especifica': lambda date_str: header.count_notes_by_specific_date(cabecalho(), date_str, aggregates=aggregates),
+        'dia_semana_maior_emissao': lambda x: header.day_of_week_highest_emission(cabecalho(), aggregates=aggregates),
+        'contar_notas_por_natureza_operacao': lambda x: header.count_notes_by_natureza_operacao(cabecalho(), aggregates=aggregates),
+        'valor_total_por_natureza_operacao': lambda natureza: header.total_value_by_natureza_operacao(cabecalho(), natureza, aggregates=aggregates),
+        'encontrar_notas_valor_negativo': lambda x: find_negative_value_notes(store, max_rows),
+        'encontrar_numeros_nota_duplicados': lambda x: find_duplicate_note_numbers(store, max_rows),
+        'top_produtos_por_quantidade_total': lambda x: top_products_by_total_quantity(store),
+        'valor_total_por_codigo_ncm': lambda ncm: total_value_by_ncm_code(store, ncm),
+        'listar_itens_por_chave_acesso': lambda chave: list_items_by_access_key(store, chave, max_rows),
+        'quantidade_media_por_item': lambda x: avg_item_quantity(store),
+        'encontrar_itens_valor_unitario_zerado': lambda x: find_zero_unit_value_items(store, max_rows),
+        'valor_total_medio_de_item': lambda x: avg_item_total_value(store),
+        'encontrar_itens_quantidade_negativa': lambda x: find_negative_quantity_items(store, max_rows),
+        'encontrar_inconsistencias_valor_item': lambda x: find_inconsistent_item_values(store, max_rows),
+        'identificar_anomalias': lambda x: audit_anomalies(store, max_rows=20),
+        'consultar_dados': lambda spec: run_query(store, spec),
+        'listar_colunas_cabecalho': lambda x: f"Colunas disponíveis no dataset Cabecalhos: {', '.join(store.columns('cabecalho'))}",
+        'listar_colunas_itens': lambda x: f"Colunas disponíveis no dataset Itens: {', '.join(store.columns('itens'))}",
+        'resumir_cabecalho': lambda x: describe_table(store, 'cabecalho'),
+        'resumir_itens': lambda x: describe_table(store, 'itens'),
+    }
+
+def dataset_tool_functions(dataset, max_rows: Optional[int] = None) -> Optional[Dict[str, Callable[[str], str]]]:
+    """
+    Funções de `tool_functions` para o banco local do dataset (uso com `dataset.derived`),
+    ou None quando NFE_STORAGE está desligado. O roteador usa as funções sem limite de linhas
+    e o agente as monta com `max_rows`; o banco e os agregados são os mesmos.
+    """
+    store = dataset.derived('sql_store', open_store)
+    if store is None:
+        return None
+    return tool_functions(store, dataset.derived('sql_aggregates', open_aggregates), max_rows)
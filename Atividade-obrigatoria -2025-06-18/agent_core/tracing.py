@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+_current_span = contextvars.ContextVar('nfe_current_span', default=None)
+
+
+class Span:
+    """
+    Intervalo medido de uma etapa do pipeline, no formato de span do OpenTelemetry.
+    """
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = 'OK'
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def fail(self, error: BaseException) -> None:
+        """
+        Marca o span como falho, inclusive quando o erro foi tratado e não se propaga.
+        """
+        self.status = 'ERROR'
+        self.attributes['error'] = str(error)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if error is not None:
+            self.fail(error)
+
+    def to_dict(self) -> dict:
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.start_ns + int((self.duration_ms or 0) * 1e6),
+            'durationMs': round(self.duration_ms or 0, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Registra os spans concluídos em memória (últimos `max_spans`) e, com `path`,
+    exporta cada span como uma linha JSON.
+    """
+
+    def __init__(self, path: Optional[str] = None, enabled: bool = True, max_spans: int = 2000):
+        self.path = path
+        self.enabled = enabled
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def start(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        return Span(name, parent or _current_span.get(), attributes)
+
+    def end(self, span: Span, error: Optional[BaseException] = None) -> None:
+        span.finish(error)
+        if not self.enabled:
+            return
+        record = span.to_dict()
+        with self._lock:
+            self._spans.append(record)
+            if self.path:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                except OSError as e:
+                    logger.warning(f"Não foi possível gravar o span em {self.path}: {str(e)}")
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Mede o bloco como um span filho do span corrente.
+        """
+        span = self.start(name, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            _current_span.reset(token)
+            self.end(span, e)
+            raise
+        _current_span.reset(token)
+        self.end(span)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def spans(self) -> List[dict]:
+        with self._lock:
+            return list(self._spans)
+
+    def last_trace(self) -> List[dict]:
+        """
+        Spans do rastreamento mais recente, em ordem de início.
+        """
+        spans = self.spans()
+        if not spans:
+            return []
+        trace_id = spans[-1]['traceId']
+        return sorted((s for s in spans if s['traceId'] == trace_id), key=lambda s: s['startTimeUnixNano'])
+
+
+def df_attributes(prefix: str, df: pd.DataFrame) -> Dict[str, int]:
+    """
+    Tamanho de um DataFrame como atributos de span (sem percorrer o conteúdo das colunas de texto).
+    """
+    return {
+        f'{prefix}.rows': len(df),
+        f'{prefix}.columns': len(df.columns),
+        f'{prefix}.bytes': int(df.memory_usage(deep=False).sum()),
+    }
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Converte as chamadas de LLM e de ferramentas do LangChain em spans.
+    """
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._runs = {}
+
+    def _start(self, run_id, name: str, **attributes) -> None:
+        self._runs[run_id] = self.tracer.start(name, **attributes)
+
+    def _end(self, run_id, error: Optional[BaseException] = None, **attributes) -> None:
+        span = self._runs.pop(run_id, None)
+        if span is not None:
+            span.set(**attributes)
+            self.tracer.end(span, error)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._start(run_id, 'llm.call', prompt_chars=sum(len(p) for p in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        chars = sum(len(str(m.content)) for batch in messages for m in batch)
+        self._start(run_id, 'llm.call', prompt_chars=chars)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        texts = [g.text for batch in response.generations for g in batch]
+        llm_output = response.llm_output or {}
+        usage = dict(llm_output.get('token_usage') or llm_output.get('usage_metadata') or {})
+        completion_chars = sum(len(t) for t in texts)
+        if not usage:
+            # Provedor sem contagem de tokens: estimativa de ~4 caracteres por token
+            span = self._runs.get(run_id)
+            prompt_chars = span.attributes.get('prompt_chars', 0) if span else 0
+            usage = {'estimated_prompt': prompt_chars // 4, 'estimated_completion': completion_chars // 4}
+        self._end(run_id, completion_chars=completion_chars, **{f'tokens.{k}': v for k, v in usage.items()})
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        self._start(run_id, 'tool.call', tool=(serialized or {}).get('name'), input=str(input_str)[:200])
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        self._end(run_id, output_chars=len(str(output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+
+tracer = Tracer(
+    path=os.getenv("NFE_TRACE_FILE") or None,
+    enabled=os.getenv("NFE_TRACING", "1") != "0"
+)
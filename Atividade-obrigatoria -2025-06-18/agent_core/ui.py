@@ -1,8 +1,11 @@
+import io
+import uuid
+import zipfile
 import streamlit as st
-from agent_core.utils import extract_zip, find_data_files
-from agent_core.agent import run_agent_with_middlewares
-import os
-import shutil
+from agent_core.async_runtime import runtime
+from agent_core.dataset import fingerprint_bytes
+from agent_core.dataset_pool import acquire_upload, dataset_pool
+from agent_core.ingest import ZipBombError, data_members
 
 def render_chat_interface():
     st.markdown("""
@@ -20,25 +23,25 @@ def render_chat_interface():
         st.session_state.chat_history = []
     if 'uploaded_file' not in st.session_state:
         st.session_state.uploaded_file = None
-    if 'temp_dir' not in st.session_state:
-        st.session_state.temp_dir = None
+    if 'zip_files' not in st.session_state:
+        st.session_state.zip_files = None
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 
     with st.sidebar:
         uploaded_file = st.file_uploader("Carregue arquivo ZIP", type=["zip"])
         if uploaded_file:
-            temp_zip_path = "temp_zip.zip"
-            with open(temp_zip_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            temp_dir = extract_zip(temp_zip_path)
-            st.session_state.uploaded_file = uploaded_file
-            st.session_state.temp_dir = temp_dir
-            st.success("Arquivo carregado!")
-            if os.path.exists(temp_zip_path):
-                os.remove(temp_zip_path)
-        if st.session_state.temp_dir:
-            files = find_data_files(st.session_state.temp_dir)
-            st.markdown("**Arquivos extraídos:**")
-            for f in files:
+            # O ZIP fica apenas na memória; os membros são lidos direto do buffer, sem arquivos temporários
+            try:
+                with zipfile.ZipFile(io.BytesIO(uploaded_file.getvalue())) as zf:
+                    st.session_state.zip_files = [info.filename for info in data_members(zf)]
+                st.session_state.uploaded_file = uploaded_file
+                st.success("Arquivo carregado!")
+            except (zipfile.BadZipFile, ZipBombError) as e:
+                st.error(f"ZIP inválido: {e}")
+        if st.session_state.zip_files:
+            st.markdown("**Arquivos no ZIP:**")
+            for f in st.session_state.zip_files:
                 st.markdown(f"- {f}")
 
     st.divider()
@@ -49,28 +52,46 @@ def render_chat_interface():
         else:
             st.markdown(f"<div class='stChatMessage agent'><b>Agente:</b> {msg['content']}</div>", unsafe_allow_html=True)
 
-    if st.session_state.temp_dir:
+    if st.session_state.zip_files:
         with st.form(key="chat_form", clear_on_submit=True):
             user_input = st.text_input("Digite sua pergunta:", key="chat_input", placeholder="Ex: Quais notas fiscais têm valor acima de R$ 10.000?")
             submit = st.form_submit_button("Enviar")
         if submit and user_input:
             st.session_state.chat_history.append({"role": "user", "content": user_input})
-            with st.spinner("Processando resposta..."):
-                try:
-                    response = run_agent_with_middlewares(user_input, st.session_state.temp_dir, find_data_files)
-                    st.session_state.chat_history.append({"role": "agent", "content": response})
-                    st.experimental_rerun()
-                except Exception as e:
-                    st.session_state.chat_history.append({"role": "agent", "content": f"Erro: {e}"})
-                    st.experimental_rerun()
+            st.markdown(f"<div class='stChatMessage user'><b>Você:</b> {user_input}</div>", unsafe_allow_html=True)
+            try:
+                # O dataset vem do pool do processo: sessões com o mesmo ZIP compartilham uma única cópia
+                zip_bytes = st.session_state.uploaded_file.getvalue()
+                dataset = acquire_upload(st.session_state, zip_bytes, fingerprint_bytes(zip_bytes))
+                if dataset is None:
+                    response = "Não foi possível carregar todos os arquivos necessários."
+                else:
+                    # A resposta aparece em fluxo; o agente roda no loop assíncrono compartilhado entre as sessões
+                    placeholder = st.empty()
+                    texto = ""
+                    response = ""
+                    for event in runtime.stream(user_input, dataset):
+                        if event.kind == 'token':
+                            texto += event.text
+                        elif event.kind == 'action':
+                            texto += f"\n\n🔧 {event.text}\n\n"
+                        elif event.kind == 'answer':
+                            response = event.text
+                        placeholder.markdown(f"<div class='stChatMessage agent'><b>Agente:</b> {texto}▌</div>",
+                                             unsafe_allow_html=True)
+                st.session_state.chat_history.append({"role": "agent", "content": response})
+                st.experimental_rerun()
+            except Exception as e:
+                st.session_state.chat_history.append({"role": "agent", "content": f"Erro: {e}"})
+                st.experimental_rerun()
     else:
         st.info("Faça upload de um arquivo ZIP na barra lateral para começar a conversar com o agente.")
 
-    # Limpeza do diretório temporário ao final da sessão
+    # Limpeza do histórico e do upload da sessão
     if st.button("Limpar histórico e arquivos", type="primary"):
+        dataset_pool.release(st.session_state.session_id)
+        st.session_state.dataset_key = None
         st.session_state.chat_history = []
-        if st.session_state.temp_dir and os.path.exists(st.session_state.temp_dir):
-            shutil.rmtree(st.session_state.temp_dir)
-        st.session_state.temp_dir = None
+        st.session_state.zip_files = None
         st.session_state.uploaded_file = None
         st.success("Histórico e arquivos limpos!") 
\ No newline at end of file
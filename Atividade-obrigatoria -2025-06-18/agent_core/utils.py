@@ -1,12 +1,13 @@
 import os
-import zipfile
-import tempfile
+import unicodedata
 
-def extract_zip(uploaded_file):
-    temp_dir = tempfile.mkdtemp()
-    with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
-    return temp_dir
+# Extensões dos arquivos de dados aceitos, em pastas e em ZIPs
+DATA_EXTENSIONS = ('.csv', '.xlsx', '.xls')
 
 def find_data_files(dir_path):
-    return [f for f in os.listdir(dir_path) if f.endswith(('.csv', '.xlsx'))] 
\ No newline at end of file
+    return [f for f in os.listdir(dir_path) if f.lower().endswith(DATA_EXTENSIONS)]
+
+def normalize_text(text):
+    # Minúsculas, sem acentos e com espaços colapsados
+    sem_acentos = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.lower().split())
@@ -1,9 +1,15 @@
 import streamlit as st
+import io
 import os
-import tempfile
 import zipfile
 import pandas as pd
-from agent_core.agent import run_agent_with_middlewares
+from agent_core.async_runtime import runtime
+from agent_core.dataset import fingerprint_bytes
+from agent_core.ingest import ZipBombError, data_members
+from agent_core.dataset_pool import PoolMemoryError, acquire_upload, dataset_pool
+from agent_core.answer_cache import answer_cache
+from agent_core.router import router
+from agent_core.tracing import tracer
 import logging
 
 # Configuração do logger
@@ -13,57 +19,97 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def find_data_files(temp_dir: str) -> list:
-    """Lista todos os arquivos de dados no diretório temporário."""
-    logger.info(f"Procurando arquivos em: {temp_dir}")
-    files = []
-    for file in os.listdir(temp_dir):
-        if file.endswith(('.csv', '.xlsx', '.xls')):
-            files.append(file)
-    logger.info(f"Arquivos encontrados: {files}")
-    return files
+def render_agent_stream(question, dataset) -> str:
+    """
+    Mostra a execução do agente em tempo real e retorna a resposta final.
+    """
+    passos = st.status("Processando sua pergunta...", expanded=False)
+    placeholder = st.empty()
+    texto = ""
+    response = ""
+    for event in runtime.stream(question, dataset):
+        if event.kind == 'token':
+            texto += event.text
+            placeholder.markdown(texto + "▌")
+        elif event.kind == 'action':
+            passos.write(f"🔧 {event.text}")
+        elif event.kind == 'observation':
+            passos.caption(event.text[:300])
+            texto = ""
+        elif event.kind == 'answer':
+            response = event.text
+    passos.update(label="Concluído", state="complete")
+    placeholder.write(response)
+    return response
 
 def main():
     st.title("📊 Análise de Notas Fiscais")
+    debug_panel = st.sidebar.checkbox("Mostrar rastreamento", value=os.getenv("NFE_DEBUG_PANEL") == "1")
     
     # Upload do arquivo ZIP
     uploaded_file = st.file_uploader("Faça upload do arquivo ZIP com as notas fiscais", type=['zip'])
     
     if uploaded_file is not None:
-        # Cria diretório temporário
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Salva o arquivo ZIP
-            zip_path = os.path.join(temp_dir, "notas.zip")
-            with open(zip_path, "wb") as f:
-                f.write(uploaded_file.getvalue())
+        try:
+            with tracer.span('app.upload', file=uploaded_file.name) as span:
+                # Os arquivos são lidos direto do ZIP em memória, sem extração para o disco;
+                # o hash do upload identifica o dataset, compartilhado com as sessões que enviarem o mesmo ZIP
+                zip_bytes = uploaded_file.getvalue()
+                dataset_key = fingerprint_bytes(zip_bytes)
+                with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+                    files = [info.filename for info in data_members(zf)]
+                dataset = acquire_upload(st.session_state, zip_bytes, dataset_key) if files else None
+                span.set(zip_bytes=len(zip_bytes), files=len(files))
+        except (zipfile.BadZipFile, ZipBombError) as e:
+            st.error(f"❌ ZIP inválido: {str(e)}")
+            return
+        except PoolMemoryError as e:
+            st.error(f"❌ {str(e)}")
+            return
+        
+        # Lista os arquivos do ZIP
+        if files:
+            st.success(f"✅ {len(files)} arquivos encontrados!")
+            st.write("Arquivos disponíveis:")
+            for file in files:
+                st.write(f"- {file}")
             
-            # Extrai o ZIP
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
+            if dataset is None:
+                st.error("❌ Não foi possível carregar os arquivos de Cabeçalho e Itens do ZIP!")
+                return
             
-            # Lista os arquivos extraídos
-            files = find_data_files(temp_dir)
-            if files:
-                st.success(f"✅ {len(files)} arquivos encontrados!")
-                st.write("Arquivos disponíveis:")
-                for file in files:
-                    st.write(f"- {file}")
-                
-                # Interface de perguntas
-                st.subheader("💭 Faça sua pergunta")
-                question = st.text_input("Digite sua pergunta sobre os dados:")
-                
-                if question:
-                    try:
-                        # Processa a pergunta
-                        with st.spinner("Processando sua pergunta..."):
-                            response = run_agent_with_middlewares(question, temp_dir, find_data_files)
-                            st.write("Resposta:")
-                            st.write(response)
-                    except Exception as e:
-                        st.error(f"Erro ao processar pergunta: {str(e)}")
-            else:
-                st.error("❌ Nenhum arquivo de dados encontrado no ZIP!")
+            # Interface de perguntas
+            st.subheader("💭 Faça sua pergunta")
+            question = st.text_input("Digite sua pergunta sobre os dados:")
+            
+            if question:
+                try:
+                    # Processa a pergunta no loop assíncrono compartilhado, exibindo os tokens e as
+                    # ferramentas chamadas à medida que o agente avança
+                    st.write("Resposta:")
+                    render_agent_stream(question, dataset)
+                    cache_stats = answer_cache.stats()
+                    st.caption(f"Cache de respostas: {cache_stats['hits']} acertos, {cache_stats['misses']} perdas")
+                    router_stats = router.stats()
+                    st.caption(f"Respostas diretas (sem LLM): {router_stats['hits']} de {router_stats['hits'] + router_stats['misses']}, "
+                               f"~{router_stats['saved_seconds']:.1f}s economizados")
+                    pool_stats = dataset_pool.stats()
+                    st.caption(f"Datasets em memória: {pool_stats['datasets']} ({pool_stats['mb']:.0f} MB), "
+                               f"compartilhados por {pool_stats['sessions']} sessões")
+                    
+                    # Painel de depuração com as etapas da última pergunta
+                    if debug_panel:
+                        with st.expander("🔎 Rastreamento da última pergunta"):
+                            spans = tracer.last_trace()
+                            st.dataframe(pd.DataFrame({
+                                'etapa': [s['name'] for s in spans],
+                                'duração (ms)': [s['durationMs'] for s in spans],
+                                'atributos': [str(s['attributes']) for s in spans],
+                            }))
+                except Exception as e:
+                    st.error(f"Erro ao processar pergunta: {str(e)}")
+        else:
+            st.error("❌ Nenhum arquivo de dados encontrado no ZIP!")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,58 @@
+import sys
+import json
+import argparse
+
+
+# Acréscimos de memória abaixo deste valor (MB) são ruído do alocador, mesmo acima do limite relativo
+MIN_MEMORY_MB = 16
+
+
+def compare(base: dict, current: dict, threshold: float = 0.2) -> list:
+    """
+    Compara os tempos e o pico de memória de cada etapa em duas execuções; retorna as etapas que
+    ficaram mais lentas ou usaram mais memória que o limite, ou que falharam na execução atual.
+    """
+    base_times = {r['name']: r['seconds'] for r in base['results']}
+    base_memory = {r['name']: r.get('step_peak_mb') for r in base['results']}
+    regressions = []
+    print(f"{'etapa':<50} {base.get('commit') or 'base':>12} {current.get('commit') or 'atual':>12}   razão")
+    for result in current['results']:
+        if 'error' in result:
+            # O tempo de uma etapa com erro não mede o caminho esperado
+            print(f"{result['name']:<50} {'':>12} {'':>12}   erro: {result['error']}")
+            regressions.append(result['name'])
+            continue
+        before = base_times.get(result['name'])
+        if not before:
+            continue
+        ratio = result['seconds'] / before
+        flag = "  <-- regressão" if ratio > 1 + threshold else ""
+        print(f"{result['name']:<50} {before * 1000:>10.1f}ms {result['seconds'] * 1000:>10.1f}ms   {ratio:5.2f}{flag}")
+        memory_before, memory = base_memory.get(result['name']), result.get('step_peak_mb')
+        if memory_before is not None and memory is not None and \
+                memory > memory_before * (1 + threshold) and memory - memory_before > MIN_MEMORY_MB:
+            print(f"{'':<50} {memory_before:>10.1f}MB {memory:>10.1f}MB   memória  <-- regressão")
+            flag = flag or "memória"
+        if flag:
+            regressions.append(result['name'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dois relatórios JSON do benchmark.")
+    parser.add_argument("base")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Aumento relativo tolerado (padrão: 20%%)")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    if base.get('scale') != current.get('scale'):
+        print(f"Atenção: escalas diferentes ({base.get('scale')} x {current.get('scale')})")
+    sys.exit(1 if compare(base, current, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
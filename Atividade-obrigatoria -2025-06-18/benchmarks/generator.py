@@ -0,0 +1,185 @@
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Configuração do logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Escalas em quantidade de itens (cada nota tem em média 3 itens)
+SCALES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+UFS = ['AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA', 'PB',
+       'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO']
+# Peso aproximado de cada UF no volume de notas (SP, MG, RJ, PR, RS e SC concentram a maior parte)
+UF_WEIGHTS = np.array([1, 2, 2, 1, 6, 4, 3, 3, 4, 2, 12, 2, 3, 3, 2, 5, 1, 8, 10, 2, 1, 1, 8, 6, 1, 30, 1], dtype=float)
+MUNICIPIOS_POR_UF = 12
+NATUREZAS = ['VENDA', 'VENDA DE MERCADORIA', 'REMESSA', 'DEVOLUCAO DE COMPRA', 'PRESTACAO DE SERVICO',
+             'TRANSFERENCIA', 'BONIFICACAO', 'OUTRAS SAIDAS']
+UNIDADES = ['UN', 'CX', 'KG', 'LT', 'PC', 'M']
+NCM_CODES = 10_000
+PRODUTOS = 20_000
+MODELO = '55 - NF-E EMITIDA EM SUBSTITUIÇÃO AO MODELO 1 OU 1A'
+
+# Taxas das anomalias injetadas
+ANOMALIAS = {
+    'nota_sem_itens': 0.005,
+    'nota_divergente': 0.02,
+    'nota_valor_negativo': 0.002,
+    'numero_duplicado': 0.001,
+    'item_valor_unitario_zero': 0.01,
+    'item_quantidade_negativa': 0.003,
+    'item_total_inconsistente': 0.01,
+}
+
+
+def _digits(rng: np.random.Generator, count: int, width: int) -> np.ndarray:
+    return np.array([f"{value:0{width}d}" for value in rng.integers(10 ** (width - 1), 10 ** width, count)])
+
+
+class _Catalog:
+    """
+    Cadastros fixos (emitentes, destinatários, municípios, produtos) compartilhados por todos os blocos.
+    """
+
+    def __init__(self, rng: np.random.Generator, n_notes: int):
+        self.municipios = np.array([f"MUNICIPIO {uf} {i:02d}" for uf in UFS for i in range(MUNICIPIOS_POR_UF)])
+        self.n_emitentes = max(50, n_notes // 200)
+        self.n_destinatarios = max(50, n_notes // 50)
+        self.cnpj_emitentes = _digits(rng, self.n_emitentes, 14)
+        self.cnpj_destinatarios = _digits(rng, self.n_destinatarios, 14)
+        self.ie_emitentes = _digits(rng, self.n_emitentes, 9)
+        self.uf_emitentes = rng.choice(len(UFS), self.n_emitentes, p=UF_WEIGHTS / UF_WEIGHTS.sum())
+        self.uf_destinatarios = rng.choice(len(UFS), self.n_destinatarios, p=UF_WEIGHTS / UF_WEIGHTS.sum())
+        self.mun_emitentes = self.uf_emitentes * MUNICIPIOS_POR_UF + rng.integers(0, MUNICIPIOS_POR_UF, self.n_emitentes)
+        self.mun_destinatarios = (self.uf_destinatarios * MUNICIPIOS_POR_UF
+                                  + rng.integers(0, MUNICIPIOS_POR_UF, self.n_destinatarios))
+        self.ncm = rng.choice(np.arange(10_000_000, 99_999_999), NCM_CODES, replace=False)
+        self.produto_ncm = rng.integers(0, NCM_CODES, PRODUTOS)
+        self.produto_preco = np.round(np.exp(rng.normal(3.5, 1.5, PRODUTOS)), 2) + 0.01
+        self.produto_unidade = rng.integers(0, len(UNIDADES), PRODUTOS)
+
+
+def _block(rng: np.random.Generator, catalog: _Catalog, prefix: str, first: int, count: int):
+    notas = np.arange(first, first + count)
+    chaves = np.array([f"{prefix}{i:038d}" for i in notas])
+    emitentes = rng.integers(0, catalog.n_emitentes, count)
+    destinatarios = rng.integers(0, catalog.n_destinatarios, count)
+    numeros = notas.copy()
+    duplicados = rng.random(count) < ANOMALIAS['numero_duplicado']
+    numeros[duplicados] = np.maximum(numeros[duplicados] - rng.integers(1, 1000, duplicados.sum()), 0)
+    datas = pd.Timestamp(f"{prefix[:4]}-{prefix[4:6]}-01") + pd.to_timedelta(rng.integers(0, 28 * 86400, count), unit='s')
+
+    n_itens = rng.integers(1, 6, count)
+    n_itens[rng.random(count) < ANOMALIAS['nota_sem_itens']] = 0
+    total_itens = int(n_itens.sum())
+    # Produtos seguem uma distribuição de cauda longa: poucos produtos concentram a maior parte dos itens
+    produtos = np.minimum(rng.zipf(1.3, total_itens), PRODUTOS) - 1
+    quantidade = rng.integers(1, 50, total_itens).astype(float)
+    unitario = np.round(catalog.produto_preco[produtos] * rng.uniform(0.9, 1.1, total_itens), 2)
+    unitario[rng.random(total_itens) < ANOMALIAS['item_valor_unitario_zero']] = 0
+    quantidade[rng.random(total_itens) < ANOMALIAS['item_quantidade_negativa']] *= -1
+    total = np.round(quantidade * unitario, 2)
+    inconsistentes = rng.random(total_itens) < ANOMALIAS['item_total_inconsistente']
+    total[inconsistentes] += np.round(rng.uniform(1, 100, inconsistentes.sum()), 2)
+
+    item_nota = np.repeat(np.arange(count), n_itens)
+    # Posição de cada item dentro da sua nota (1, 2, ...)
+    numero_produto = np.arange(total_itens) - np.repeat(np.cumsum(n_itens) - n_itens, n_itens) + 1
+    soma_itens = np.bincount(item_nota, weights=total, minlength=count)
+    valor_nota = np.round(soma_itens, 2)
+    divergentes = rng.random(count) < ANOMALIAS['nota_divergente']
+    valor_nota[divergentes] += np.round(rng.uniform(1, 500, divergentes.sum()), 2)
+    negativos = rng.random(count) < ANOMALIAS['nota_valor_negativo']
+    valor_nota[negativos] = -np.abs(valor_nota[negativos])
+
+    uf_emit = np.array(UFS)[catalog.uf_emitentes[emitentes]]
+    uf_dest = np.array(UFS)[catalog.uf_destinatarios[destinatarios]]
+    natureza = np.array(NATUREZAS)[rng.integers(0, len(NATUREZAS), count)]
+    datas_texto = datas.strftime('%Y-%m-%d %H:%M:%S')
+    cabecalho = pd.DataFrame({
+        'CHAVE DE ACESSO': chaves,
+        'MODELO': MODELO,
+        'SÉRIE': 1,
+        'NÚMERO': numeros,
+        'NATUREZA DA OPERAÇÃO': natureza,
+        'DATA EMISSÃO': datas_texto,
+        'EVENTO MAIS RECENTE': 'AUTORIZAÇÃO DE USO',
+        'DATA/HORA EVENTO MAIS RECENTE': datas_texto,
+        'CPF/CNPJ Emitente': catalog.cnpj_emitentes[emitentes],
+        'RAZÃO SOCIAL EMITENTE': np.char.add('EMPRESA ', emitentes.astype(str)),
+        'INSCRIÇÃO ESTADUAL EMITENTE': catalog.ie_emitentes[emitentes],
+        'UF EMITENTE': uf_emit,
+        'MUNICÍPIO EMITENTE': catalog.municipios[catalog.mun_emitentes[emitentes]],
+        'CNPJ DESTINATÁRIO': catalog.cnpj_destinatarios[destinatarios],
+        'NOME DESTINATÁRIO': np.char.add('DESTINATARIO ', destinatarios.astype(str)),
+        'UF DESTINATÁRIO': uf_dest,
+        'INDICADOR IE DESTINATÁRIO': '9 - NÃO CONTRIBUINTE',
+        'DESTINO DA OPERAÇÃO': np.where(uf_emit == uf_dest, '1 - OPERAÇÃO INTERNA', '2 - OPERAÇÃO INTERESTADUAL'),
+        'CONSUMIDOR FINAL': '1 - CONSUMIDOR FINAL',
+        'PRESENÇA DO COMPRADOR': '9 - OPERAÇÃO NÃO PRESENCIAL, OUTROS',
+        'MUNICÍPIO DESTINATÁRIO': catalog.municipios[catalog.mun_destinatarios[destinatarios]],
+        'VALOR NOTA FISCAL': valor_nota,
+    })
+    itens = pd.DataFrame({
+        'CHAVE DE ACESSO': chaves[item_nota],
+        'MODELO': MODELO,
+        'SÉRIE': 1,
+        'NÚMERO': numeros[item_nota],
+        'NATUREZA DA OPERAÇÃO': natureza[item_nota],
+        'DATA EMISSÃO': datas_texto[item_nota],
+        'CPF/CNPJ Emitente': cabecalho['CPF/CNPJ Emitente'].to_numpy()[item_nota],
+        'UF EMITENTE': uf_emit[item_nota],
+        'UF DESTINATÁRIO': uf_dest[item_nota],
+        'NÚMERO PRODUTO': numero_produto,
+        'DESCRIÇÃO DO PRODUTO/SERVIÇO': np.char.add('PRODUTO ', produtos.astype(str)),
+        'CÓDIGO NCM/SH': catalog.ncm[catalog.produto_ncm[produtos]],
+        'NCM/SH (TIPO DE PRODUTO)': np.char.add('TIPO ', (catalog.produto_ncm[produtos] % 97).astype(str)),
+        'CFOP': np.where(uf_emit[item_nota] == uf_dest[item_nota], '5102', '6102'),
+        'QUANTIDADE': quantidade,
+        'UNIDADE': np.array(UNIDADES)[catalog.produto_unidade[produtos]],
+        'VALOR UNITÁRIO': unitario,
+        'VALOR TOTAL': total,
+    })
+    return cabecalho, itens
+
+
+def generate(out_dir: str, n_items: int, seed: int = 42, prefix: str = '202401',
+             block_notes: int = 200_000) -> tuple:
+    """
+    Gera o par Cabecalho/Itens em `out_dir` com aproximadamente `n_items` itens.
+
+    O resultado depende apenas de `seed` e dos parâmetros; os arquivos são escritos em
+    blocos de `block_notes` notas, então o pico de memória não cresce com a escala.
+    Retorna os caminhos (cabecalho, itens).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    cabecalho_path = os.path.join(out_dir, f"{prefix}_NFs_Cabecalho.csv")
+    itens_path = os.path.join(out_dir, f"{prefix}_NFs_Itens.csv")
+    rng = np.random.default_rng(seed)
+    n_notes = max(n_items // 3, 1)
+    catalog = _Catalog(rng, n_notes)
+
+    logger.info(f"Gerando {n_notes} notas (~{n_items} itens) em {out_dir}")
+    for first in range(0, n_notes, block_notes):
+        cabecalho, itens = _block(rng, catalog, prefix, first, min(block_notes, n_notes - first))
+        mode = 'w' if first == 0 else 'a'
+        cabecalho.to_csv(cabecalho_path, mode=mode, header=first == 0, index=False)
+        itens.to_csv(itens_path, mode=mode, header=first == 0, index=False)
+    return cabecalho_path, itens_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos de NF-e para benchmarks.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--scale", choices=SCALES, default='10k')
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate(args.out_dir, SCALES[args.scale], args.seed)
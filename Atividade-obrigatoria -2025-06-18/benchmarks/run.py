@@ -0,0 +1,282 @@
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from typing import Callable, List, Optional
+
+# O benchmark nunca chama o LLM real; a pasta colunar é isolada para medir a conversão a frio
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("NFE_COLUMNAR_DIR", tempfile.mkdtemp(prefix="nfe_bench_colunar_"))
+# Sem as etapas do agente no stdout, que fica só com o relatório JSON
+os.environ["NFE_AGENT_VERBOSE"] = "0"
+
+import pandas as pd
+
+from benchmarks.generator import SCALES, generate
+from agent_core.utils import find_data_files
+from agent_core.dataset import load_dataset
+from agent_core.dataset_cache import dataset_cache
+from agent_core.answer_cache import answer_cache
+from agent_core.aggregates import build_header_aggregates
+from agent_core.indexes import build_indexes
+from agent_core.agent import run_agent_detailed
+from agent_core.tools import anomaly_audit as anomalies
+from agent_core.tools import consistency_validation as consistency
+from agent_core.tools import header_analysis as header
+from agent_core.tools import item_analysis as items
+
+# Perguntas do caminho completo do agente e a origem esperada da resposta: a primeira é
+# respondida pelo roteador, a segunda passa pelo agente (LLM fake) e a terceira repete a
+# segunda (cache de respostas)
+AGENT_QUESTIONS = [
+    ('agente_roteado', "Qual o valor total por mês?", 'router'),
+    ('agente_llm', "Quais são os emitentes com maior valor?", 'agent'),
+    ('agente_cache', "quais sao os emitentes com maior valor", 'answer_cache'),
+]
+
+
+def _proc_status_mb(field: str) -> Optional[float]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """
+    Zera o pico de RSS do processo (VmHWM), para medir o pico de uma única etapa.
+    Só existe no Linux; nos demais sistemas retorna False.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class StepMemory:
+    """
+    Pico de memória de uma etapa: RSS desde o último reset do pico (Linux) ou, sem o reset,
+    o pico das alocações rastreadas pelo tracemalloc (que deixa a etapa mais lenta).
+    """
+
+    def __enter__(self):
+        self.rss = reset_peak_rss()
+        if self.rss:
+            self.start_mb = _proc_status_mb('VmRSS')
+        else:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.rss:
+            self.peak_mb = _proc_status_mb('VmHWM')
+            self.added_mb = self.peak_mb - self.start_mb
+        else:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.peak_mb = None
+            self.added_mb = peak / 1024 ** 2
+        return False
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Bench:
+    """
+    Executa e registra as etapas do benchmark (tempo de parede, pico de memória e linhas/s).
+
+    `peak_rss_mb` é o pico de RSS durante a etapa e `step_peak_mb` o quanto esse pico passou
+    do RSS no início dela; sem o reset do pico (fora do Linux), só `step_peak_mb` é medido,
+    pelo tracemalloc.
+    """
+
+    def __init__(self, repeat: int = 1):
+        self.repeat = repeat
+        self.results = []
+
+    def measure(self, name: str, func: Callable, rows, repeat: Optional[int] = None,
+                check: Optional[Callable] = None):
+        """
+        Mede `func` e retorna o resultado da última execução.
+        `rows` pode ser uma função aplicada a esse resultado; `check`, se informado, recebe o
+        resultado e retorna a mensagem de erro da etapa (ou None), registrada no campo 'error'.
+        """
+        tempos, picos, acrescimos = [], [], []
+        for _ in range(repeat or self.repeat):
+            gc.collect()
+            with StepMemory() as memory:
+                start = time.perf_counter()
+                result = func()
+                tempos.append(time.perf_counter() - start)
+            picos.append(memory.peak_mb)
+            acrescimos.append(memory.added_mb)
+        seconds = min(tempos)
+        if callable(rows):
+            rows = rows(result)
+        self.results.append({
+            'name': name,
+            'seconds': round(seconds, 6),
+            'rows': rows,
+            'rows_per_s': round(rows / seconds, 1) if seconds > 0 else None,
+            'peak_rss_mb': round(max(picos), 1) if None not in picos else None,
+            'step_peak_mb': round(max(acrescimos), 1),
+        })
+        print(f"{name:<50} {seconds * 1000:>10.1f} ms", file=sys.stderr)
+        error = check(result) if check else None
+        if error is not None:
+            self.results[-1]['error'] = error
+            print(f"{name:<50} ERRO: {error}", file=sys.stderr)
+        return result
+
+
+def tool_steps(dataset) -> List[tuple]:
+    """
+    Etapas que exercitam todas as funções de análise: (nome, função, linhas processadas).
+    """
+    cabecalho_df, itens_df = dataset.frames()
+    aggregates = dataset.derived('header_aggregates', build_header_aggregates)
+    indexes = dataset.derived('indexes', build_indexes)
+    n_cab, n_itens = len(cabecalho_df), len(itens_df)
+    cnpj = str(cabecalho_df['CPF/CNPJ Emitente'].iloc[0])
+    ncm = str(itens_df['CÓDIGO NCM/SH'].iloc[0])
+    data = str(cabecalho_df['DATA EMISSÃO'].dropna().iloc[0].date())
+    natureza = str(cabecalho_df['NATUREZA DA OPERAÇÃO'].iloc[0])
+    itens_path, itens_key = dataset.sources.get('itens', (None, None))
+
+    return [
+        ('consistencia.validate_nfe_consistency', lambda: consistency.validate_nfe_consistency(cabecalho_df, itens_df), n_cab + n_itens),
+        ('consistencia.validate_nfe_consistency[indice]',
+         lambda: consistency.validate_nfe_consistency(cabecalho_df, itens_df, index=indexes.chave_itens), n_cab + n_itens),
+        ('consistencia.validate_nfe_consistency_streaming',
+         lambda: consistency.validate_nfe_consistency_streaming(cabecalho_df, itens_path, cache_key=itens_key), n_cab + n_itens),
+        ('consistencia.validate_dataset_consistency', lambda: consistency.validate_dataset_consistency(dataset), n_cab + n_itens),
+        ('consistencia.validate_dataset_consistency[streaming]',
+         lambda: consistency.validate_dataset_consistency(dataset, min_stream_bytes=0), n_cab + n_itens),
+        ('anomalias.audit_anomalies', lambda: anomalies.audit_anomalies(cabecalho_df, itens_df, indexes=indexes), n_cab + n_itens),
+        ('itens.list_top_expensive_items', lambda: items.list_top_expensive_items(itens_df, 10), n_itens),
+        ('itens.list_product_ncm_pairs', lambda: items.list_product_ncm_pairs(itens_df), n_itens),
+        ('itens.top_products_by_total_quantity', lambda: items.top_products_by_total_quantity(itens_df), n_itens),
+        ('itens.total_value_by_ncm_code', lambda: items.total_value_by_ncm_code(itens_df, ncm), n_itens),
+        ('itens.total_value_by_ncm_code[indice]', lambda: items.total_value_by_ncm_code(itens_df, ncm, index=indexes.ncm), n_itens),
+        ('itens.list_items_by_access_key[indice]',
+         lambda: items.list_items_by_access_key(itens_df, cabecalho_df['CHAVE DE ACESSO'].iloc[0], index=indexes.chave_itens), n_itens),
+        ('itens.avg_item_quantity', lambda: items.avg_item_quantity(itens_df), n_itens),
+        ('itens.find_zero_unit_value_items', lambda: items.find_zero_unit_value_items(itens_df), n_itens),
+        ('itens.avg_item_total_value', lambda: items.avg_item_total_value(itens_df), n_itens),
+        ('itens.find_negative_quantity_items', lambda: items.find_negative_quantity_items(itens_df), n_itens),
+        ('itens.find_inconsistent_item_values', lambda: items.find_inconsistent_item_values(itens_df), n_itens),
+        ('cabecalho.analyze_top_emitters_by_value', lambda: header.analyze_top_emitters_by_value(cabecalho_df), n_cab),
+        ('cabecalho.count_notes_by_uf_emitter', lambda: header.count_notes_by_uf_emitter(cabecalho_df), n_cab),
+        ('cabecalho.avg_note_value_by_municipio_emitter', lambda: header.avg_note_value_by_municipio_emitter(cabecalho_df), n_cab),
+        ('cabecalho.list_notes_by_cnpj_emitter', lambda: header.list_notes_by_cnpj_emitter(cabecalho_df, cnpj), n_cab),
+        ('cabecalho.list_notes_by_cnpj_emitter[indice]',
+         lambda: header.list_notes_by_cnpj_emitter(cabecalho_df, cnpj, index=indexes.cnpj_emitente), n_cab),
+        ('cabecalho.analyze_top_recipients_by_value', lambda: header.analyze_top_recipients_by_value(cabecalho_df), n_cab),
+        ('cabecalho.count_notes_by_uf_recipient', lambda: header.count_notes_by_uf_recipient(cabecalho_df), n_cab),
+        ('cabecalho.count_notes_by_municipio_recipient', lambda: header.count_notes_by_municipio_recipient(cabecalho_df), n_cab),
+        ('cabecalho.total_value_by_month', lambda: header.total_value_by_month(cabecalho_df), n_cab),
+        ('cabecalho.count_notes_by_specific_date', lambda: header.count_notes_by_specific_date(cabecalho_df, data), n_cab),
+        ('cabecalho.day_of_week_highest_emission', lambda: header.day_of_week_highest_emission(cabecalho_df), n_cab),
+        ('cabecalho.count_notes_by_natureza_operacao', lambda: header.count_notes_by_natureza_operacao(cabecalho_df), n_cab),
+        ('cabecalho.total_value_by_natureza_operacao',
+         lambda: header.total_value_by_natureza_operacao(cabecalho_df, natureza), n_cab),
+        ('cabecalho.find_negative_value_notes', lambda: header.find_negative_value_notes(cabecalho_df), n_cab),
+        ('cabecalho.find_duplicate_note_numbers', lambda: header.find_duplicate_note_numbers(cabecalho_df), n_cab),
+        ('cabecalho.find_duplicate_note_numbers[indice]',
+         lambda: header.find_duplicate_note_numbers(cabecalho_df, index=indexes.numero), n_cab),
+        ('cabecalho.agregados_compartilhados',
+         lambda: [header.count_notes_by_uf_emitter(cabecalho_df, aggregates=aggregates),
+                  header.total_value_by_month(cabecalho_df, aggregates=aggregates)], n_cab),
+    ]
+
+
+def run(scale: str, data_dir: Optional[str] = None, seed: int = 42, repeat: int = 1) -> dict:
+    """
+    Gera (se necessário) os dados da escala, executa todas as etapas e retorna o relatório.
+    """
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "nfe_bench", f"{scale}_{seed}")
+    bench = Bench(repeat)
+    if not (os.path.isdir(data_dir) and find_data_files(data_dir)):
+        bench.measure('gerar_dados', lambda: generate(data_dir, SCALES[scale], seed), SCALES[scale], repeat=1)
+
+    # Carregamento: CSV → colunar (frio), colunar sem cache em memória e cache em memória
+    def total_rows(ds) -> int:
+        return len(ds.cabecalho_df) + len(ds.itens_df)
+
+    dataset_cache.clear()
+    bench.measure('carregar_dataset[csv]', lambda: load_dataset(data_dir, find_data_files), total_rows, repeat=1)
+    dataset_cache.clear()
+    dataset = bench.measure('carregar_dataset[colunar]', lambda: load_dataset(data_dir, find_data_files), total_rows, repeat=1)
+    bench.measure('carregar_dataset[cache]', lambda: load_dataset(data_dir, find_data_files), total_rows)
+    n_rows = total_rows(dataset)
+
+    for name, func, rows in tool_steps(dataset):
+        bench.measure(name, func, rows)
+
+    # Caminho completo do agente com o LLM fake (a pergunta repetida mede o cache de respostas).
+    # O tempo só vale se a resposta veio da origem esperada: uma falha do agente também volta como texto
+    def check_source(expected: str) -> Callable:
+        def check(answer) -> Optional[str]:
+            if answer.error is not None:
+                return answer.error
+            return None if answer.source == expected else f"resposta de '{answer.source}', esperado '{expected}'"
+        return check
+
+    answer_cache.clear()
+    for name, question, expected in AGENT_QUESTIONS:
+        bench.measure(name, lambda: run_agent_detailed(question, data_dir, find_data_files), n_rows, repeat=1,
+                      check=check_source(expected))
+
+    return {
+        'scale': scale,
+        'seed': seed,
+        'notes': len(dataset.cabecalho_df),
+        'items': len(dataset.itens_df),
+        'commit': git_commit(),
+        'timestamp': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'results': bench.results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das ferramentas de análise de NF-e.")
+    parser.add_argument("--scale", choices=SCALES, default='10k')
+    parser.add_argument("--data-dir", help="Pasta com os CSVs (gerados nela se ainda não existirem)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="Repetições de cada ferramenta (vale o menor tempo)")
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    report = run(args.scale, args.data_dir, args.seed, args.repeat)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    # Etapas com erro invalidam o relatório para comparação
+    return 1 if any('error' in result for result in report['results']) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
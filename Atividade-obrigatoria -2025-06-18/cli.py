@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Executa um arquivo de perguntas sobre um dataset de NF-e, sem a interface Streamlit."
+    )
+    parser.add_argument("data", help="Arquivo ZIP ou pasta com os CSVs Cabecalho/Itens")
+    parser.add_argument("questions", help="Arquivo de perguntas: uma por linha (.txt) ou objetos {\"id\", \"question\"} (.jsonl)")
+    parser.add_argument("--output", help="Arquivo JSONL de resultados (padrão: stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="Perguntas executadas em paralelo (padrão: 4)")
+    parser.add_argument("--mode", choices=["agent", "direct"], default="agent",
+                        help="agent: caminho completo do agente; direct: apenas as ferramentas reconhecidas pelo roteador")
+    parser.add_argument("--offline", action="store_true", help="Usa o LLM fake, sem acesso à rede")
+    return parser.parse_args(argv)
+
+
+def read_questions(path: str) -> List[Tuple[str, str]]:
+    """
+    Lê as perguntas como (id, pergunta). Linhas vazias e iniciadas por '#' são ignoradas.
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                questions.append((str(record.get("id", number)), record["question"]))
+            else:
+                questions.append((str(number), line))
+    return questions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.offline:
+        os.environ["LLM_PROVIDER"] = "fake"
+    if not args.output:
+        # O stdout recebe o JSONL: sem as etapas do agente (verbose) misturadas aos resultados
+        os.environ["NFE_AGENT_VERBOSE"] = "0"
+
+    # Importados depois de ajustar o ambiente: NFE_AGENT_VERBOSE é lido na importação do agente
+    from agent_core.agent import run_agent_detailed
+    from agent_core.dataset import load_dataset, load_dataset_from_zip
+    from agent_core.router import router
+    from agent_core.utils import find_data_files
+
+    questions = read_questions(args.questions)
+    if not questions:
+        print("Nenhuma pergunta encontrada.", file=sys.stderr)
+        return 1
+
+    # O dataset é carregado uma única vez e compartilhado por todas as perguntas
+    start = time.perf_counter()
+    if os.path.isdir(args.data):
+        dataset = load_dataset(args.data, find_data_files)
+    else:
+        with open(args.data, "rb") as f:
+            dataset = load_dataset_from_zip(f.read())
+    if dataset is None:
+        print("Não foi possível carregar os arquivos de Cabeçalho e Itens.", file=sys.stderr)
+        return 1
+    load_seconds = time.perf_counter() - start
+    print(f"Dataset carregado em {load_seconds:.1f}s: {dataset.rows('cabecalho')} notas, "
+          f"{dataset.rows('itens')} itens", file=sys.stderr)
+
+    def answer(question: str) -> Tuple[str, str, Optional[str]]:
+        if args.mode == "direct":
+            routed = router.route(question, dataset)
+            if routed is None:
+                return "Pergunta não reconhecida pelo roteador.", "none", None
+            return routed, "router", None
+        # Falhas do agente voltam como texto para o usuário; a origem 'error' e a causa as identificam
+        return run_agent_detailed(question, dataset=dataset)
+
+    def run(item: Tuple[str, str]) -> dict:
+        question_id, question = item
+        started = time.perf_counter()
+        record = {"id": question_id, "question": question}
+        try:
+            record["answer"], record["source"], error = answer(question)
+            if error is not None:
+                record["error"] = error
+        except Exception as e:
+            record["answer"], record["source"], record["error"] = None, None, str(e)
+        record["seconds"] = round(time.perf_counter() - started, 3)
+        return record
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    write_lock = threading.Lock()
+    errors = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max(args.workers, 1)) as pool:
+            # Cada resultado é gravado assim que termina, então uma execução interrompida preserva o que já foi respondido
+            for future in as_completed([pool.submit(run, item) for item in questions]):
+                record = future.result()
+                errors += "error" in record
+                with write_lock:
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output.flush()
+    finally:
+        if args.output:
+            output.close()
+    elapsed = time.perf_counter() - start
+
+    per_minute = len(questions) / elapsed * 60 if elapsed > 0 else float("inf")
+    print(f"{len(questions)} perguntas em {elapsed:.1f}s ({per_minute:.1f} perguntas/min, "
+          f"{args.workers} workers, {errors} erros)", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import pytest
+
+from agent_core import columnar
+from agent_core.answer_cache import answer_cache
+from agent_core.dataset import load_dataset
+from agent_core.dataset_cache import dataset_cache
+from agent_core.utils import find_data_files
+from benchmarks.generator import generate
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    monkeypatch.setattr(columnar, "COLUMNAR_DIR", str(tmp_path / "colunar"))
+    generate(str(tmp_path / "dados"), 300, seed=7)
+    dataset_cache.clear()
+    answer_cache.clear()
+    yield load_dataset(str(tmp_path / "dados"), find_data_files)
+    dataset_cache.clear()
+    answer_cache.clear()
@@ -0,0 +1,48 @@
+import asyncio
+
+from agent_core.agent import get_agent, run_agent_async, run_agent_detailed, run_agent_with_middlewares
+from agent_core.tracing import tracer
+
+# Pergunta que nenhum atalho do roteador reconhece: passa pelo agente com o LLM fake
+QUESTION = "Explique os dados de forma geral"
+
+
+def test_agent_prompt_formats_with_all_tools(dataset):
+    # As descrições das ferramentas entram no template do prompt; chaves soltas quebram a formatação
+    prompt = get_agent(dataset).agent.llm_chain.prompt
+    assert prompt.input_variables == ['agent_scratchpad', 'input']
+    assert 'consultar_dados' in prompt.format(input=QUESTION, agent_scratchpad='')
+
+
+def test_agent_answers_without_error(dataset):
+    response = run_agent_with_middlewares(QUESTION, dataset=dataset)
+    assert response == "Resposta de teste."
+
+
+def test_async_agent_answers_without_error(dataset):
+    response = asyncio.run(run_agent_async(QUESTION, dataset))
+    assert response == "Resposta de teste."
+
+
+def test_agent_failure_reports_source_and_error(dataset, monkeypatch):
+    # A falha chega ao usuário como texto; quem automatiza (CLI, benchmark) a identifica pela origem
+    monkeypatch.setenv("LLM_PROVIDER", "inexistente")
+    answer = run_agent_detailed(QUESTION, dataset=dataset)
+    assert answer.response.startswith("Desculpe")
+    assert answer.source == 'error'
+    assert "não suportado" in answer.error
+
+
+def test_failure_marks_run_span(dataset, monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "inexistente")
+    monkeypatch.setattr(tracer, "enabled", True)
+    run_agent_with_middlewares(QUESTION, dataset=dataset)
+    run_span = [span for span in tracer.last_trace() if span['name'] == 'agent.run'][-1]
+    assert run_span['status'] == 'ERROR'
+    assert run_span['attributes']['source'] == 'error'
+
+
+def test_sources_of_router_agent_and_cache(dataset):
+    assert run_agent_detailed("Qual o valor total por mês?", dataset=dataset).source == 'router'
+    assert run_agent_detailed(QUESTION, dataset=dataset) == ("Resposta de teste.", 'agent', None)
+    assert run_agent_detailed(QUESTION, dataset=dataset).source == 'answer_cache'
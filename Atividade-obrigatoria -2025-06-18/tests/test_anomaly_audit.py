@@ -0,0 +1,22 @@
+from agent_core.tools import anomaly_audit
+from agent_core.tools.anomaly_audit import audit_anomalies
+
+
+def test_sharded_audit_matches_single_partition(dataset, monkeypatch):
+    cabecalho_df, itens_df = dataset.frames()
+    expected = audit_anomalies(cabecalho_df, itens_df, max_rows=20, workers=1)
+    monkeypatch.setattr(anomaly_audit, "PARALLEL_MIN_ROWS", 0)
+    assert expected.startswith("Auditoria de anomalias")
+    assert audit_anomalies(cabecalho_df, itens_df, max_rows=20, workers=2) == expected
+
+
+def test_unavailable_pool_falls_back_to_in_process(dataset, monkeypatch):
+    cabecalho_df, itens_df = dataset.frames()
+    expected = audit_anomalies(cabecalho_df, itens_df, max_rows=20, workers=1)
+
+    def no_shared_memory(*args, **kwargs):
+        raise OSError("sem /dev/shm")
+
+    monkeypatch.setattr(anomaly_audit, "PARALLEL_MIN_ROWS", 0)
+    monkeypatch.setattr(anomaly_audit.shared_memory, "SharedMemory", no_shared_memory)
+    assert audit_anomalies(cabecalho_df, itens_df, max_rows=20, workers=3) == expected
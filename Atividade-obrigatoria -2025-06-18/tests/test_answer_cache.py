@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from agent_core import answer_cache as module
+from agent_core.answer_cache import AnswerCache, answer_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(module.time, 'time', lambda: now[0])
+    return now
+
+
+def _db_keys(path) -> list:
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute("SELECT key FROM answers ORDER BY created")]
+
+
+def test_key_ignores_case_accents_and_punctuation():
+    assert answer_key('ds', 'Qual o VALOR total por mês?') == answer_key('ds', '  qual o valor total por mes ')
+    assert answer_key('ds', 'pergunta') != answer_key('outro', 'pergunta')
+
+
+def test_lru_discards_least_recently_used(clock):
+    cache = AnswerCache(max_entries=2)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.put('c', 'C')
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('A', 'C')
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = AnswerCache(ttl_seconds=60)
+    cache.put('a', 'A')
+    clock[0] += 60
+    assert cache.get('a') == 'A'
+    clock[0] += 1
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_answers_survive_restart(clock, tmp_path):
+    path = str(tmp_path / 'respostas.sqlite')
+    AnswerCache(db_path=path).put('a', 'A')
+    assert AnswerCache(db_path=path).get('a') == 'A'
+
+
+def test_db_drops_expired_and_keeps_newest(clock, tmp_path):
+    path = str(tmp_path / 'respostas.sqlite')
+    cache = AnswerCache(max_entries=2, ttl_seconds=100, db_path=path)
+    cache.put('velha', 'V')
+    clock[0] += 150
+    for key in ['a', 'b', 'c']:
+        clock[0] += 1
+        cache.put(key, key.upper())
+    # 'velha' expirou e 'a' é a mais antiga acima do limite
+    assert _db_keys(path) == ['b', 'c']
@@ -0,0 +1,89 @@
+import pytest
+
+from agent_core import dataset_pool as pool_module
+from agent_core.dataset_pool import DatasetPool, PoolMemoryError, acquire_upload
+
+
+class FakeDataset:
+    def __init__(self, nbytes, artifacts=()):
+        self.nbytes = nbytes
+        self.artifacts = list(artifacts)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _pool(**kwargs) -> DatasetPool:
+    # Sem a thread de limpeza: os testes chamam `sweep` diretamente
+    return DatasetPool(sweep_interval=0, **kwargs)
+
+
+def test_sessions_share_one_load_and_count_references():
+    pool = _pool()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return FakeDataset(10)
+
+    first = pool.acquire('a', 'k', loader)
+    assert pool.acquire('b', 'k', loader) is first
+    assert len(loads) == 1
+    assert pool._entries['k'].refs == 2
+    assert pool.stats()['shared'] == 1
+
+    pool.release('a', 'k')
+    assert pool._entries['k'].refs == 1
+    pool.release('b')
+    assert pool._entries['k'].refs == 0
+    # Sem referências, o dataset continua no pool até ficar ocioso por `idle_seconds`
+    assert 'k' in pool._entries
+
+
+def test_idle_datasets_are_evicted_and_closed(tmp_path):
+    artifact = tmp_path / "tabela.arrow"
+    artifact.write_bytes(b"x")
+    pool = _pool(idle_seconds=0)
+    dataset = pool.acquire('a', 'k', lambda: FakeDataset(10, [str(artifact)]))
+    assert pool.sweep() == 0
+
+    pool.release('a')
+    assert 'k' not in pool._entries
+    assert dataset.closed and not artifact.exists()
+    assert pool.stats()['evictions'] == 1
+
+
+def test_idle_datasets_make_room_for_new_ones():
+    pool = _pool(max_bytes=100)
+    antigo = pool.acquire('a', 'antigo', lambda: FakeDataset(80))
+    pool.release('a')
+    pool.acquire('b', 'novo', lambda: FakeDataset(80))
+    assert list(pool._entries) == ['novo']
+    assert antigo.closed
+
+
+def test_dataset_over_the_limit_is_rejected_without_evicting_used_ones():
+    pool = _pool(max_bytes=100)
+    em_uso = pool.acquire('a', 'em_uso', lambda: FakeDataset(80))
+    rejeitado = FakeDataset(80)
+    with pytest.raises(PoolMemoryError):
+        pool.acquire('b', 'novo', lambda: rejeitado)
+    assert list(pool._entries) == ['em_uso']
+    assert rejeitado.closed and not em_uso.closed
+    # O mais recente sozinho pode ultrapassar o limite
+    pool.release('a')
+    pool.sweep()
+    assert pool.acquire('b', 'grande', lambda: FakeDataset(500)).nbytes == 500
+
+
+def test_new_upload_releases_the_previous_one(monkeypatch):
+    pool = _pool()
+    monkeypatch.setattr(pool_module, 'dataset_pool', pool)
+    monkeypatch.setattr(pool_module, 'load_dataset_from_zip', lambda zip_bytes, key: FakeDataset(len(zip_bytes)))
+    session = {}
+    primeiro = acquire_upload(session, b"zip-1", 'k1')
+    acquire_upload(session, b"zip-22", 'k2')
+    assert primeiro.nbytes == 5
+    assert session['dataset_key'] == 'k2'
+    assert pool._entries['k1'].refs == 0 and pool._entries['k2'].refs == 1
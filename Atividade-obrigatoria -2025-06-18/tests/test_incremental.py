@@ -0,0 +1,61 @@
+import numpy as np
+
+from agent_core.incremental import IncrementalValidator
+from agent_core.tools import header_analysis as header
+from agent_core.tools.consistency_validation import validate_nfe_consistency
+
+
+def _apply_in_deltas(validator, cab, itens, n_deltas=3):
+    # Notas em blocos; os itens de cada bloco chegam em dois deltas separados
+    for bloco in np.array_split(np.arange(len(cab)), n_deltas):
+        notas = cab.iloc[bloco]
+        itens_bloco = itens[itens['CHAVE DE ACESSO'].isin(notas['CHAVE DE ACESSO'])]
+        metade = len(itens_bloco) // 2
+        validator.apply(notas, itens_bloco.iloc[:metade])
+        validator.apply(notas.iloc[0:0], itens_bloco.iloc[metade:])
+
+
+def _assert_matches_full(validator, cab, itens):
+    assert validator.consistency_report(20) == validate_nfe_consistency(cab, itens, max_rows=20)
+    assert validator.duplicates_report(20) == header.find_duplicate_note_numbers(cab, 20)
+    assert validator.month_report() == header.total_value_by_month(cab)
+    assert validator.uf_report('UF EMITENTE') == header.count_notes_by_uf_emitter(cab)
+    assert validator.uf_report('UF DESTINATÁRIO') == header.count_notes_by_uf_recipient(cab)
+
+
+def test_deltas_match_full_recompute(dataset):
+    cab, itens = dataset.frames()
+    # Número repetido entre o primeiro e o último delta
+    cab = cab.copy()
+    cab.loc[cab.index[-1], 'NÚMERO'] = cab['NÚMERO'].iloc[0]
+    validator = IncrementalValidator()
+    _apply_in_deltas(validator, cab, itens)
+    _assert_matches_full(validator, cab, itens)
+    assert validator.summary()['quantidade'] == len(cab)
+    assert validator.summary()['itens'] == len(itens)
+    assert validator.summary()['numeros_duplicados'] == 1
+
+
+def test_state_persists_between_runs(dataset, tmp_path):
+    cab, itens = dataset.frames()
+    path = str(tmp_path / "estado.db")
+    metade = len(cab) // 2
+    primeiras = itens['CHAVE DE ACESSO'].isin(cab['CHAVE DE ACESSO'].iloc[:metade])
+
+    validator = IncrementalValidator(path)
+    validator.apply(cab.iloc[:metade], itens[primeiras])
+    validator.close()
+
+    validator = IncrementalValidator(path)
+    validator.apply(cab.iloc[metade:], itens[~primeiras])
+    _assert_matches_full(validator, cab, itens)
+    validator.close()
+
+
+def test_resent_notes_are_ignored(dataset):
+    cab, itens = dataset.frames()
+    validator = IncrementalValidator()
+    validator.apply(cab, itens)
+    stats = validator.apply(cab.iloc[:5], itens.iloc[0:0])
+    assert stats['notas_novas'] == 0
+    _assert_matches_full(validator, cab, itens)
@@ -0,0 +1,77 @@
+import io
+import os
+import zipfile
+
+import pandas as pd
+import pytest
+
+from agent_core import columnar, ingest
+from agent_core.dataset import load_dataset, load_dataset_from_zip
+from agent_core.dataset_cache import dataset_cache
+from agent_core.ingest import ZipBombError, _MemberReader, data_members
+from agent_core.utils import find_data_files
+from benchmarks.generator import generate
+
+
+def _zip(members: dict, compression=zipfile.ZIP_DEFLATED) -> zipfile.ZipFile:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return zipfile.ZipFile(io.BytesIO(buffer.getvalue()))
+
+
+@pytest.fixture
+def csv_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, "COLUMNAR_DIR", str(tmp_path / "colunar"))
+    generate(str(tmp_path / "dados"), 300, seed=7)
+    dataset_cache.clear()
+    yield str(tmp_path / "dados")
+    dataset_cache.clear()
+
+
+def test_only_data_members_are_listed():
+    zf = _zip({'dados/Cabecalho.csv': 'a', 'dados/Itens.XLS': 'b', 'leia-me.txt': 'c',
+               '__MACOSX/dados/._Cabecalho.csv': 'd', 'dados/.oculto.csv': 'e'})
+    assert [info.filename for info in data_members(zf)] == ['dados/Cabecalho.csv', 'dados/Itens.XLS']
+
+
+def test_too_many_members_rejected(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_MEMBERS", 2)
+    with pytest.raises(ZipBombError):
+        data_members(_zip({f"{i}.csv": 'a' for i in range(3)}))
+
+
+def test_declared_size_over_limit_rejected(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_UNCOMPRESSED_BYTES", 100)
+    with pytest.raises(ZipBombError):
+        data_members(_zip({'Cabecalho.csv': 'x' * 60, 'Itens.csv': 'y' * 60}, zipfile.ZIP_STORED))
+
+
+def test_suspicious_compression_ratio_rejected(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_COMPRESSION_RATIO", 50)
+    with pytest.raises(ZipBombError):
+        data_members(_zip({'Itens.csv': '0' * 100_000}))
+
+
+def test_reader_stops_past_the_limit():
+    # O tamanho declarado pode ser falso: o limite vale para os bytes realmente descompactados
+    zf = _zip({'Itens.csv': 'x' * 1000})
+    with _MemberReader(zf, zf.getinfo('Itens.csv'), limit=100) as stream:
+        with pytest.raises(ZipBombError):
+            stream.read()
+
+
+def test_directory_and_zip_accept_the_same_extensions(csv_dir):
+    itens_csv = os.path.join(csv_dir, '202401_NFs_Itens.csv')
+    pd.read_csv(itens_csv, dtype=str).to_excel(os.path.join(csv_dir, '202401_NFs_Itens.xlsx'), index=False)
+    os.remove(itens_csv)
+    assert sorted(find_data_files(csv_dir)) == ['202401_NFs_Cabecalho.csv', '202401_NFs_Itens.xlsx']
+
+    from_dir = load_dataset(csv_dir, find_data_files)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name in find_data_files(csv_dir):
+            zf.write(os.path.join(csv_dir, name), name)
+    from_zip = load_dataset_from_zip(buffer.getvalue())
+    pd.testing.assert_frame_equal(from_dir.itens_df, from_zip.itens_df)
@@ -0,0 +1,65 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agent_core.agent import get_agent, run_agent_with_middlewares
+from agent_core.llm_factory import get_llm, reset_llm
+
+ANSWER = "Resposta do servidor local."
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    """
+    Servidor fake da API REST do Gemini: responde a todo generateContent com a resposta final do agente.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, self.client_address))
+        body = json.dumps({'candidates': [{
+            'content': {'role': 'model', 'parts': [{'text': f"Final Answer: {ANSWER}"}]},
+            'finishReason': 'STOP',
+            'index': 0,
+        }]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGeminiHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("LLM_PROVIDER", "google-genai")
+    monkeypatch.setenv("GOOGLE_API_KEY", "chave-de-teste")
+    monkeypatch.setenv("GOOGLE_API_ENDPOINT", f"http://127.0.0.1:{server.server_port}")
+    reset_llm()
+    yield server
+    reset_llm()
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_and_agent_reused_across_questions(dataset, endpoint):
+    # O fixture `dataset` escolhe o LLM fake; o fixture `endpoint` troca para o Gemini no servidor local
+    questions = ["Explique os dados de forma geral", "Descreva o conjunto de dados"]
+    llm, agent = get_llm(), get_agent(dataset)
+
+    responses = [run_agent_with_middlewares(question, dataset=dataset) for question in questions]
+
+    assert responses == [ANSWER, ANSWER]
+    assert get_llm() is llm
+    assert get_agent(dataset) is agent
+    assert [path.split('?')[0] for path, _ in endpoint.requests] == \
+        ["/v1beta/models/gemini-2.0-flash:generateContent"] * len(questions)
+    # Mesma porta de origem: a conexão HTTP do cliente foi reaproveitada entre as perguntas
+    assert len({client for _, client in endpoint.requests}) == 1
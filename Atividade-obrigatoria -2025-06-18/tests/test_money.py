@@ -0,0 +1,46 @@
+import sqlite3
+
+import numpy as np
+
+from agent_core import money
+from agent_core.money import TOLERANCES, exceeds, sum_by_code, to_cents
+
+
+def test_to_cents_rounds_half_away_from_zero():
+    valores = [0.125, -0.125, 0.375, 10.10, -3.99, np.nan]
+    assert to_cents(valores).tolist() == [13, -13, 38, 1010, -399, 0]
+    assert to_cents([np.nan], na_value=-1).tolist() == [-1]
+
+
+def test_to_cents_matches_sql_round():
+    rng = np.random.default_rng(7)
+    valores = np.concatenate([rng.integers(-10**6, 10**6, 2000) / 1000, [0.125, -0.125, 2.675, 1.005, 0.285]])
+    conn = sqlite3.connect(":memory:")
+    sql = [conn.execute("SELECT CAST(ROUND(? * 100) AS INTEGER)", (float(v),)).fetchone()[0] for v in valores]
+    assert to_cents(valores).tolist() == sql
+
+
+def test_sum_by_code_ignores_negative_codes():
+    codes = np.array([0, 1, 0, -1, 2])
+    cents = np.array([150, 200, -50, 999, 1])
+    assert sum_by_code(codes, cents, 4).tolist() == [100, 200, 1, 0]
+
+
+def test_sum_by_code_is_exact_above_float_precision():
+    # Somas acima de 2**53 não passam pelo bincount em float64
+    grande = 2 ** 53
+    codes = np.array([0, 0, 1])
+    cents = np.array([grande, 1, 3], dtype=np.int64)
+    assert sum_by_code(codes, cents, 2).tolist() == [grande + 1, 3]
+
+
+def test_exceeds_uses_rule_tolerance():
+    tolerancia = TOLERANCES['nota_itens']
+    diferencas = np.array([-tolerancia - 1, -tolerancia, 0, tolerancia, tolerancia + 1])
+    assert exceeds(diferencas, 'nota_itens').tolist() == [True, False, False, False, True]
+
+
+def test_tolerance_is_read_in_reais(monkeypatch):
+    monkeypatch.setenv("NFE_TOLERANCIA_TESTE", "0.05")
+    assert money._tolerance("NFE_TOLERANCIA_TESTE", "0.01") == 5
+    assert money._tolerance("NFE_TOLERANCIA_AUSENTE", "0.01") == 1
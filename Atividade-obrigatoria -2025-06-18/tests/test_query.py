@@ -0,0 +1,33 @@
+import pytest
+
+from agent_core.query import Query, QueryError, parse_query
+from agent_core.tools.query_analysis import run_query
+
+
+@pytest.mark.parametrize("spec", [
+    {"filtros": [{"op": "==", "valor": "SP"}]},
+    {"filtros": [[None, "==", "SP"]]},
+    {"agrupar_por": [["UF EMITENTE"]]},
+    {"agregacoes": {"total": [5, "soma"]}},
+    {"colunas": 3},
+    {"ordenar_por": ["VALOR NOTA FISCAL"]},
+    {"periodo": "2024-01"},
+])
+def test_malformed_specs_raise_query_error(spec):
+    with pytest.raises(QueryError):
+        parse_query(spec)
+
+
+def test_filter_without_column_is_reported_as_invalid(dataset):
+    resposta = run_query(dataset, '{"filtros": [{"op": "==", "valor": "SP"}]}')
+    assert resposta.startswith("Consulta inválida: 'coluna'")
+
+
+def test_parsed_query_matches_builder(dataset):
+    spec = {"tabela": "cabecalho", "filtros": [{"coluna": "UF EMITENTE", "valor": "SP"}],
+            "agrupar_por": "MUNICÍPIO EMITENTE", "agregacoes": {"notas": [None, "contagem"]}, "top": 3}
+    esperado = (Query('cabecalho').where('UF EMITENTE', '==', 'SP').group_by('MUNICÍPIO EMITENTE')
+                .agg(notas=(None, 'contagem')).top(3))
+    resultado = parse_query(spec).execute(dataset).frame
+    assert resultado.equals(esperado.execute(dataset).frame)
+    assert len(resultado) <= 3
@@ -0,0 +1,51 @@
+from agent_core.router import CNPJ_PATTERN, IntentRouter, Route, _digits, router
+
+
+def _router() -> IntentRouter:
+    return IntentRouter([
+        Route('por_mes', [r'\bmes\b', r'valor'], [r'emit'], None, lambda ds, _: "por mês"),
+        Route('por_uf', [r'\buf\b'], [], None, lambda ds, _: "por UF"),
+        Route('por_cnpj', [r'notas'], [], _digits(CNPJ_PATTERN), lambda ds, cnpj: f"notas de {cnpj}"),
+        Route('com_erro', [r'falha'], [], None, lambda ds, _: "Erro ao executar a ferramenta"),
+    ])
+
+
+def test_single_match_is_answered_directly(dataset):
+    r = _router()
+    assert r.route("Qual o valor por mês?", dataset) == "por mês"
+    assert r.route("Notas do emitente 12.345.678/0001-90", dataset) == "notas de 12345678000190"
+    assert r.stats()['hits'] == 2
+
+
+def test_ambiguous_or_incomplete_questions_go_to_agent(dataset):
+    r = _router()
+    # Duas rotas reconhecem a pergunta
+    assert r.route("Valor por mês e por UF", dataset) is None
+    # Padrão excluído
+    assert r.route("Valor por mês do emitente", dataset) is None
+    # Parâmetro obrigatório ausente
+    assert r.route("Quais notas foram emitidas?", dataset) is None
+    assert r.stats()['misses'] == 3
+
+
+def test_tool_error_falls_back_to_agent(dataset):
+    r = _router()
+    assert r.route("Houve falha?", dataset) is None
+    assert r.stats() == {'hits': 0, 'misses': 1, 'hit_rate': 0.0, 'saved_seconds': 0.0, 'avg_agent_seconds': None}
+
+
+def test_saved_time_uses_average_agent_duration(dataset):
+    r = _router()
+    r.record_agent(2.0)
+    r.record_agent(4.0)
+    r.route("Qual o valor por mês?", dataset)
+    assert 2.9 < r.stats()['saved_seconds'] <= 3.0
+
+
+def test_default_routes_on_dataset(dataset):
+    chave = dataset.cabecalho_df['CHAVE DE ACESSO'].iloc[0]
+    assert router.match("Qual o valor total por mês?")[0].name == 'valor_total_por_mes'
+    assert router.match(f"Quais os itens da nota {chave}?") == (
+        next(route for route in router.routes if route.name == 'listar_itens_por_chave_acesso'), chave)
+    assert router.match("Explique os dados de forma geral") is None
+    assert router.route("Há notas com valor negativo?", dataset).startswith(("Notas", "Nenhuma"))
@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+
+import pytest
+
+from agent_core import dataset as dataset_module
+from agent_core import sketches, storage
+from agent_core.agent import build_tools
+from agent_core.dataset import StoredDataset, load_dataset
+from agent_core.dataset_cache import dataset_cache
+from agent_core.tools.sql_analysis import tool_functions
+from agent_core.utils import find_data_files
+
+
+@pytest.fixture
+def stored(dataset, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(storage, "STORAGE_DIR", str(tmp_path / "banco"))
+    dataset_cache.clear()
+    stored = load_dataset(str(tmp_path / "dados"), find_data_files)
+    yield stored
+    stored.close()
+
+
+def _tool_outputs(tools, cabecalho_df):
+    args = {
+        'listar_notas_por_cnpj_emitente': str(cabecalho_df['CPF/CNPJ Emitente'].iloc[0]),
+        'listar_itens_por_chave_acesso': str(cabecalho_df['CHAVE DE ACESSO'].iloc[0]),
+        'contar_notas_por_data_especifica': str(cabecalho_df['DATA EMISSÃO'].dropna().iloc[0].date()),
+        'consultar_dados': '{"tabela": "itens", "filtros": [["QUANTIDADE", ">", 5]], "ordenar_por": "VALOR TOTAL", "top": 5}',
+    }
+    return {tool.name: tool.func(args.get(tool.name, '')) for tool in tools}
+
+
+def test_stored_dataset_tools_match_in_memory(dataset, stored):
+    assert isinstance(stored, StoredDataset)
+    cabecalho_df = dataset.cabecalho_df
+    expected = _tool_outputs(build_tools(dataset), cabecalho_df)
+    assert _tool_outputs(build_tools(stored), cabecalho_df) == expected
+    assert stored.partitions == dataset.partitions
+    # Nenhuma ferramenta leu as tabelas do banco para a memória
+    assert stored._frames is None and stored.nbytes == 0
+
+
+def test_sql_tools_cover_every_agent_tool(dataset, stored):
+    # Uma ferramenta sem versão SQL leria as tabelas inteiras do banco para a memória
+    assert set(tool_functions(stored.store)) == {tool.name for tool in build_tools(dataset)}
+
+
+def test_existing_store_is_opened_without_reading_files(stored, tmp_path, monkeypatch):
+    def no_read(*args, **kwargs):
+        raise AssertionError("arquivo lido com o banco já criado")
+
+    monkeypatch.setattr(dataset_module, "read_data_file", no_read)
+    dataset_cache.clear()
+    reopened = load_dataset(str(tmp_path / "dados"), find_data_files)
+    assert reopened.rows('itens') == stored.rows('itens')
+    reopened.close()
+
+
+def test_close_closes_connections_of_every_thread(stored):
+    store = stored.store
+    connections = []
+    worker = threading.Thread(target=lambda: connections.append(store._connection()))
+    worker.start()
+    worker.join()
+    connections.append(store._connection())
+    store.close()
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    # Depois de fechado, o banco é reaberto na próxima consulta
+    assert store.count('cabecalho') == stored.rows('cabecalho')
+    assert store.scalar("SELECT COUNT(*) FROM itens") == stored.rows('itens')
+
+
+def test_approx_sketches_are_built_from_store_chunks(dataset, stored, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_module, "APPROX_MODE", True)
+    monkeypatch.setattr(sketches, "APPROX_MODE", True)
+    monkeypatch.setattr(sketches, "STORE_CHUNK_ROWS", 100)
+    dataset_cache.clear()
+    reopened = load_dataset(str(tmp_path / "dados"), find_data_files)
+    item_sketches = reopened.derived('item_sketches', sketches.approx_sketches)
+    assert item_sketches.rows == len(dataset.itens_df)
+    assert reopened._frames is None
+    reopened.close()
@@ -0,0 +1,52 @@
+import re
+
+from agent_core import agent as agent_module
+from agent_core.agent import build_tools
+from agent_core.tool_output import ResultPager
+
+
+def _report(lines: int) -> str:
+    return "Relatório:\n\n" + "".join(f"- linha {i:05d}\n" for i in range(lines))
+
+
+def _cursor(text: str) -> str:
+    return re.search(r"'(\w{8}):2'", text).group(1)
+
+
+def test_short_output_is_not_paged():
+    pager = ResultPager(token_budget=100)
+    assert pager.shape('t', "curto") == "curto"
+    assert pager.total_chars == 0
+
+
+def test_pages_are_read_by_cursor():
+    pager = ResultPager(token_budget=50)
+    shaped = pager.shape('t', _report(100))
+    assert "Página 1 de" in shaped
+    cursor = _cursor(shaped)
+    assert pager.read(f"{cursor}:2").startswith("Página 2 de")
+    assert "não encontrado" in pager.read("inexiste:2")
+
+
+def test_oldest_cursors_are_dropped_beyond_max_chars():
+    text = _report(100)
+    pager = ResultPager(token_budget=50, max_chars=len(text) * 2)
+    cursors = [_cursor(pager.shape('t', text)) for _ in range(3)]
+    assert pager.total_chars <= pager.max_chars
+    assert "não encontrado" in pager.read(f"{cursors[0]}:2")
+    assert pager.read(f"{cursors[2]}:2").startswith("Página 2 de")
+
+
+def test_output_larger_than_max_chars_keeps_first_pages():
+    pager = ResultPager(token_budget=50, max_chars=1000)
+    shaped = pager.shape('t', _report(1000))
+    assert "Apenas as" in shaped
+    assert pager.total_chars <= 1000
+    assert "inexistente" in pager.read(f"{_cursor(shaped)}:100")
+
+
+def test_agent_tools_cap_report_rows(dataset, monkeypatch):
+    monkeypatch.setattr(agent_module, 'TOOL_MAX_ROWS', 3)
+    tools = {tool.name: tool for tool in build_tools(dataset)}
+    report = tools['listar_descricoes_ncm'].func('')
+    assert "registros omitidos (exibindo 3 de" in report